@@ -0,0 +1,178 @@
+import argparse
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import uvicorn
+from fastapi import FastAPI, File, HTTPException, Query, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import iterate_in_threadpool
+from source.cola_utils import ColaTrabajos, ColaLlena, ColaDetenida
+from source.config_loader import get_openai_client, get_textract_client
+from source.ocr_utils import extraer_ocr_textract, generar_json_desde_correo
+from source.rag_utils import obtener_servicio_rag, responder_desde_json, responder_desde_json_stream
+from source.trazas_utils import METRICAS
+
+logger = logging.getLogger(__name__)
+
+# Una sola cola por proceso: uvicorn debe ejecutarse con un solo worker para que los trabajos
+# y sus estados sean visibles en todas las solicitudes
+cola = ColaTrabajos.desde_config()
+
+
+class TextoOCR(BaseModel):
+    texto: str
+    baja_confianza: Optional[List[str]] = None
+
+
+class SolicitudRespuesta(BaseModel):
+    json_correo: dict
+    model: str = "gpt-3.5-turbo"
+    k: Optional[int] = None
+
+
+def calentar_servicios():
+    """Inicializa los clientes, el modelo de embeddings y la colección antes de aceptar solicitudes."""
+    get_textract_client()
+    get_openai_client()
+    servicio = obtener_servicio_rag()
+    servicio.embedding_fn(["calentamiento"])
+    try:
+        servicio.coleccion
+        servicio.indice_bm25
+        servicio.catalogo
+        if servicio.parametros_rag["rerank"]:
+            servicio.reranker
+    except Exception as e:
+        logger.warning("No se pudo abrir la colección de ChromaDB: %s", e)
+
+
+def procesar_solicitud(contenido):
+    """OCR y generación del JSON de una solicitud; devuelve {"ocr", "json_correo"}."""
+    ocr = extraer_ocr_textract(contenido)
+    json_correo = generar_json_desde_correo(ocr["texto"], baja_confianza=ocr["baja_confianza"])
+    return {"ocr": ocr, "json_correo": json_correo}
+
+
+def responder(json_correo, model, k):
+    """Respuesta normativa de una solicitud; devuelve {"respuesta", "metricas"}."""
+    metricas = {}
+    respuesta = responder_desde_json(json_correo, model=model, k=k, metricas=metricas)
+    return {"respuesta": respuesta, "metricas": metricas}
+
+
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    cola.iniciar()
+    await asyncio.to_thread(calentar_servicios)
+    yield
+    await asyncio.to_thread(cola.detener, 30)
+
+
+app = FastAPI(title="Procesador de Solicitudes", lifespan=ciclo_de_vida)
+
+
+@app.exception_handler(ColaLlena)
+async def cola_llena(request, exc):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(ColaDetenida)
+async def cola_detenida(request, exc):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
+
+def aceptado(trabajo):
+    """Respuesta 202 con el estado inicial del trabajo y la ruta para consultarlo."""
+    return JSONResponse(status_code=202, content=trabajo.como_dict(),
+                        headers={"Location": f"/trabajos/{trabajo.id}"})
+
+
+@app.post("/ocr", status_code=202)
+async def ocr(archivo: UploadFile = File(...)):
+    """Encola el OCR de una imagen o PDF; el resultado es el de `extraer_ocr_textract()`."""
+    return aceptado(cola.enviar("ocr", extraer_ocr_textract, await archivo.read()))
+
+
+@app.post("/json", status_code=202)
+async def json_correo(solicitud: TextoOCR):
+    """Encola la generación del JSON de un texto de OCR (`generar_json_desde_correo()`)."""
+    return aceptado(cola.enviar("json", generar_json_desde_correo, solicitud.texto,
+                                baja_confianza=solicitud.baja_confianza))
+
+
+@app.post("/solicitudes", status_code=202)
+async def solicitudes(archivo: UploadFile = File(...)):
+    """Encola el OCR y la generación del JSON de una solicitud."""
+    return aceptado(cola.enviar("solicitud", procesar_solicitud, await archivo.read()))
+
+
+@app.post("/respuestas", status_code=202)
+async def respuestas(solicitud: SolicitudRespuesta):
+    """Encola la respuesta normativa de un JSON de solicitud."""
+    return aceptado(cola.enviar("respuesta", responder, solicitud.json_correo, solicitud.model, solicitud.k))
+
+
+@app.post("/respuestas/stream")
+async def respuestas_stream(solicitud: SolicitudRespuesta):
+    """
+    Encola la respuesta normativa y la transmite en texto plano conforme se genera.
+
+    El ID del trabajo va en el encabezado X-Trabajo-Id, para consultar después su traza o su
+    error. Si el cliente se desconecta, el trabajo se cancela y deja de generar la respuesta.
+    """
+    trabajo = cola.enviar("respuesta", responder_desde_json_stream, solicitud.json_correo,
+                          model=solicitud.model, k=solicitud.k)
+
+    async def transmitir():
+        try:
+            async for fragmento in iterate_in_threadpool(trabajo.fragmentos()):
+                yield fragmento
+        finally:
+            trabajo.cancelar()
+
+    return StreamingResponse(transmitir(), media_type="text/plain; charset=utf-8",
+                             headers={"X-Trabajo-Id": trabajo.id})
+
+
+@app.get("/trabajos/{id_trabajo}")
+async def estado_trabajo(id_trabajo: str, espera: float = Query(0, ge=0, le=30)):
+    """
+    Estado de un trabajo. Con `espera` > 0 la respuesta se retrasa hasta que el trabajo termine
+    o pasen esos segundos, lo que reduce el número de consultas del cliente.
+    """
+    trabajo = cola.obtener(id_trabajo)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail=f"No existe el trabajo '{id_trabajo}'.")
+    if espera:
+        await asyncio.to_thread(trabajo.terminado.wait, espera)
+    return trabajo.como_dict()
+
+
+@app.get("/salud")
+async def salud():
+    """Estado de la cola; 503 si no está aceptando trabajos."""
+    estadisticas = cola.estadisticas()
+    return JSONResponse(status_code=200 if estadisticas["activa"] else 503, content=estadisticas)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metricas():
+    """Métricas por etapa en formato de texto de Prometheus."""
+    return METRICAS.formato_prometheus()
+
+
+@app.get("/metrics.json")
+async def metricas_json():
+    """Métricas por etapa en JSON."""
+    return METRICAS.instantanea()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servicio HTTP de OCR, generación de JSON y respuestas normativas.")
+    parser.add_argument("--host", default="127.0.0.1", help="Dirección donde escucha el servicio")
+    parser.add_argument("--puerto", type=int, default=8000, help="Puerto del servicio")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(app, host=args.host, port=args.puerto, workers=1)
@@ -1,11 +1,35 @@
 import streamlit as st
 import os
 import json
-from source.ocr_utils import (
-    extraer_texto_textract,
-    generar_json_desde_correo
-)
-from source.rag_utils import responder_desde_json 
+from source.cliente_utils import ClienteAPI
+
+# La app es un cliente del servicio de `api.py` (python api.py), que encola y procesa las
+# solicitudes de todos los usuarios con clientes y modelos ya cargados
+
+
+@st.cache_resource
+def obtener_cliente():
+    """Cliente HTTP del servicio, compartido entre las ejecuciones del script."""
+    return ClienteAPI.desde_config()
+
+
+def mostrar_tiempos(resumen, titulo):
+    """Panel con el tiempo, los tokens y el costo estimado de cada etapa de una traza."""
+    if resumen is None:
+        return
+    with st.expander(f"{titulo}: {resumen['segundos']:.2f} s · ${resumen['costo_usd']:.4f} USD"):
+        st.table([
+            {
+                "Etapa": etapa["etapa"],
+                "Dentro de": etapa["padre"] or "",
+                "Segundos": etapa["segundos"],
+                "Reintentos": etapa["reintentos"],
+                "Tokens entrada": etapa["tokens_entrada"],
+                "Tokens salida": etapa["tokens_salida"],
+                "Costo (USD)": etapa["costo_usd"],
+            }
+            for etapa in resumen["etapas"]
+        ])
 
 st.set_page_config(page_title="Procesador de Solicitudes", layout="centered")
 
@@ -19,13 +43,15 @@ if uploaded_file is not None:
 
     # 1. Leer contenido
     content = uploaded_file.read()
-    texto_ocr = extraer_texto_textract(content)
+    cliente = obtener_cliente()
 
-    # 2. Generar JSON
-    json_final = generar_json_desde_correo(texto_ocr)
+    # 2. OCR y JSON en el servicio (las palabras con baja confianza del OCR guían la corrección)
+    trabajo = cliente.procesar_solicitud(content, uploaded_file.name)
+    json_final = trabajo["resultado"]["json_correo"]
 
     # 3. Mostrar resultado
     st.success("Solicitud procesada correctamente")
+    mostrar_tiempos(trabajo["traza"], "Tiempos de OCR y JSON")
     st.subheader("JSON generado:")
     st.json(json_final)
 
@@ -49,11 +75,15 @@ if uploaded_file is not None:
 
     # 6.
     if st.button("Generar respuesta normativa con GPT"):
-        with st.spinner("Consultando normatividad y generando respuesta..."):
-            respuesta = responder_desde_json(json_final)
-
         st.subheader("Respuesta generada:")
-        st.write(respuesta)
+        # La respuesta se muestra conforme llega; write_stream devuelve el texto completo
+        metricas = {}
+        respuesta = st.write_stream(cliente.responder_stream(json_final, metricas=metricas))
+        if "generacion_segundos" in metricas:
+            st.caption(f"Primer token en {metricas.get('primer_token_segundos', 0):.2f} s · "
+                       f"generación en {metricas['generacion_segundos']:.2f} s")
+        if metricas.get("trabajo"):
+            mostrar_tiempos(cliente.trabajo(metricas["trabajo"], espera=5)["traza"], "Tiempos de la respuesta")
 
         # 7. Descargar respuesta como .txt
         nombre_txt = nombre_archivo.replace(".json", "_respuesta.txt")
@@ -1,4 +1,23 @@
+import argparse
 from source.chroma_utils import indexar_pdfs_en_chroma
 
 if __name__ == "__main__":
-    indexar_pdfs_en_chroma()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Indexa la normatividad compilada en ChromaDB.")
+    parser.add_argument("--batch-size", type=int, default=512, help="Fragmentos por llamada a Chroma")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos para extraer texto de los PDFs")
+    parser.add_argument("--reconstruir", action="store_true", help="Ignora el manifiesto y reindexa todo")
+    parser.add_argument("--max-tokens", type=int, default=160, help="Tamaño máximo de cada fragmento")
+    parser.add_argument("--min-tokens", type=int, default=40, help="Tamaño mínimo de cada fragmento")
+    parser.add_argument("--solapamiento", type=int, default=24, help="Tokens repetidos entre fragmentos")
+    parser.add_argument("--catalogo", default="metadata/catalogo_normatividad.json",
+                        help="Catálogo de títulos de donde se toma la circular de cada PDF")
+    args = parser.parse_args()
+    indexar_pdfs_en_chroma(
+        batch_size=args.batch_size,
+        num_procesos=args.procesos,
+        reconstruir=args.reconstruir,
+        max_tokens=args.max_tokens,
+        min_tokens=args.min_tokens,
+        solapamiento=args.solapamiento,
+        catalogo_path=args.catalogo,
+    )
@@ -0,0 +1,112 @@
+import argparse
+import random
+import re
+import time
+from source.anonimizacion_utils import MotorAnonimizacion, PII_PREDETERMINADA
+
+
+def limpiar_y_anonimizar_original(texto, origen=None, titulo=None):
+    """Implementación anterior de `limpiar_y_anonimizar()` (varias pasadas), como referencia."""
+    texto = re.sub(r"(?i)(atte:|saludos cordiales|gracias|juan p[ée]rez|mar[íi]a ram[íi]rez|jose gonz[aá]lez)", "", texto)
+    texto = re.sub(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+", "[correo]", texto)
+
+    if origen and titulo:
+        encabezado = f"[{origen}] {titulo}"
+        texto = texto.replace(encabezado, "")
+
+    texto = re.sub(r"(?i)^(responder|reenviar)$", "", texto, flags=re.MULTILINE)
+
+    patrones_ruido = [
+        r"<\[correo\]>",
+        r"(?i)para:",
+        r"(?i)este remitente.*no pertenece",
+        r"\bsáb\b|\blun\b|\bmar\b|\bmié\b|\bjue\b|\bvie\b|\bsab\b",
+        r"\d{2}/\d{2}/\d{4}",
+        r"\d{1,2}:\d{2} (AM|PM)",
+        r"(?i)bloquear remitente"
+    ]
+
+    lineas = texto.splitlines()
+    lineas_filtradas = []
+    for linea in lineas:
+        if len(linea.strip()) <= 2:
+            continue
+        if any(re.search(pat, linea) for pat in patrones_ruido):
+            continue
+        lineas_filtradas.append(linea)
+
+    texto_limpio = " ".join(lineas_filtradas)
+    texto_limpio = re.sub(r"\s{2,}", " ", texto_limpio)
+    return texto_limpio.strip()
+
+
+LINEAS_EJEMPLO = [
+    "[TRANSPARENCIA] solicitud de montos",
+    "Para: transparencia@banxico.org.mx",
+    "Juan Pérez <juan.perez@correo.com>",
+    "Este remitente no pertenece a su organización",
+    "Bloquear remitente",
+    "Responder",
+    "Reenviar",
+    "lun 12/05/2025 10:31 AM",
+    "Buenas tardes, solicito la información de los montos de pago mínimo",
+    "aplicables a las tarjetas de crédito conforme a la Circular 34/2010.",
+    "Agradecería que la respuesta incluyera el fundamento legal correspondiente",
+    "y los periodos de vigencia de cada disposición.",
+    "Saludos cordiales",
+    "Atte: María Ramírez",
+    "ok",
+    "Gracias",
+]
+
+
+def texto_sintetico(paginas, lineas_por_pagina, semilla):
+    """Genera texto OCR de varias páginas con las líneas típicas de un correo."""
+    aleatorio = random.Random(semilla)
+    return "\n".join(aleatorio.choice(LINEAS_EJEMPLO) for _ in range(paginas * lineas_por_pagina))
+
+
+def medir(funcion, textos, repeticiones):
+    """Ejecuta `funcion` sobre cada texto `repeticiones` veces y devuelve (resultados, segundos)."""
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultados = [funcion(texto, "TRANSPARENCIA", "solicitud de montos") for texto in textos]
+    return resultados, time.perf_counter() - inicio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara líneas/s de la limpieza y anonimización de texto OCR.")
+    parser.add_argument("--archivo", default=None, help="Archivo de texto OCR (por defecto: texto sintético)")
+    parser.add_argument("--documentos", type=int, default=200, help="Documentos sintéticos")
+    parser.add_argument("--paginas", type=int, default=10, help="Páginas por documento sintético")
+    parser.add_argument("--lineas-por-pagina", type=int, default=50, help="Líneas por página sintética")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Repeticiones de la medición")
+    args = parser.parse_args()
+
+    if args.archivo:
+        with open(args.archivo, "r", encoding="utf-8") as f:
+            textos = [f.read()]
+    else:
+        textos = [texto_sintetico(args.paginas, args.lineas_por_pagina, i) for i in range(args.documentos)]
+    lineas = sum(len(t.splitlines()) for t in textos) * args.repeticiones
+
+    # Con las mismas reglas que la implementación anterior, el resultado debe ser idéntico
+    motor_equivalente = MotorAnonimizacion(
+        nombres=["Juan Pérez", "María Ramírez", "Jose González"],
+        patrones_pii={"correo": PII_PREDETERMINADA["correo"]},
+    )
+    implementaciones = {
+        "limpiar_y_anonimizar original (varias pasadas)": limpiar_y_anonimizar_original,
+        "MotorAnonimizacion (mismas reglas)": motor_equivalente.limpiar,
+        "MotorAnonimizacion (PII completa)": MotorAnonimizacion(nombres=["Juan Pérez", "María Ramírez", "José González"]).limpiar,
+    }
+
+    print(f"📄 {len(textos)} documentos, {lineas // args.repeticiones} líneas\n")
+    referencia = None
+    for nombre, funcion in implementaciones.items():
+        resultados, segundos = medir(funcion, textos, args.repeticiones)
+        if referencia is None:
+            referencia = resultados
+        iguales = sum(a == b for a, b in zip(resultados, referencia))
+        print(f"{nombre}: {segundos:.2f} s, {lineas / segundos:,.0f} líneas/s, "
+              f"{iguales}/{len(textos)} documentos idénticos a la referencia")
@@ -0,0 +1,81 @@
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from source.embedding_utils import ServicioEmbeddings
+
+PALABRAS = (
+    "circular banco méxico disposiciones tarjetas crédito pago mínimo comisiones instituciones "
+    "bancarias cuentas depósito transferencias plazo artículo fracción tasa interés anual "
+    "usuarios servicios financieros reporte información vigencia requisitos operaciones"
+).split()
+
+
+def textos_sinteticos(n, semilla=0):
+    """Genera `n` preguntas sintéticas de 8 a 30 palabras sobre la normatividad."""
+    aleatorio = random.Random(semilla)
+    return [" ".join(aleatorio.choices(PALABRAS, k=aleatorio.randint(8, 30))) for _ in range(n)]
+
+
+def medir_lotes(servicio, textos, tam_lote):
+    """Calcula los embeddings en lotes de `tam_lote` (como la indexación) y devuelve (vectores, segundos)."""
+    inicio = time.perf_counter()
+    vectores = []
+    for i in range(0, len(textos), tam_lote):
+        vectores.extend(servicio(textos[i:i + tam_lote]))
+    return vectores, time.perf_counter() - inicio
+
+
+def medir_consultas(servicio, textos, concurrencia):
+    """Envía un texto por llamada desde `concurrencia` hilos (como las consultas) y devuelve (latencias, segundos)."""
+    def consultar(texto):
+        inicio = time.perf_counter()
+        servicio([texto])
+        return time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+        latencias = list(executor.map(consultar, textos))
+    return np.array(latencias), time.perf_counter() - inicio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara embeddings/s y latencia de los backends de embeddings.")
+    parser.add_argument("--modelo", default="all-MiniLM-L6-v2", help="Modelo de sentence-transformers")
+    parser.add_argument("--archivo-onnx", default="onnx/model_qint8_avx512_vnni.onnx",
+                        help="Archivo ONNX cuantizado a int8 dentro del repositorio del modelo")
+    parser.add_argument("--textos", type=int, default=2000, help="Textos sintéticos")
+    parser.add_argument("--lote", type=int, default=64, help="Textos por llamada en la medición por lotes")
+    parser.add_argument("--concurrencia", type=int, default=8, help="Hilos en la medición de consultas")
+    args = parser.parse_args()
+
+    textos = textos_sinteticos(args.textos)
+    backends = {
+        "torch (fp32)": ServicioEmbeddings(args.modelo, backend="torch", max_cache=0),
+        f"onnx ({args.archivo_onnx})": ServicioEmbeddings(
+            args.modelo, backend="onnx", archivo_onnx=args.archivo_onnx, max_cache=0
+        ),
+    }
+
+    print(f"🧮 {len(textos)} textos, modelo {args.modelo}\n")
+    referencia = None
+    for nombre, servicio in backends.items():
+        servicio(textos[:8])  # carga el modelo fuera de la medición
+        vectores, segundos = medir_lotes(servicio, textos, args.lote)
+        latencias, segundos_consultas = medir_consultas(servicio, textos, args.concurrencia)
+        estadisticas = servicio.estadisticas()
+
+        matriz = np.stack(vectores)
+        if referencia is None:
+            referencia = matriz
+        similitud = np.mean(
+            np.sum(matriz * referencia, axis=1)
+            / (np.linalg.norm(matriz, axis=1) * np.linalg.norm(referencia, axis=1))
+        )
+        print(f"{nombre}:")
+        print(f"  lotes de {args.lote}: {len(textos) / segundos:,.0f} embeddings/s")
+        print(f"  consultas con {args.concurrencia} hilos: {len(textos) / segundos_consultas:,.0f} embeddings/s, "
+              f"p50 {np.percentile(latencias, 50) * 1000:.1f} ms, p99 {np.percentile(latencias, 99) * 1000:.1f} ms, "
+              f"{estadisticas['lotes']} micro-lotes")
+        print(f"  similitud coseno media con la referencia: {similitud:.4f}")
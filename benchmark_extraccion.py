@@ -0,0 +1,43 @@
+import argparse
+import os
+import time
+import pymupdf
+from source.chroma_utils import extraer_con_tablas, extraer_con_tablas_rapido
+
+
+def medir(funcion, rutas):
+    """Ejecuta `funcion` sobre cada PDF y devuelve (textos, segundos)."""
+    inicio = time.perf_counter()
+    textos = [funcion(ruta) for ruta in rutas]
+    return textos, time.perf_counter() - inicio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara páginas/s de los extractores de PDF.")
+    parser.add_argument("--carpeta", default="normatividad_compilado", help="Carpeta con los PDFs")
+    parser.add_argument("--limite", type=int, default=None, help="Número máximo de PDFs a procesar")
+    args = parser.parse_args()
+
+    rutas = sorted(
+        os.path.join(args.carpeta, a) for a in os.listdir(args.carpeta) if a.lower().endswith(".pdf")
+    )[:args.limite]
+    paginas = 0
+    for ruta in rutas:
+        with pymupdf.open(ruta) as doc:
+            paginas += doc.page_count
+
+    extractores = {
+        "extraer_con_tablas (pdfplumber + pymupdf)": extraer_con_tablas,
+        "extraer_con_tablas_rapido (pymupdf)": extraer_con_tablas_rapido,
+        "extraer_con_tablas_rapido (pdfplumber)": lambda r: extraer_con_tablas_rapido(r, motor_tablas="pdfplumber"),
+    }
+
+    print(f"📚 {len(rutas)} PDFs, {paginas} páginas\n")
+    referencia = None
+    for nombre, funcion in extractores.items():
+        textos, segundos = medir(funcion, rutas)
+        if referencia is None:
+            referencia = textos
+        iguales = sum(a == b for a, b in zip(textos, referencia))
+        print(f"{nombre}: {segundos:.1f} s, {paginas / segundos:.1f} páginas/s, "
+              f"{iguales}/{len(rutas)} documentos idénticos a la referencia")
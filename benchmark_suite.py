@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pymupdf
+import yaml
+from source.simulacion_utils import servidor_textract, servidor_openai, grabaciones_desde_ejemplos
+
+SUJETOS = [
+    "las instituciones de crédito", "las casas de bolsa", "las sociedades financieras populares",
+    "las empresas emisoras de tarjetas", "los participantes del SPEI", "las cámaras de compensación",
+    "los agregadores de pagos", "las uniones de crédito",
+]
+OBJETOS = [
+    "las tarjetas de crédito", "las cuentas de depósito a la vista", "las transferencias de fondos",
+    "los créditos hipotecarios", "las terminales punto de venta", "las operaciones en moneda extranjera",
+    "los seguros asociados a créditos", "la domiciliación de pagos", "los cargos no reconocidos",
+    "las comisiones por disposición de efectivo",
+]
+ACCIONES = [
+    "deberán informar al Banco de México", "deberán entregar a sus clientes un estado de cuenta sobre",
+    "no podrán cobrar comisiones por", "deberán registrar en sus sistemas", "deberán atender las aclaraciones sobre",
+    "podrán suspender temporalmente", "deberán publicar en su página de internet las condiciones de",
+]
+CONDICIONES = [
+    "dentro de los diez días hábiles siguientes", "al cierre de cada mes", "antes de la contratación",
+    "en un plazo máximo de cuarenta y cinco días naturales", "cada vez que modifiquen sus tarifas",
+    "cuando el cliente lo solicite por escrito",
+]
+
+
+def articulo(j, sujeto, objeto, accion, condicion):
+    """Texto de un artículo sintético."""
+    return (f"Artículo {j}.- {sujeto.capitalize()} {accion} {objeto} {condicion}. "
+            f"Para efectos de lo anterior, {sujeto} observarán lo dispuesto en las presentes disposiciones "
+            f"y conservarán la documentación correspondiente durante un plazo de cinco años.")
+
+
+def corpus_sintetico(carpeta, documentos, articulos_por_documento, articulos_por_pagina=4, n_consultas=200, semilla=0):
+    """
+    Genera un corpus de circulares sintéticas en PDF y un conjunto de consultas etiquetadas.
+
+    Cada artículo combina un sujeto, un objeto, una obligación y un plazo; cada consulta
+    pregunta por la obligación de un artículo y sus fuentes relevantes son los PDFs que tienen
+    un artículo con el mismo sujeto, objeto y plazo.
+
+    Returns
+    -------
+    tuple (catalogo:dict, consultas:list[dict])
+        Catálogo {archivo: título} y consultas {"consulta", "fuentes"}.
+    """
+    aleatorio = random.Random(semilla)
+    os.makedirs(carpeta, exist_ok=True)
+    catalogo, fuentes_por_tema, temas = {}, {}, []
+    for i in range(documentos):
+        archivo = f"circular_{i + 1:03d}.pdf"
+        anio = 2005 + i % 20
+        catalogo[archivo] = f"Circular {i + 1}/{anio} sobre {aleatorio.choice(OBJETOS)}"
+        textos = [f"CIRCULAR {i + 1}/{anio}\n\nDISPOSICIONES DE CARÁCTER GENERAL\n\nCAPÍTULO I\nDisposiciones generales"]
+        for j in range(1, articulos_por_documento + 1):
+            tema = (aleatorio.choice(SUJETOS), aleatorio.choice(OBJETOS), aleatorio.choice(CONDICIONES))
+            textos.append(articulo(j, tema[0], tema[1], aleatorio.choice(ACCIONES), tema[2]))
+            fuentes_por_tema.setdefault(tema, set()).add(archivo)
+            temas.append(tema)
+        with pymupdf.open() as doc:
+            for inicio in range(0, len(textos), articulos_por_pagina):
+                pagina = doc.new_page()
+                pagina.insert_textbox(pagina.rect + (50, 50, -50, -50), "\n\n".join(textos[inicio:inicio + articulos_por_pagina]),
+                                      fontsize=10)
+            doc.save(os.path.join(carpeta, archivo))
+
+    consultas = []
+    for sujeto, objeto, condicion in aleatorio.sample(temas, min(len(temas), n_consultas)):
+        consultas.append({
+            "consulta": f"¿Qué obligación tienen {sujeto} respecto de {objeto} {condicion}?",
+            "fuentes": sorted(fuentes_por_tema[(sujeto, objeto, condicion)]),
+        })
+    return catalogo, consultas
+
+
+def percentiles(latencias):
+    """p50 y p99 de una lista de latencias en segundos, en milisegundos."""
+    latencias = np.array(latencias)
+    return {"p50_ms": float(np.percentile(latencias, 50) * 1000), "p99_ms": float(np.percentile(latencias, 99) * 1000)}
+
+
+def medir_ingesta(carpeta_pdfs, app):
+    """Indexa el corpus desde cero y devuelve las estadísticas de `indexar_pdfs_en_chroma()`."""
+    from source.chroma_utils import indexar_pdfs_en_chroma
+
+    return indexar_pdfs_en_chroma(
+        carpeta_pdfs=carpeta_pdfs, path_chroma=app["chroma_path"], nombre_coleccion=app["collection_name"],
+        reconstruir=True, catalogo_path=app["catalogo_path"],
+    )
+
+
+def medir_recuperacion(consultas, k, hilos, tam_lote):
+    """
+    Mide consultas/s, latencia y recall@k de `consultar_contexto_rag()`, en serie y con `hilos`,
+    y de `consultar_contexto_rag_lote()` en lotes de `tam_lote` preguntas.
+    """
+    from source.rag_utils import consultar_contexto_rag, consultar_contexto_rag_lote
+
+    consultar_contexto_rag(consultas[0]["consulta"], k=k)  # carga el modelo y el índice fuera de la medición
+
+    def consultar(consulta):
+        inicio = time.perf_counter()
+        _, fuentes = consultar_contexto_rag(consulta["consulta"], k=k)
+        return time.perf_counter() - inicio, bool(fuentes & set(consulta["fuentes"]))
+
+    resultados = {}
+    for nombre, n_hilos in (("serie", 1), ("concurrente", hilos)):
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_hilos) as executor:
+            mediciones = list(executor.map(consultar, consultas))
+        segundos = time.perf_counter() - inicio
+        resultados[nombre] = {
+            "hilos": n_hilos,
+            "consultas": len(consultas),
+            "consultas_por_segundo": len(consultas) / segundos,
+            **percentiles([m[0] for m in mediciones]),
+        }
+    resultados[f"recall_at_{k}"] = sum(m[1] for m in mediciones) / len(mediciones)
+
+    inicio = time.perf_counter()
+    aciertos = 0
+    for i in range(0, len(consultas), tam_lote):
+        lote = consultas[i:i + tam_lote]
+        contextos = consultar_contexto_rag_lote([c["consulta"] for c in lote], k=k)
+        aciertos += sum(bool(fuentes & set(c["fuentes"])) for c, (_, fuentes) in zip(lote, contextos))
+    segundos = time.perf_counter() - inicio
+    resultados["lote"] = {
+        "tam_lote": tam_lote,
+        "consultas": len(consultas),
+        "consultas_por_segundo": len(consultas) / segundos,
+        f"recall_at_{k}": aciertos / len(consultas),
+    }
+    return resultados
+
+
+def medir_flujo(carpeta_documentos, carpeta_trabajo, copias, hilos):
+    """Mide el flujo completo (OCR → JSON → respuesta) con `procesar_lote()` y con el flujo asíncrono."""
+    from source.lote_utils import procesar_lote
+    from source.async_utils import procesar_documentos_async
+    from source.trazas_utils import METRICAS
+
+    carpeta = os.path.join(carpeta_trabajo, "documentos")
+    os.makedirs(carpeta, exist_ok=True)
+    ejemplos = sorted(a for a in os.listdir(carpeta_documentos) if a.lower().endswith((".png", ".jpg", ".jpeg", ".pdf")))
+    for n in range(copias):
+        for archivo in ejemplos:
+            nombre, extension = os.path.splitext(archivo)
+            shutil.copy(os.path.join(carpeta_documentos, archivo), os.path.join(carpeta, f"{nombre}_{n:03d}{extension}"))
+    documentos = sorted(os.path.join(carpeta, a) for a in os.listdir(carpeta))
+
+    resumen_lote = procesar_lote(carpeta, ruta_salida=os.path.join(carpeta_trabajo, "resultados.jsonl"),
+                                 max_concurrencia=hilos)
+    inicio = time.perf_counter()
+    resultados_async = asyncio.run(procesar_documentos_async(documentos))
+    segundos_async = time.perf_counter() - inicio
+
+    return {
+        "documentos": len(documentos),
+        "lote": {
+            "hilos": hilos,
+            "errores": resumen_lote["errores"],
+            "documentos_por_segundo": resumen_lote["procesados"] / resumen_lote["segundos"],
+            "etapas": resumen_lote["etapas"],
+        },
+        "asincrono": {
+            "errores": sum(isinstance(r, Exception) for r in resultados_async),
+            "documentos_por_segundo": len(documentos) / segundos_async,
+        },
+        "etapas": METRICAS.instantanea(),
+    }
+
+
+def version_repositorio():
+    """Commit actual del repositorio, o None si no está disponible."""
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(actual, anterior, ruta=""):
+    """Imprime la variación porcentual de cada valor numérico respecto de un resultado anterior."""
+    for clave, valor in actual.items():
+        nombre = f"{ruta}.{clave}" if ruta else clave
+        previo = anterior.get(clave) if isinstance(anterior, dict) else None
+        if isinstance(valor, dict):
+            comparar(valor, previo or {}, nombre)
+        elif isinstance(valor, (int, float)) and isinstance(previo, (int, float)) and previo:
+            print(f"  {nombre}: {previo:.4g} → {valor:.4g} ({(valor - previo) / previo:+.1%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark reproducible del flujo con Textract y OpenAI simulados.")
+    parser.add_argument("--documentos", type=int, default=50, help="PDFs del corpus sintético")
+    parser.add_argument("--articulos", type=int, default=40, help="Artículos por PDF")
+    parser.add_argument("--consultas", type=int, default=200, help="Consultas etiquetadas de la medición de recuperación")
+    parser.add_argument("--lote", type=int, default=256, help="Preguntas por llamada a consultar_contexto_rag_lote")
+    parser.add_argument("--k", type=int, default=5, help="Fragmentos recuperados por consulta")
+    parser.add_argument("--hilos", type=int, default=4, help="Hilos de las mediciones concurrentes")
+    parser.add_argument("--copias", type=int, default=5, help="Copias de cada ejemplo de ejemplos_ocr/ en el flujo completo")
+    parser.add_argument("--latencia-textract", type=float, default=0.3, help="Segundos por solicitud a Textract")
+    parser.add_argument("--latencia-openai", type=float, default=0.5, help="Segundos hasta el inicio de cada respuesta de OpenAI")
+    parser.add_argument("--latencia-token", type=float, default=0.01, help="Segundos entre fragmentos del streaming")
+    parser.add_argument("--modelo", default="all-MiniLM-L6-v2", help="Modelo de embeddings (debe estar descargado)")
+    parser.add_argument("--semilla", type=int, default=0, help="Semilla del corpus sintético")
+    parser.add_argument("--salida", default=None, help="JSON de resultados (por defecto: output/benchmarks/<fecha>.json)")
+    parser.add_argument("--comparar", default=None, help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args()
+
+    trabajo = tempfile.mkdtemp(prefix="finalai_benchmark_")
+    catalogo, consultas = corpus_sintetico(os.path.join(trabajo, "pdfs"), args.documentos, args.articulos,
+                                           n_consultas=args.consultas, semilla=args.semilla)
+    app = {
+        "chroma_path": os.path.join(trabajo, "chroma"),
+        "collection_name": "benchmark",
+        "catalogo_path": os.path.join(trabajo, "catalogo.json"),
+        "embedding_model": args.modelo,
+    }
+    with open(app["catalogo_path"], "w", encoding="utf-8") as f:
+        json.dump(catalogo, f, ensure_ascii=False)
+
+    with servidor_textract(grabaciones_desde_ejemplos(), latencia=args.latencia_textract) as textract, \
+            servidor_openai(latencia=args.latencia_openai, latencia_token=args.latencia_token) as openai_simulado:
+        # La configuración debe existir antes de importar los módulos del flujo (ver FINALAI_CONFIG)
+        config = {
+            "openai": {"api_key": "simulada", "base_url": openai_simulado.url + "/v1"},
+            "aws": {"access_key_id": "simulada", "secret_access_key": "simulada", "region": "us-east-1",
+                    "endpoint_url": textract.url},
+            "app": app,
+            "embeddings": {"max_cache": 0},
+            "cache": {"habilitada": False, "path": os.path.join(trabajo, "cache.sqlite")},
+            "cache_semantica": {"habilitada": False},
+            "trazas": {"log_json": False},
+        }
+        ruta_config = os.path.join(trabajo, "config.yaml")
+        with open(ruta_config, "w", encoding="utf-8") as f:
+            yaml.safe_dump(config, f, allow_unicode=True)
+        os.environ["FINALAI_CONFIG"] = ruta_config
+
+        print(f"📚 Ingesta de {args.documentos} PDFs sintéticos...")
+        ingesta = medir_ingesta(os.path.join(trabajo, "pdfs"), app)
+        print(f"🔎 Recuperación con {len(consultas)} consultas etiquetadas...")
+        recuperacion = medir_recuperacion(consultas, args.k, args.hilos, args.lote)
+        print("🧾 Flujo completo con servidores simulados...")
+        flujo = medir_flujo("ejemplos_ocr", trabajo, args.copias, args.hilos)
+        flujo["solicitudes_textract"] = textract.solicitudes
+        flujo["solicitudes_openai"] = openai_simulado.solicitudes
+
+    resultados = {
+        "version": version_repositorio(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": vars(args),
+        "ingesta": ingesta,
+        "recuperacion": recuperacion,
+        "flujo": flujo,
+    }
+    salida = args.salida or os.path.join("output", "benchmarks", time.strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(salida) or ".", exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, indent=2, ensure_ascii=False)
+    shutil.rmtree(trabajo, ignore_errors=True)
+
+    print(f"\n📈 Ingesta: {ingesta['docs_por_segundo']:.2f} docs/s, {ingesta['fragmentos_por_segundo']:.1f} fragmentos/s")
+    print(f"📈 Recuperación: {recuperacion['serie']['consultas_por_segundo']:.1f} consultas/s en serie, "
+          f"{recuperacion['concurrente']['consultas_por_segundo']:.1f} con {args.hilos} hilos, "
+          f"{recuperacion['lote']['consultas_por_segundo']:.1f} en lotes de {args.lote}, "
+          f"recall@{args.k} {recuperacion[f'recall_at_{args.k}']:.3f}")
+    print(f"📈 Flujo completo: {flujo['lote']['documentos_por_segundo']:.2f} docs/s por lotes, "
+          f"{flujo['asincrono']['documentos_por_segundo']:.2f} docs/s asíncrono")
+    print(f"💾 Resultados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            anterior = json.load(f)
+        print(f"\nComparación con {args.comparar} ({anterior.get('version')}):")
+        comparar({k: resultados[k] for k in ("ingesta", "recuperacion", "flujo")}, anterior)
@@ -1,5 +1,11 @@
-from source.web_utils import descargar_normatividad_compilada
+import argparse
+from source.web_utils import descargar_normatividad_compilada, URL_INDICE
 
 if __name__ == "__main__":
-    archivos_conservados = descargar_normatividad_compilada()
-    print(f"\nTotal de documentos conservados: {len(archivos_conservados)}")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Descarga la normatividad compilada de Banco de México.")
+    parser.add_argument("--url-indice", default=URL_INDICE, help="Página con la normativa agrupada por sujeto")
+    parser.add_argument("--hilos", type=int, default=8, help="Descargas simultáneas")
+    parser.add_argument("--timeout", type=float, default=30, help="Tiempo límite por solicitud, en segundos")
+    args = parser.parse_args()
+    archivos_conservados = descargar_normatividad_compilada(url_indice=args.url_indice, max_workers=args.hilos, timeout=args.timeout)
+    print(f"\nTotal de documentos conservados: {len(archivos_conservados)}")
@@ -0,0 +1,11 @@
+import argparse
+from source.lote_utils import procesar_lote
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Procesa por lotes una carpeta de imágenes/PDFs o un archivo JSONL de solicitudes.")
+    parser.add_argument("entrada", help="Carpeta con imágenes/PDFs (p. ej. ejemplos_ocr/) o archivo JSONL")
+    parser.add_argument("--salida", default=None, help="JSONL de resultados (por defecto: output/<entrada>_resultados.jsonl)")
+    parser.add_argument("--concurrencia", type=int, default=4, help="Elementos procesados al mismo tiempo")
+    parser.add_argument("--sin-respuesta", action="store_true", help="Solo OCR y JSON, sin generar la respuesta normativa")
+    args = parser.parse_args()
+    procesar_lote(args.entrada, ruta_salida=args.salida, max_concurrencia=args.concurrencia, responder=not args.sin_respuesta)
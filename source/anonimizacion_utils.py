@@ -0,0 +1,225 @@
+"""
+Descripción
+===========
+
+Este módulo limpia y anonimiza el texto OCR de las solicitudes en una sola pasada.
+
+Todas las sustituciones (frases de cortesía, nombres y datos personales como correos, CURP,
+RFC, cuentas, tarjetas y teléfonos) se combinan en una sola expresión regular compilada con
+grupos nombrados, de modo que el texto se recorre una vez en lugar de una vez por patrón. Los
+patrones de ruido de las interfaces de correo (fechas, horas, "Para:", "Bloquear remitente",
+etc.) se combinan en otra expresión que se evalúa una vez por línea.
+
+El diccionario de datos personales es configurable y extensible desde la sección
+`anonimizacion` de config.yaml (nombres y patrones adicionales).
+
+Funciones
+===========
+
+"""
+
+import re
+import threading
+from source.config_loader import get_anonimizacion_config
+
+# Frases de cortesía que se eliminan del mensaje
+FRASES_ELIMINADAS = ["atte:", "saludos cordiales", "gracias"]
+
+# Datos personales: etiqueta → expresión regular. Cada coincidencia se reemplaza por "[etiqueta]".
+# El orden importa: ante dos patrones que inician en la misma posición gana el primero.
+PII_PREDETERMINADA = {
+    "correo": r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+",
+    "curp": r"\b[A-Z][AEIOUX][A-Z]{2}\d{6}[HM][A-Z]{5}[A-Z0-9]\d\b",
+    "rfc": r"\b[A-ZÑ&]{3,4}\d{6}[A-Z0-9]{3}\b",
+    "cuenta": r"\b\d{18}\b",
+    "tarjeta": r"\b(?:\d{4}[ -]?){3}\d{4}\b",
+    # Diez dígitos seguidos solo cuentan como teléfono junto a "tel"/"cel"; sin eso pueden ser
+    # montos o folios, así que se exige el prefijo +52, una lada entre paréntesis o un separador
+    "telefono": (
+        r"(?<![\d/])(?:"
+        r"\+52[ -]?\(?\d{2,3}\)?[ -]?\d{3,4}[ -]?\d{4}"
+        r"|\(\d{2,3}\)[ -]?\d{3,4}[ -]?\d{4}"
+        r"|\d{2,3}[ -]\d{3,4}[ -]?\d{4}"
+        r"|\d{2,3}[ -]?\d{3,4}[ -]\d{4}"
+        r"|(?i:\b(?:tel[eé]fono|tel|cel(?:ular)?|m[oó]vil|whatsapp)\b\.?:?\s*)\d{10}"
+        r")(?![\d/])"
+    ),
+}
+
+# Líneas de ruido de las interfaces de correo; las que coinciden se descartan completas
+PATRONES_RUIDO = [
+    r"(?i:^(?:responder|reenviar)$)",
+    r"<\[correo\]>",
+    r"(?i:para:)",
+    r"(?i:este remitente.*no pertenece)",
+    r"\bsáb\b|\blun\b|\bmar\b|\bmié\b|\bjue\b|\bvie\b|\bsab\b",
+    r"\d{2}/\d{2}/\d{4}",
+    r"\d{1,2}:\d{2} (?:AM|PM)",
+    r"(?i:bloquear remitente)",
+]
+
+ESPACIOS = re.compile(r"\s{2,}")
+
+# Variantes con y sin acento de cada vocal, para que "maria ramirez" encuentre "María Ramírez"
+_VOCALES = {"a": "[aáà]", "e": "[eéè]", "i": "[iíì]", "o": "[oóò]", "u": "[uúüù]"}
+_SIN_ACENTO = str.maketrans("áàéèíìóòúüù", "aaeeiioouuu")
+
+
+def patron_nombre(nombre):
+    """
+    Construye una expresión regular que encuentra un nombre con o sin acentos.
+
+    Parameters
+    ----------
+    nombre : str
+        Nombre a buscar (por ejemplo, "Juan Pérez").
+
+    Returns
+    -------
+    str
+        Expresión regular, pensada para usarse sin distinguir mayúsculas.
+    """
+    partes = []
+    for caracter in nombre.lower().translate(_SIN_ACENTO):
+        partes.append(_VOCALES.get(caracter) or (r"\s+" if caracter.isspace() else re.escape(caracter)))
+    return "".join(partes)
+
+
+class MotorAnonimizacion:
+    """
+    Limpia y anonimiza texto OCR con expresiones regulares compiladas una sola vez.
+
+    Parameters
+    ----------
+    nombres : list[str], optional
+        Nombres de personas que se eliminan del texto (sin distinguir mayúsculas ni acentos).
+    patrones_pii : dict[str, str], optional
+        Datos personales {etiqueta: expresión regular} que se reemplazan por "[etiqueta]"
+        (por defecto: `PII_PREDETERMINADA`).
+    frases : list[str], optional
+        Frases que se eliminan sin distinguir mayúsculas (por defecto: `FRASES_ELIMINADAS`).
+    patrones_ruido : list[str], optional
+        Expresiones cuyas líneas se descartan (por defecto: `PATRONES_RUIDO`).
+    """
+
+    def __init__(self, nombres=(), patrones_pii=None, frases=None, patrones_ruido=None):
+        patrones_pii = PII_PREDETERMINADA if patrones_pii is None else patrones_pii
+        frases = FRASES_ELIMINADAS if frases is None else frases
+        patrones_ruido = PATRONES_RUIDO if patrones_ruido is None else patrones_ruido
+
+        eliminar = [re.escape(f) for f in frases] + [patron_nombre(n) for n in nombres]
+        alternativas = []
+        self._reemplazos = {}
+        if eliminar:
+            alternativas.append(f"(?P<_eliminar>(?i:{'|'.join(eliminar)}))")
+            self._reemplazos["_eliminar"] = ""
+        for n, (etiqueta, patron) in enumerate(patrones_pii.items()):
+            alternativas.append(f"(?P<_pii{n}>{patron})")
+            self._reemplazos[f"_pii{n}"] = f"[{etiqueta}]"
+        self._sustituciones = re.compile("|".join(alternativas)) if alternativas else None
+        self._ruido = re.compile("|".join(f"(?:{p})" for p in patrones_ruido)) if patrones_ruido else None
+
+    @classmethod
+    def desde_config(cls):
+        """
+        Construye el motor con la sección `anonimizacion` de config.yaml.
+
+        Los patrones de `patrones_pii` del archivo se agregan a `PII_PREDETERMINADA` (o la
+        reemplazan si tienen la misma etiqueta).
+
+        Returns
+        -------
+        MotorAnonimizacion
+            Motor configurado.
+        """
+        config = get_anonimizacion_config()
+        return cls(
+            nombres=config["nombres"],
+            patrones_pii={**PII_PREDETERMINADA, **config["patrones_pii"]},
+        )
+
+    def _reemplazar(self, match):
+        return self._reemplazos[match.lastgroup]
+
+    def anonimizar(self, texto):
+        """
+        Elimina frases y nombres, y reemplaza datos personales por su etiqueta.
+
+        Parameters
+        ----------
+        texto : str
+            Texto a anonimizar.
+
+        Returns
+        -------
+        str
+            Texto anonimizado, con los saltos de línea originales.
+        """
+        if self._sustituciones is None:
+            return texto
+        return self._sustituciones.sub(self._reemplazar, texto)
+
+    def filtrar_lineas(self, texto):
+        """
+        Descarta las líneas de ruido y las de a lo más dos caracteres, y une el resto.
+
+        Parameters
+        ----------
+        texto : str
+            Texto anonimizado.
+
+        Returns
+        -------
+        str
+            Líneas restantes unidas por espacios, sin espacios repetidos.
+        """
+        ruido = self._ruido
+        lineas = [
+            linea for linea in texto.splitlines()
+            if len(linea.strip()) > 2 and (ruido is None or not ruido.search(linea))
+        ]
+        return ESPACIOS.sub(" ", " ".join(lineas)).strip()
+
+    def limpiar(self, texto, origen=None, titulo=None):
+        """
+        Anonimiza el texto, quita el encabezado "[origen] titulo" y filtra el ruido.
+
+        Parameters
+        ----------
+        texto : str
+            Texto plano extraído por OCR.
+        origen : str, optional
+            Origen del mensaje extraído del encabezado.
+        titulo : str, optional
+            Título del mensaje extraído del encabezado.
+
+        Returns
+        -------
+        str
+            Texto limpio y anonimizado.
+        """
+        texto = self.anonimizar(texto)
+        if origen and titulo:
+            texto = texto.replace(f"[{origen}] {titulo}", "")
+        return self.filtrar_lineas(texto)
+
+
+_motor = None
+_lock = threading.Lock()
+
+
+def obtener_motor_anonimizacion():
+    """
+    Devuelve el motor de anonimización del proceso, construido con config.yaml en el primer uso.
+
+    Returns
+    -------
+    MotorAnonimizacion
+        Motor compartido.
+    """
+    global _motor
+    if _motor is None:
+        with _lock:
+            if _motor is None:
+                _motor = MotorAnonimizacion.desde_config()
+    return _motor
@@ -0,0 +1,453 @@
+"""
+Descripción
+===========
+
+Este módulo ofrece una versión asíncrona del flujo completo (OCR → corrección → recuperación →
+generación) para procesar muchas solicitudes al mismo tiempo.
+
+Cada etapa tiene su propio límite de solicitudes simultáneas (semáforo) y de solicitudes por
+segundo (cubeta de fichas), configurables en la sección `concurrencia` de config.yaml, de modo
+que muchas solicitudes pueden estar en curso sin exceder las cuotas de AWS y OpenAI. Los errores
+de limitación de tasa (throttling) de OpenAI se reintentan con espera exponencial y jitter; los de
+Textract los reintenta boto3 por página (modo adaptativo, ver `get_textract_client()`), de modo
+que un throttling no repite el OCR de todo el documento.
+
+Las llamadas a OpenAI usan el cliente asíncrono; Textract (boto3) y ChromaDB no tienen API
+asíncrona, por lo que se ejecutan en hilos con `asyncio.to_thread`. Las cachés en disco de
+`ocr_utils` y la caché semántica de respuestas se respetan igual que en la versión síncrona;
+sus lecturas y escrituras en SQLite también se hacen en hilos para no bloquear el event loop.
+
+Funciones
+===========
+
+"""
+
+import random
+import asyncio
+import time
+import openai
+from botocore.exceptions import ClientError
+from source.config_loader import get_async_openai_client, cerrar_clientes_async, get_concurrencia_config
+from source.cache_utils import obtener_cache
+from source.ocr_utils import (
+    extraer_texto_textract,
+    extraer_ocr_textract,
+    extraer_origen_y_titulo,
+    limpiar_y_anonimizar,
+    mensajes_correccion,
+    partes_clave_json_correo,
+)
+from source.ortografia_utils import planear_correccion, aplicar_correcciones
+from source.rag_utils import consultar_contexto_rag, construir_prompt, preparar_respuesta, guardar_respuesta
+from source.trazas_utils import traza, instrumentar, registrar_tokens, registrar_reintentos
+
+# Códigos de error de AWS que indican que se excedió una cuota y vale la pena reintentar
+CODIGOS_THROTTLING_AWS = {
+    "ThrottlingException",
+    "ProvisionedThroughputExceededException",
+    "LimitExceededException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+}
+
+
+class LimiteEtapa:
+    """
+    Limita las solicitudes simultáneas y por segundo de una etapa del flujo.
+
+    Se usa como `async with limite: ...`. La tasa se controla con una cubeta de fichas
+    de capacidad `por_segundo` que se rellena de forma continua.
+
+    Parameters
+    ----------
+    max_concurrencia : int
+        Número máximo de solicitudes en curso al mismo tiempo.
+    por_segundo : float
+        Número máximo de solicitudes iniciadas por segundo (0 = sin límite).
+    """
+
+    def __init__(self, max_concurrencia, por_segundo=0):
+        self.max_concurrencia = max_concurrencia
+        self.por_segundo = por_segundo
+        self._semaforo = asyncio.Semaphore(max_concurrencia)
+        self._lock = asyncio.Lock()
+        self._fichas = float(por_segundo)
+        self._ultima_recarga = time.monotonic()
+
+    async def _esperar_ficha(self):
+        if not self.por_segundo:
+            return
+        async with self._lock:
+            while True:
+                ahora = time.monotonic()
+                self._fichas = min(self.por_segundo, self._fichas + (ahora - self._ultima_recarga) * self.por_segundo)
+                self._ultima_recarga = ahora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                await asyncio.sleep((1 - self._fichas) / self.por_segundo)
+
+    async def __aenter__(self):
+        await self._semaforo.acquire()
+        try:
+            await self._esperar_ficha()
+        except BaseException:
+            self._semaforo.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self._semaforo.release()
+        return False
+
+
+def crear_limites(config=None):
+    """
+    Crea un `LimiteEtapa` por cada etapa configurada.
+
+    Debe llamarse dentro del event loop donde se usarán los límites.
+
+    Parameters
+    ----------
+    config : dict, optional
+        {etapa: {"max_concurrencia", "por_segundo"}} (por defecto: `get_concurrencia_config()`).
+
+    Returns
+    -------
+    dict[str, LimiteEtapa]
+        Límites para las etapas `textract`, `ortografia`, `chroma` y `respuesta`.
+    """
+    config = config or get_concurrencia_config()
+    return {etapa: LimiteEtapa(v["max_concurrencia"], v["por_segundo"]) for etapa, v in config.items()}
+
+
+def es_error_de_limite(error):
+    """
+    Indica si un error se debe a una limitación de tasa o a una falla transitoria del proveedor.
+
+    Parameters
+    ----------
+    error : Exception
+        Error lanzado por boto3 u OpenAI.
+
+    Returns
+    -------
+    bool
+        True si conviene reintentar la llamada.
+    """
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError,
+                          openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in CODIGOS_THROTTLING_AWS
+    return False
+
+
+async def con_reintentos(limite, funcion, *args, intentos=5, espera_base=0.5, espera_maxima=20.0):
+    """
+    Ejecuta `await funcion(*args)` respetando `limite` y reintentando si hay throttling.
+
+    Entre reintentos se espera un tiempo aleatorio entre 0 y `espera_base * 2**intento`
+    (jitter completo), acotado por `espera_maxima`. La espera ocurre fuera del límite,
+    para no ocupar un lugar del semáforo mientras tanto.
+
+    Parameters
+    ----------
+    limite : LimiteEtapa
+        Límite de la etapa.
+    funcion : callable
+        Corrutina a ejecutar.
+    *args
+        Argumentos de `funcion`.
+    intentos : int
+        Número máximo de intentos.
+    espera_base : float
+        Espera base en segundos.
+    espera_maxima : float
+        Espera máxima entre intentos, en segundos.
+
+    Returns
+    -------
+    object
+        Resultado de `funcion`.
+    """
+    for intento in range(intentos):
+        try:
+            async with limite:
+                return await funcion(*args)
+        except Exception as e:
+            if intento == intentos - 1 or not es_error_de_limite(e):
+                raise
+            registrar_reintentos()
+            await asyncio.sleep(random.uniform(0, min(espera_maxima, espera_base * 2 ** intento)))
+
+
+async def extraer_texto_textract_async(documento, limites):
+    """
+    Versión asíncrona de `extraer_texto_textract()`.
+
+    Parameters
+    ----------
+    documento : str or bytes
+        Ruta al archivo o contenido binario.
+    limites : dict[str, LimiteEtapa]
+        Límites creados con `crear_limites()`.
+
+    Returns
+    -------
+    str
+        Texto extraído por Textract.
+    """
+    async with limites["textract"]:
+        return await asyncio.to_thread(extraer_texto_textract, documento)
+
+
+async def extraer_ocr_textract_async(documento, limites):
+    """
+    Versión asíncrona de `extraer_ocr_textract()`.
+
+    Parameters
+    ----------
+    documento : str or bytes
+        Ruta al archivo o contenido binario.
+    limites : dict[str, LimiteEtapa]
+        Límites creados con `crear_limites()`.
+
+    Returns
+    -------
+    dict
+        Diccionario con "texto" y "baja_confianza".
+    """
+    async with limites["textract"]:
+        return await asyncio.to_thread(extraer_ocr_textract, documento)
+
+
+@instrumentar("ortografia")
+async def corregir_ortografia_async(texto, limites, model="gpt-4", baja_confianza=None):
+    """
+    Versión asíncrona de `corregir_ortografia()`, con el cliente asíncrono de OpenAI.
+
+    Parameters
+    ----------
+    texto : str
+        Texto limpio y anonimizado a corregir.
+    limites : dict[str, LimiteEtapa]
+        Límites creados con `crear_limites()`.
+    model : str
+        Modelo de OpenAI (por defecto: "gpt-4").
+    baja_confianza : iterable[str], optional
+        Palabras que Textract reconoció con baja confianza.
+
+    Returns
+    -------
+    str
+        Texto corregido en redacción y ortografía.
+    """
+    oraciones, indices = planear_correccion(texto, baja_confianza)
+    if not indices:
+        return texto
+    fragmentos = [oraciones[i] for i in indices]
+
+    cache = obtener_cache()
+    clave = cache.clave("ortografia", model, *fragmentos)
+    respuesta = await asyncio.to_thread(cache.obtener, "ortografia", clave)
+    if respuesta is None:
+        async def llamar():
+            response = await get_async_openai_client().chat.completions.create(
+                model=model,
+                messages=mensajes_correccion(fragmentos),
+                temperature=0
+            )
+            if response.usage is not None:
+                registrar_tokens(model, response.usage.prompt_tokens, response.usage.completion_tokens)
+            return response.choices[0].message.content.strip()
+
+        respuesta = await con_reintentos(limites["ortografia"], llamar)
+        await asyncio.to_thread(cache.guardar, "ortografia", clave, respuesta)
+    return aplicar_correcciones(oraciones, indices, respuesta)[0]
+
+
+@instrumentar("json_correo")
+async def generar_json_desde_correo_async(texto_ocr, limites, model="gpt-4", baja_confianza=None):
+    """
+    Versión asíncrona de `generar_json_desde_correo()`.
+
+    Parameters
+    ----------
+    texto_ocr : str
+        Texto crudo extraído por OCR.
+    limites : dict[str, LimiteEtapa]
+        Límites creados con `crear_limites()`.
+    model : str
+        Modelo de OpenAI para la corrección ortográfica (por defecto: "gpt-4").
+    baja_confianza : iterable[str], optional
+        Palabras que Textract reconoció con baja confianza.
+
+    Returns
+    -------
+    dict
+        Diccionario con las claves "origen", "titulo" y "mensaje".
+    """
+    cache = obtener_cache()
+    clave = cache.clave("json_correo", *partes_clave_json_correo(texto_ocr, model, baja_confianza))
+    json_correo = await asyncio.to_thread(cache.obtener, "json_correo", clave)
+    if json_correo is not None:
+        return json_correo
+
+    origen, titulo = extraer_origen_y_titulo(texto_ocr)
+    cuerpo_limpio = limpiar_y_anonimizar(texto_ocr, origen, titulo)
+    json_correo = {
+        "origen": origen,
+        "titulo": titulo,
+        "mensaje": await corregir_ortografia_async(cuerpo_limpio, limites, model=model, baja_confianza=baja_confianza)
+    }
+    await asyncio.to_thread(cache.guardar, "json_correo", clave, json_correo)
+    return json_correo
+
+
+async def consultar_contexto_rag_async(mensaje_usuario, limites, k=None):
+    """
+    Versión asíncrona de `consultar_contexto_rag()`.
+
+    Parameters
+    ----------
+    mensaje_usuario : str
+        Pregunta del usuario corregida y limpia.
+    limites : dict[str, LimiteEtapa]
+        Límites creados con `crear_limites()`.
+    k : int, optional
+        Número de fragmentos a recuperar (por defecto: `k` de la sección `rag` de config.yaml).
+
+    Returns
+    -------
+    tuple (contexto:str, fuentes:set)
+        Texto combinado de fragmentos relevantes y conjunto de nombres de normativas.
+    """
+    return await con_reintentos(limites["chroma"], asyncio.to_thread, consultar_contexto_rag, mensaje_usuario, k)
+
+
+@instrumentar("generacion")
+async def generar_respuesta_con_contexto_async(mensaje_usuario, contexto, fuentes, limites, model="gpt-3.5-turbo"):
+    """
+    Versión asíncrona de `generar_respuesta_con_contexto()`, con el cliente asíncrono de OpenAI.
+
+    Parameters
+    ----------
+    mensaje_usuario : str
+        Solicitud del usuario (ya corregida).
+    contexto : str
+        Texto combinado de fragmentos normativos.
+    fuentes : set
+        Conjunto de nombres de normativas (archivo fuente).
+    limites : dict[str, LimiteEtapa]
+        Límites creados con `crear_limites()`.
+    model : str
+        Modelo de lenguaje a utilizar (por defecto: gpt-3.5-turbo).
+
+    Returns
+    -------
+    str
+        Respuesta generada por el modelo en estilo institucional.
+    """
+    prompt = construir_prompt(mensaje_usuario, contexto, fuentes)
+
+    async def llamar():
+        response = await get_async_openai_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.3,
+            max_tokens=1024
+        )
+        if response.usage is not None:
+            registrar_tokens(model, response.usage.prompt_tokens, response.usage.completion_tokens)
+        return response.choices[0].message.content.strip()
+
+    return await con_reintentos(limites["respuesta"], llamar)
+
+
+@instrumentar("respuesta")
+async def responder_desde_json_async(json_correo, limites, model="gpt-3.5-turbo", k=None):
+    """
+    Versión asíncrona de `responder_desde_json()`.
+
+    La caché semántica, el filtro por circulares citadas en el título o el mensaje y la
+    recuperación son los de la versión síncrona (`preparar_respuesta()`) y se ejecutan en un
+    hilo; solo la generación usa el cliente asíncrono de OpenAI.
+
+    Parameters
+    ----------
+    json_correo : dict
+        Diccionario con las claves: 'origen', 'titulo', 'mensaje'
+    limites : dict[str, LimiteEtapa]
+        Límites creados con `crear_limites()`.
+    model : str
+        Modelo de lenguaje a utilizar (por defecto: gpt-3.5-turbo).
+    k : int, optional
+        Número de fragmentos a recuperar (por defecto: `k` de la sección `rag` de config.yaml).
+
+    Returns
+    -------
+    str
+        Respuesta normativa completa generada con ayuda de contexto.
+    """
+    solicitud = await con_reintentos(limites["chroma"], asyncio.to_thread, preparar_respuesta, json_correo, model, k, None)
+    if "respuesta" in solicitud:
+        return solicitud["respuesta"]
+    respuesta = await generar_respuesta_con_contexto_async(
+        solicitud["mensaje"], solicitud["contexto"], solicitud["fuentes"], limites, model=model
+    )
+    await asyncio.to_thread(guardar_respuesta, solicitud, respuesta)
+    return respuesta
+
+
+async def procesar_documento_async(documento, limites):
+    """
+    Ejecuta el flujo completo sobre un documento: OCR, JSON, recuperación y respuesta.
+
+    Cada documento abre su propia traza (ver `trazas_utils`); las etapas que se ejecutan en
+    hilos con `asyncio.to_thread` heredan el contexto y se registran en ella.
+
+    Parameters
+    ----------
+    documento : str or bytes
+        Ruta al archivo o contenido binario de la solicitud.
+    limites : dict[str, LimiteEtapa]
+        Límites creados con `crear_limites()`.
+
+    Returns
+    -------
+    dict
+        Diccionario con "json_correo" y "respuesta".
+    """
+    with traza("solicitud", documento=documento if isinstance(documento, str) else None):
+        ocr = await extraer_ocr_textract_async(documento, limites)
+        json_correo = await generar_json_desde_correo_async(ocr["texto"], limites, baja_confianza=ocr["baja_confianza"])
+        respuesta = await responder_desde_json_async(json_correo, limites)
+    return {"json_correo": json_correo, "respuesta": respuesta}
+
+
+async def procesar_documentos_async(documentos, config=None):
+    """
+    Procesa varios documentos a la vez, con los límites por etapa de `config`.
+
+    Parameters
+    ----------
+    documentos : list[str or bytes]
+        Rutas o contenidos binarios de las solicitudes.
+    config : dict, optional
+        Límites por etapa (por defecto: sección `concurrencia` de config.yaml).
+
+    Returns
+    -------
+    list[dict or Exception]
+        Un resultado por documento, en el mismo orden; si un documento falla, su lugar
+        contiene la excepción en lugar de interrumpir a los demás.
+    """
+    limites = crear_limites(config)
+    try:
+        return await asyncio.gather(
+            *(procesar_documento_async(documento, limites) for documento in documentos),
+            return_exceptions=True
+        )
+    finally:
+        await cerrar_clientes_async()
@@ -0,0 +1,251 @@
+"""
+Descripción
+===========
+
+Este módulo implementa un índice invertido BM25 en disco para la búsqueda léxica de fragmentos
+normativos, complementaria a la búsqueda vectorial de ChromaDB.
+
+El modelo de embeddings maneja mal identificadores como "Circular 34/2010" o números de
+artículo; el índice léxico los trata como términos exactos. El índice se construye junto a la
+colección de ChromaDB durante la indexación y se guarda como arreglos de NumPy en formato CSR
+(una lista de documentos y frecuencias por término), que se abren con `mmap` para que cargarlo
+sea casi instantáneo y solo se lean de disco las listas de los términos consultados.
+
+Funciones
+===========
+
+"""
+
+import os
+import re
+import json
+import shutil
+import unicodedata
+from collections import Counter
+import numpy as np
+
+# Palabras vacías frecuentes en las solicitudes y en la normatividad
+STOPWORDS = {
+    "a", "al", "ante", "con", "como", "cual", "cuales", "de", "del", "desde", "e", "el", "en", "entre",
+    "es", "esta", "este", "esto", "la", "las", "le", "les", "lo", "los", "mas", "me", "mi", "no", "o",
+    "para", "pero", "por", "que", "se", "si", "sin", "sobre", "su", "sus", "un", "una", "uno", "unos",
+    "y", "ya", "son", "ser", "sera", "han", "ha", "hay", "fue", "dicho", "dicha", "asi", "cada",
+}
+
+# Identificadores como "34/2010" se conservan como un solo término además de sus partes
+TOKEN = re.compile(r"\d+(?:/\d+)+|\w+")
+
+
+def tokenizar(texto):
+    """
+    Convierte un texto en términos para el índice léxico.
+
+    Pasa a minúsculas, elimina acentos y palabras vacías, y conserva identificadores con
+    diagonal ("34/2010") como un término, agregando también sus partes ("34", "2010").
+
+    Parameters
+    ----------
+    texto : str
+        Texto a tokenizar.
+
+    Returns
+    -------
+    list[str]
+        Términos en el orden en que aparecen.
+    """
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    terminos = []
+    for token in TOKEN.findall(texto):
+        if token in STOPWORDS:
+            continue
+        terminos.append(token)
+        if "/" in token:
+            terminos.extend(token.split("/"))
+    return terminos
+
+
+class IndiceBM25:
+    """
+    Índice invertido con puntuación BM25 almacenado en arreglos CSR.
+
+    Parameters
+    ----------
+    ids : list[str]
+        ID de cada documento (el mismo ID del fragmento en ChromaDB).
+    vocabulario : dict[str, int]
+        Término → posición de su lista en `indptr`.
+    indptr : numpy.ndarray
+        Inicio de la lista de cada término en `docs` y `tf` (longitud: términos + 1).
+    docs : numpy.ndarray
+        Índices de documento de todas las listas, concatenadas.
+    tf : numpy.ndarray
+        Frecuencia del término en cada documento de `docs`.
+    longitudes : numpy.ndarray
+        Número de términos de cada documento.
+    k1 : float
+        Parámetro de saturación de frecuencia de BM25.
+    b : float
+        Parámetro de normalización por longitud de BM25.
+    """
+
+    ARREGLOS = ("indptr", "docs", "tf", "longitudes")
+
+    def __init__(self, ids, vocabulario, indptr, docs, tf, longitudes, k1=1.5, b=0.75):
+        self.ids = ids
+        self.vocabulario = vocabulario
+        self.indptr = indptr
+        self.docs = docs
+        self.tf = tf
+        self.longitudes = longitudes
+        self.k1 = k1
+        self.b = b
+        self.longitud_promedio = float(np.mean(longitudes)) if len(longitudes) else 0.0
+
+    @classmethod
+    def construir(cls, ids, documentos, k1=1.5, b=0.75):
+        """
+        Construye el índice a partir del texto de los fragmentos.
+
+        Parameters
+        ----------
+        ids : list[str]
+            ID de cada fragmento.
+        documentos : list[str]
+            Texto de cada fragmento, en el mismo orden que `ids`.
+        k1 : float
+            Parámetro de saturación de frecuencia de BM25.
+        b : float
+            Parámetro de normalización por longitud de BM25.
+
+        Returns
+        -------
+        IndiceBM25
+            Índice en memoria, listo para `buscar()` o `guardar()`.
+        """
+        listas = {}
+        longitudes = np.zeros(len(documentos), dtype=np.int32)
+        for i, documento in enumerate(documentos):
+            conteo = Counter(tokenizar(documento))
+            longitudes[i] = sum(conteo.values())
+            for termino, frecuencia in conteo.items():
+                listas.setdefault(termino, []).append((i, frecuencia))
+
+        vocabulario = {termino: n for n, termino in enumerate(sorted(listas))}
+        indptr = np.zeros(len(vocabulario) + 1, dtype=np.int64)
+        for termino, n in vocabulario.items():
+            indptr[n + 1] = len(listas[termino])
+        np.cumsum(indptr, out=indptr)
+
+        docs = np.empty(indptr[-1], dtype=np.int32)
+        tf = np.empty(indptr[-1], dtype=np.float32)
+        for termino, n in vocabulario.items():
+            lista = np.asarray(listas[termino])
+            docs[indptr[n]:indptr[n + 1]] = lista[:, 0]
+            tf[indptr[n]:indptr[n + 1]] = lista[:, 1]
+        return cls(list(ids), vocabulario, indptr, docs, tf, longitudes, k1=k1, b=b)
+
+    def guardar(self, carpeta):
+        """
+        Guarda el índice en `carpeta`, reemplazando de forma atómica el índice anterior.
+
+        Parameters
+        ----------
+        carpeta : str
+            Carpeta del índice (por ejemplo, chroma_data/bm25_normatividad).
+
+        Returns
+        -------
+        None
+        """
+        temporal = carpeta + ".tmp"
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+        for nombre in self.ARREGLOS:
+            np.save(os.path.join(temporal, f"{nombre}.npy"), getattr(self, nombre))
+        with open(os.path.join(temporal, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "vocabulario": self.vocabulario, "k1": self.k1, "b": self.b}, f,
+                      ensure_ascii=False)
+        anterior = carpeta + ".old"
+        shutil.rmtree(anterior, ignore_errors=True)
+        if os.path.exists(carpeta):
+            os.rename(carpeta, anterior)
+        os.rename(temporal, carpeta)
+        shutil.rmtree(anterior, ignore_errors=True)
+
+    @classmethod
+    def cargar(cls, carpeta):
+        """
+        Abre un índice guardado, con los arreglos mapeados en memoria.
+
+        Parameters
+        ----------
+        carpeta : str
+            Carpeta del índice.
+
+        Returns
+        -------
+        IndiceBM25 or None
+            Índice cargado, o None si la carpeta no existe.
+        """
+        if not os.path.exists(os.path.join(carpeta, "meta.json")):
+            return None
+        with open(os.path.join(carpeta, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arreglos = {n: np.load(os.path.join(carpeta, f"{n}.npy"), mmap_mode="r") for n in cls.ARREGLOS}
+        return cls(meta["ids"], meta["vocabulario"], k1=meta["k1"], b=meta["b"], **arreglos)
+
+    def buscar(self, consulta, n=10):
+        """
+        Devuelve los `n` documentos con mayor puntuación BM25 para la consulta.
+
+        Parameters
+        ----------
+        consulta : str
+            Texto de la consulta.
+        n : int
+            Número máximo de resultados.
+
+        Returns
+        -------
+        list[tuple (id:str, puntuacion:float)]
+            Resultados ordenados de mayor a menor puntuación; solo documentos con al menos
+            un término de la consulta.
+        """
+        total = len(self.ids)
+        puntuaciones = np.zeros(total, dtype=np.float32)
+        for termino in set(tokenizar(consulta)):
+            posicion = self.vocabulario.get(termino)
+            if posicion is None:
+                continue
+            inicio, fin = self.indptr[posicion], self.indptr[posicion + 1]
+            docs = self.docs[inicio:fin]
+            tf = self.tf[inicio:fin]
+            idf = np.log(1 + (total - (fin - inicio) + 0.5) / ((fin - inicio) + 0.5))
+            norma = self.k1 * (1 - self.b + self.b * self.longitudes[docs] / self.longitud_promedio)
+            puntuaciones[docs] += idf * tf * (self.k1 + 1) / (tf + norma)
+
+        positivos = np.flatnonzero(puntuaciones)
+        if len(positivos) > n:
+            positivos = positivos[np.argpartition(-puntuaciones[positivos], n)[:n]]
+        orden = positivos[np.argsort(-puntuaciones[positivos])]
+        return [(self.ids[i], float(puntuaciones[i])) for i in orden]
+
+
+def ruta_indice_bm25(path_chroma, nombre_coleccion):
+    """
+    Devuelve la carpeta del índice BM25 de una colección, junto a los datos de ChromaDB.
+
+    Parameters
+    ----------
+    path_chroma : str
+        Ruta al almacenamiento persistente de ChromaDB.
+    nombre_coleccion : str
+        Nombre de la colección.
+
+    Returns
+    -------
+    str
+        Ruta a la carpeta del índice.
+    """
+    return os.path.join(path_chroma, f"bm25_{nombre_coleccion}")
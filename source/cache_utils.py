@@ -0,0 +1,437 @@
+"""
+Descripción
+===========
+
+Este módulo implementa una caché en disco direccionada por contenido para los resultados
+costosos del flujo: el OCR de Textract, la corrección ortográfica con GPT y el JSON generado
+a partir de cada correo.
+
+La clave de cada entrada es un hash SHA-256 de los bytes (o el texto) de entrada junto con
+el nombre de la operación y del modelo, de modo que subir la misma imagen dos veces, o volver
+a ejecutar `app.py` en cada interacción de Streamlit, no repite las llamadas a AWS ni a OpenAI.
+Las entradas se guardan en SQLite, lo que permite compartir la caché entre la app y los
+procesos por lotes. Cuando se excede el tamaño máximo se eliminan las entradas usadas hace
+más tiempo (LRU), y se llevan contadores de aciertos y fallos por operación.
+
+También incluye una caché semántica de respuestas: guarda el embedding de cada pregunta, los
+IDs de los fragmentos recuperados y la respuesta generada, y reutiliza la respuesta cuando
+llega una pregunta suficientemente parecida cuyos fragmentos no han sido reindexados.
+
+Funciones
+===========
+
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from source.config_loader import get_cache_config
+
+
+class CacheDisco:
+    """
+    Caché clave-valor en SQLite con límite de tamaño y desalojo LRU.
+
+    Parameters
+    ----------
+    ruta : str
+        Ruta al archivo SQLite de la caché.
+    max_bytes : int
+        Tamaño máximo de los valores almacenados. Al excederse se eliminan las entradas
+        menos usadas recientemente hasta quedar en el 90% del límite.
+    habilitada : bool
+        Si es False, la caché no guarda ni devuelve nada (los contadores siguen funcionando).
+    """
+
+    def __init__(self, ruta, max_bytes=256 * 1024 * 1024, habilitada=True):
+        self.ruta = ruta
+        self.max_bytes = max_bytes
+        self.habilitada = habilitada
+        self._lock = threading.Lock()
+        self._contadores = {}
+        self._conexion = None
+        if habilitada:
+            os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+            # WAL permite que la app y varios procesos por lotes lean y escriban a la vez
+            self._conexion = sqlite3.connect(ruta, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            self._conexion.execute(
+                "CREATE TABLE IF NOT EXISTS entradas ("
+                "clave TEXT PRIMARY KEY, espacio TEXT, valor TEXT, tamano INTEGER, ultimo_acceso REAL)"
+            )
+            self._conexion.execute("CREATE INDEX IF NOT EXISTS idx_acceso ON entradas (ultimo_acceso)")
+
+    @staticmethod
+    def clave(espacio, *partes):
+        """
+        Calcula la clave de una entrada a partir de la operación y sus entradas.
+
+        Parameters
+        ----------
+        espacio : str
+            Nombre de la operación (por ejemplo, "textract" o "ortografia").
+        *partes : bytes or str
+            Contenido que determina el resultado: bytes del documento, texto, modelo, etc.
+
+        Returns
+        -------
+        str
+            Hash SHA-256 hexadecimal.
+        """
+        h = hashlib.sha256(espacio.encode("utf-8"))
+        for parte in partes:
+            datos = parte if isinstance(parte, bytes) else str(parte).encode("utf-8")
+            # El prefijo de longitud evita que ("ab", "c") y ("a", "bc") colisionen
+            h.update(len(datos).to_bytes(8, "big"))
+            h.update(datos)
+        return h.hexdigest()
+
+    def _contar(self, espacio, campo):
+        with self._lock:
+            contadores = self._contadores.setdefault(espacio, {"aciertos": 0, "fallos": 0})
+            contadores[campo] += 1
+
+    def obtener(self, espacio, clave):
+        """
+        Busca una entrada y, si existe, la marca como usada recientemente.
+
+        Parameters
+        ----------
+        espacio : str
+            Nombre de la operación, usado para los contadores.
+        clave : str
+            Clave calculada con `CacheDisco.clave()`.
+
+        Returns
+        -------
+        object or None
+            Valor guardado (deserializado desde JSON), o None si no existe.
+        """
+        if not self.habilitada:
+            self._contar(espacio, "fallos")
+            return None
+        with self._lock:
+            fila = self._conexion.execute("SELECT valor FROM entradas WHERE clave = ?", (clave,)).fetchone()
+            if fila is not None:
+                self._conexion.execute(
+                    "UPDATE entradas SET ultimo_acceso = ? WHERE clave = ?", (time.time(), clave)
+                )
+        self._contar(espacio, "fallos" if fila is None else "aciertos")
+        return None if fila is None else json.loads(fila[0])
+
+    def guardar(self, espacio, clave, valor):
+        """
+        Guarda una entrada y desaloja las menos usadas si se excede el tamaño máximo.
+
+        Parameters
+        ----------
+        espacio : str
+            Nombre de la operación.
+        clave : str
+            Clave calculada con `CacheDisco.clave()`.
+        valor : object
+            Valor serializable a JSON.
+
+        Returns
+        -------
+        None
+        """
+        if not self.habilitada:
+            return
+        serializado = json.dumps(valor, ensure_ascii=False)
+        tamano = len(serializado.encode("utf-8"))
+        with self._lock:
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO entradas VALUES (?, ?, ?, ?, ?)",
+                (clave, espacio, serializado, tamano, time.time())
+            )
+            total = self._conexion.execute("SELECT COALESCE(SUM(tamano), 0) FROM entradas").fetchone()[0]
+            if total > self.max_bytes:
+                self._desalojar(total)
+
+    def _desalojar(self, total):
+        """Elimina las entradas menos usadas hasta quedar en el 90% de `max_bytes`."""
+        objetivo = int(self.max_bytes * 0.9)
+        eliminar = []
+        for clave, tamano in self._conexion.execute("SELECT clave, tamano FROM entradas ORDER BY ultimo_acceso"):
+            if total <= objetivo:
+                break
+            eliminar.append((clave,))
+            total -= tamano
+        self._conexion.executemany("DELETE FROM entradas WHERE clave = ?", eliminar)
+
+    def obtener_o_calcular(self, espacio, partes, calcular):
+        """
+        Devuelve el valor guardado para `partes` o lo calcula y lo guarda.
+
+        Parameters
+        ----------
+        espacio : str
+            Nombre de la operación.
+        partes : list[bytes or str]
+            Contenido que determina el resultado (ver `CacheDisco.clave()`).
+        calcular : callable
+            Función sin argumentos que produce el valor si no está en caché.
+
+        Returns
+        -------
+        object
+            Valor guardado o recién calculado.
+        """
+        clave = self.clave(espacio, *partes)
+        valor = self.obtener(espacio, clave)
+        if valor is None:
+            valor = calcular()
+            if valor is not None:
+                self.guardar(espacio, clave, valor)
+        return valor
+
+    def estadisticas(self):
+        """
+        Resume el uso de la caché en este proceso.
+
+        Returns
+        -------
+        dict
+            Aciertos, fallos y tasa de aciertos por operación, además del número de entradas
+            y bytes ocupados en disco.
+        """
+        with self._lock:
+            por_espacio = {
+                espacio: {**c, "tasa_aciertos": c["aciertos"] / max(c["aciertos"] + c["fallos"], 1)}
+                for espacio, c in self._contadores.items()
+            }
+            entradas, tamano = 0, 0
+            if self.habilitada:
+                entradas, tamano = self._conexion.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM entradas"
+                ).fetchone()
+        return {"operaciones": por_espacio, "entradas": entradas, "bytes": tamano}
+
+    def limpiar(self):
+        """Elimina todas las entradas de la caché."""
+        if self.habilitada:
+            with self._lock:
+                self._conexion.execute("DELETE FROM entradas")
+
+
+class CacheSemantica:
+    """
+    Caché en memoria de respuestas indexada por el embedding de la pregunta.
+
+    Una entrada se reutiliza cuando la similitud coseno entre la pregunta nueva y la
+    guardada es al menos `umbral`, fue generada con el mismo modelo y no ha expirado.
+    Quien la usa es responsable de verificar que los fragmentos de la entrada sigan
+    vigentes (ver `huella_fragmentos()`) antes de servir la respuesta.
+
+    Parameters
+    ----------
+    umbral : float
+        Similitud coseno mínima para considerar dos preguntas equivalentes.
+    ttl_segundos : float
+        Tiempo de vida de cada entrada.
+    max_entradas : int
+        Número máximo de entradas; al excederse se elimina la usada hace más tiempo (LRU).
+    habilitada : bool
+        Si es False, nunca devuelve ni guarda entradas.
+    """
+
+    def __init__(self, umbral=0.95, ttl_segundos=24 * 3600, max_entradas=1000, habilitada=True):
+        self.umbral = umbral
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self.habilitada = habilitada
+        self._entradas = OrderedDict()
+        self._siguiente_id = 0
+        self._lock = threading.Lock()
+        self._estadisticas = {"consultas": 0, "aciertos": 0, "invalidadas": 0, "segundos_ahorrados": 0.0}
+
+    @staticmethod
+    def _normalizar(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norma = np.linalg.norm(vector)
+        return vector / norma if norma > 0 else vector
+
+    def buscar(self, embedding, model):
+        """
+        Busca la entrada vigente más parecida a la pregunta.
+
+        Parameters
+        ----------
+        embedding : list[float]
+            Embedding de la pregunta nueva.
+        model : str
+            Modelo con el que se generaría la respuesta.
+
+        Returns
+        -------
+        dict or None
+            Entrada con las claves "id", "ids", "huella", "respuesta", "segundos" y "similitud",
+            o None si no hay ninguna por encima del umbral.
+        """
+        if not self.habilitada:
+            return None
+        consulta = self._normalizar(embedding)
+        ahora = time.time()
+        with self._lock:
+            self._estadisticas["consultas"] += 1
+            for id_entrada in [i for i, e in self._entradas.items() if ahora - e["creada"] > self.ttl_segundos]:
+                del self._entradas[id_entrada]
+            candidatas = [e for e in self._entradas.values() if e["model"] == model]
+            if not candidatas:
+                return None
+            similitudes = np.stack([e["vector"] for e in candidatas]) @ consulta
+            mejor = int(np.argmax(similitudes))
+            if similitudes[mejor] < self.umbral:
+                return None
+            entrada = candidatas[mejor]
+            self._entradas.move_to_end(entrada["id"])
+            return {**entrada, "similitud": float(similitudes[mejor])}
+
+    def guardar(self, embedding, model, ids, huella, respuesta, segundos):
+        """
+        Guarda una respuesta recién generada.
+
+        Parameters
+        ----------
+        embedding : list[float]
+            Embedding de la pregunta.
+        model : str
+            Modelo con el que se generó la respuesta.
+        ids : list[str]
+            IDs de los fragmentos usados como contexto.
+        huella : str
+            Huella de esos fragmentos (ver `huella_fragmentos()`).
+        respuesta : str
+            Respuesta generada.
+        segundos : float
+            Latencia de recuperación y generación, usada para estimar el tiempo ahorrado.
+
+        Returns
+        -------
+        None
+        """
+        if not self.habilitada:
+            return
+        with self._lock:
+            id_entrada = self._siguiente_id
+            self._siguiente_id += 1
+            self._entradas[id_entrada] = {
+                "id": id_entrada,
+                "vector": self._normalizar(embedding),
+                "model": model,
+                "ids": list(ids),
+                "huella": huella,
+                "respuesta": respuesta,
+                "segundos": segundos,
+                "creada": time.time(),
+            }
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def registrar_acierto(self, entrada, segundos):
+        """
+        Registra que se sirvió `entrada` desde la caché en `segundos`.
+
+        Parameters
+        ----------
+        entrada : dict
+            Entrada devuelta por `buscar()`.
+        segundos : float
+            Latencia de la respuesta servida desde caché.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._estadisticas["aciertos"] += 1
+            self._estadisticas["segundos_ahorrados"] += max(entrada["segundos"] - segundos, 0.0)
+
+    def invalidar(self, entrada):
+        """
+        Elimina una entrada cuyos fragmentos fueron reindexados.
+
+        Parameters
+        ----------
+        entrada : dict
+            Entrada devuelta por `buscar()`.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._entradas.pop(entrada["id"], None)
+            self._estadisticas["invalidadas"] += 1
+
+    def estadisticas(self):
+        """
+        Resume el uso de la caché semántica en este proceso.
+
+        Returns
+        -------
+        dict
+            Consultas, aciertos, tasa de aciertos, entradas invalidadas, entradas vigentes y
+            segundos de latencia ahorrados.
+        """
+        with self._lock:
+            estadisticas = dict(self._estadisticas)
+            estadisticas["tasa_aciertos"] = estadisticas["aciertos"] / max(estadisticas["consultas"], 1)
+            estadisticas["entradas"] = len(self._entradas)
+        return estadisticas
+
+
+def huella_fragmentos(ids, documentos):
+    """
+    Calcula una huella de un conjunto de fragmentos a partir de sus IDs y su texto.
+
+    Si algún fragmento se reindexa con otro contenido, o desaparece, la huella cambia.
+
+    Parameters
+    ----------
+    ids : list[str]
+        IDs de los fragmentos.
+    documentos : list[str]
+        Texto de cada fragmento, en el mismo orden que `ids`.
+
+    Returns
+    -------
+    str
+        Hash SHA-256 hexadecimal, independiente del orden de los fragmentos.
+    """
+    partes = []
+    for id_fragmento, documento in sorted(zip(ids, documentos)):
+        partes.extend([id_fragmento, documento])
+    return CacheDisco.clave("fragmentos", *partes)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obtener_cache():
+    """
+    Devuelve la `CacheDisco` compartida del proceso, creada con la sección `cache` de config.yaml.
+
+    Returns
+    -------
+    CacheDisco
+        Instancia única por proceso.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = get_cache_config()
+                _cache = CacheDisco(
+                    ruta=config["path"],
+                    max_bytes=int(config["max_mb"] * 1024 * 1024),
+                    habilitada=config["habilitada"],
+                )
+    return _cache
@@ -12,13 +12,24 @@ Funciones
 """
 
 import os
+import json
+import time
+import hashlib
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import pymupdf
 import pdfplumber
 import chromadb
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+from source.embedding_utils import obtener_servicio_embeddings, MODELO_HEREDADO
+from source.chunking_utils import fragmentar_texto, identificar_circulares, SALTO_DE_PAGINA
+from source.bm25_utils import IndiceBM25, ruta_indice_bm25
 import warnings
 warnings.filterwarnings("ignore")
 
+# Versión de los metadatos de cada fragmento; al cambiarla, la siguiente indexación
+# incremental vuelve a procesar todos los PDFs
+ESQUEMA_METADATOS = 2
+
 def tabla_a_texto(tabla):
     """
     Convierte una tabla extraída de un PDF en texto legible tipo "columna: valor".
@@ -74,10 +85,323 @@ def extraer_con_tablas(ruta_pdf):
                 texto_total.append(doc[page_num].get_text())
     return "\n\n".join(texto_total)
 
-def indexar_pdfs_en_chroma(carpeta_pdfs="normatividad_compilado", path_chroma="./chroma_data", nombre_coleccion="normatividad"):
+def _pagina_con_posible_tabla(pagina, min_segmentos=4):
+    """
+    Heurística barata para decidir si una página puede contener una tabla.
+
+    Tanto pdfplumber como pymupdf detectan tablas a partir de las líneas de sus bordes,
+    así que una página sin suficientes segmentos horizontales o verticales dibujados
+    no puede producir tablas y se omite la extracción costosa.
+
+    Parameters
+    ----------
+    pagina : pymupdf.Page
+        Página del documento abierta con pymupdf.
+    min_segmentos : int
+        Número mínimo de segmentos rectos (un rectángulo cuenta como cuatro).
+
+    Returns
+    -------
+    bool
+        True si la página tiene suficientes segmentos para formar una tabla.
+    """
+    segmentos = 0
+    for dibujo in pagina.get_drawings():
+        for item in dibujo["items"]:
+            if item[0] == "re":
+                segmentos += 4
+            elif item[0] == "l":
+                p1, p2 = item[1], item[2]
+                if abs(p1.x - p2.x) < 1 or abs(p1.y - p2.y) < 1:
+                    segmentos += 1
+            if segmentos >= min_segmentos:
+                return True
+    return False
+
+def extraer_con_tablas_rapido(ruta_pdf, motor_tablas="pymupdf", separador_paginas="\n\n"):
+    """
+    Extrae contenido textual y tabular de un PDF abriéndolo una sola vez con pymupdf.
+
+    Produce el mismo formato que `extraer_con_tablas()`, pero solo ejecuta la extracción
+    de tablas en las páginas que `_pagina_con_posible_tabla()` marca como candidatas.
+    Las demás páginas se leen directamente como texto plano.
+
+    Parameters
+    ----------
+    ruta_pdf : str
+        Ruta al archivo PDF que se desea procesar.
+    motor_tablas : str
+        "pymupdf" (por defecto) usa el buscador de tablas de pymupdf sobre el documento ya
+        abierto; "pdfplumber" abre el PDF con pdfplumber solo si hay páginas candidatas.
+    separador_paginas : str
+        Texto entre páginas (por defecto: salto doble de línea). `SALTO_DE_PAGINA` permite
+        que `fragmentar_texto()` sepa en qué página inicia cada fragmento.
+
+    Returns
+    -------
+    str
+        Texto completo del documento, incluyendo tanto texto plano como
+        representaciones legibles de tablas, con las páginas unidas por `separador_paginas`.
+    """
+    if motor_tablas not in ("pymupdf", "pdfplumber"):
+        raise ValueError("motor_tablas debe ser 'pymupdf' o 'pdfplumber'.")
+
+    texto_total = []
+    pdf_plumber = None
+    with pymupdf.open(ruta_pdf) as doc:
+        try:
+            for page_num, pagina in enumerate(doc):
+                tablas = []
+                if _pagina_con_posible_tabla(pagina):
+                    if motor_tablas == "pymupdf":
+                        tablas = [t.extract() for t in pagina.find_tables().tables]
+                    else:
+                        if pdf_plumber is None:
+                            pdf_plumber = pdfplumber.open(ruta_pdf)
+                        tablas = pdf_plumber.pages[page_num].extract_tables()
+                if tablas and len(tablas[0]) > 1:
+                    texto_total.append("\n\n".join(tabla_a_texto(tabla) for tabla in tablas))
+                else:
+                    texto_total.append(pagina.get_text())
+        finally:
+            if pdf_plumber is not None:
+                pdf_plumber.close()
+    return separador_paginas.join(texto_total)
+
+def _procesar_pdf(ruta_pdf, fragmentacion):
+    """
+    Extrae el texto de un PDF y lo divide en fragmentos indexables.
+
+    Se define a nivel de módulo para que pueda enviarse a los procesos del pool.
+
+    Parameters
+    ----------
+    ruta_pdf : str
+        Ruta al archivo PDF que se desea procesar.
+    fragmentacion : dict
+        Argumentos para `fragmentar_texto()` (max_tokens, min_tokens, solapamiento).
+
+    Returns
+    -------
+    list[dict]
+        Fragmentos con sus metadatos de estructura y página, según `fragmentar_texto()`.
+    """
+    texto = extraer_con_tablas_rapido(ruta_pdf, separador_paginas=SALTO_DE_PAGINA)
+    return fragmentar_texto(texto, **fragmentacion)
+
+def metadatos_de_catalogo(catalogo_path):
+    """
+    Obtiene de cada título del catálogo la circular a la que corresponde el PDF.
+
+    Parameters
+    ----------
+    catalogo_path : str
+        Ruta al catálogo {archivo: título legible} (por ejemplo, "CIRCULAR 34/2010: REGLAS ...").
+
+    Returns
+    -------
+    dict
+        {archivo: {"circular", "numero", "anio"}} para los títulos que citan una circular;
+        vacío si el catálogo no existe.
+    """
+    if not os.path.exists(catalogo_path):
+        return {}
+    with open(catalogo_path, "r", encoding="utf-8") as f:
+        catalogo = json.load(f)
+    metadatos = {}
+    for archivo, titulo in catalogo.items():
+        circulares = identificar_circulares(titulo)
+        if circulares:
+            metadatos[archivo] = circulares[0]
+    return metadatos
+
+def _agregar_lote(collection, lote):
+    """
+    Inserta un lote de fragmentos en la colección con una sola llamada a `collection.upsert`.
+
+    Chroma calcula los embeddings de todos los documentos del lote en una sola pasada
+    de la función de embeddings, en lugar de un documento por llamada. Se usa `upsert`
+    para que repetir una indexación interrumpida no falle por IDs ya existentes.
+
+    Parameters
+    ----------
+    collection : chromadb.Collection
+        Colección donde se insertan los fragmentos.
+    lote : dict
+        Diccionario con las listas "documents", "ids" y "metadatas". Se vacía al terminar.
+
+    Returns
+    -------
+    None
+    """
+    if not lote["ids"]:
+        return
+    collection.upsert(
+        documents=lote["documents"],
+        ids=lote["ids"],
+        metadatas=lote["metadatas"]
+    )
+    for lista in lote.values():
+        lista.clear()
+
+def _hash_archivo(ruta, tam_bloque=1 << 20):
+    """
+    Calcula el hash SHA-256 del contenido de un archivo leyéndolo por bloques.
+
+    Parameters
+    ----------
+    ruta : str
+        Ruta al archivo.
+    tam_bloque : int
+        Tamaño en bytes de cada bloque leído.
+
+    Returns
+    -------
+    str
+        Hash hexadecimal del contenido.
+    """
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(tam_bloque), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+def ruta_manifiesto(path_chroma, nombre_coleccion):
+    """
+    Devuelve la ruta del manifiesto de indexación de una colección.
+
+    Parameters
+    ----------
+    path_chroma : str
+        Ruta al almacenamiento persistente de ChromaDB.
+    nombre_coleccion : str
+        Nombre de la colección.
+
+    Returns
+    -------
+    str
+        Ruta al archivo JSON del manifiesto, junto a los datos de ChromaDB.
+    """
+    return os.path.join(path_chroma, f"manifiesto_{nombre_coleccion}.json")
+
+def cargar_manifiesto(ruta):
+    """
+    Carga el manifiesto de indexación con el hash y los IDs de fragmentos de cada PDF.
+
+    Parameters
+    ----------
+    ruta : str
+        Ruta al archivo JSON del manifiesto.
+
+    Returns
+    -------
+    dict or None
+        Diccionario {"parametros": dict, "archivos": {archivo: {"hash": str, "ids": list[str]}}},
+        o None si el manifiesto no existe.
+    """
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def guardar_manifiesto(manifiesto, ruta):
+    """
+    Guarda el manifiesto de forma atómica (escribe a un temporal y lo reemplaza).
+
+    Parameters
+    ----------
+    manifiesto : dict
+        Manifiesto de indexación.
+    ruta : str
+        Ruta al archivo JSON del manifiesto.
+
+    Returns
+    -------
+    None
+    """
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+def _eliminar_ids(collection, ids, batch_size):
+    """
+    Elimina fragmentos de la colección en lotes de `batch_size` IDs.
+
+    Parameters
+    ----------
+    collection : chromadb.Collection
+        Colección de la que se eliminan los fragmentos.
+    ids : list[str]
+        IDs de los fragmentos a eliminar.
+    batch_size : int
+        Número máximo de IDs por llamada a `collection.delete`.
+
+    Returns
+    -------
+    None
+    """
+    for i in range(0, len(ids), batch_size):
+        collection.delete(ids=ids[i:i + batch_size])
+
+def construir_indice_bm25(collection, carpeta, batch_size=512):
+    """
+    Construye el índice léxico BM25 con todos los fragmentos de la colección y lo guarda.
+
+    Se reconstruye a partir de la colección (y no solo de los PDFs procesados en la corrida)
+    para que refleje también los fragmentos que no cambiaron en una indexación incremental.
+
+    Parameters
+    ----------
+    collection : chromadb.Collection
+        Colección con los fragmentos indexados.
+    carpeta : str
+        Carpeta donde se guarda el índice (ver `ruta_indice_bm25()`).
+    batch_size : int
+        Número de fragmentos leídos por llamada a `collection.get`.
+
+    Returns
+    -------
+    IndiceBM25
+        Índice construido.
+    """
+    ids, documentos = [], []
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        resultado = collection.get(include=["documents"], limit=batch_size, offset=offset)
+        ids.extend(resultado["ids"])
+        documentos.extend(resultado["documents"])
+    indice = IndiceBM25.construir(ids, documentos)
+    indice.guardar(carpeta)
+    return indice
+
+def indexar_pdfs_en_chroma(carpeta_pdfs="normatividad_compilado", path_chroma="./chroma_data", nombre_coleccion="normatividad",
+                           batch_size=512, num_procesos=None, reconstruir=False,
+                           max_tokens=160, min_tokens=40, solapamiento=24,
+                           catalogo_path="metadata/catalogo_normatividad.json", embedding_model=None):
     """
     Indexa documentos PDF en una colección ChromaDB con embeddings de texto.
 
+    La indexación es incremental: un manifiesto junto a los datos de ChromaDB guarda el hash
+    del contenido y los IDs de fragmentos de cada PDF. En cada corrida solo se procesan los
+    PDFs nuevos o modificados, y se eliminan los fragmentos de los PDFs que ya no están en la
+    carpeta. Si no existe manifiesto, si la colección se indexó con otro modelo de embeddings
+    (o si `reconstruir=True`) la colección se crea desde cero; el modelo se guarda en los
+    metadatos de la colección. Si cambian los parámetros de fragmentación o `ESQUEMA_METADATOS`, todos los PDFs se
+    consideran modificados.
+
+    Cada PDF se divide con `fragmentar_texto()`, que respeta la estructura de las circulares
+    y agrega a los metadatos del fragmento el capítulo, sección o artículo al que pertenece y
+    la página donde inicia. Del catálogo se agregan la circular ("34/2010"), su número y su
+    año, para que las consultas puedan filtrar con cláusulas `where`.
+    Al terminar se reconstruye el índice léxico BM25 de la colección, junto a los datos de
+    ChromaDB, si hubo cambios.
+
+    La extracción de texto se reparte entre un pool de procesos y los fragmentos resultantes
+    se insertan en ChromaDB en lotes de `batch_size`, de modo que los embeddings se calculan
+    por lotes en lugar de uno por uno. Al final se reportan documentos/s y fragmentos/s.
+
     Parameters
     ----------
     carpeta_pdfs : str
@@ -85,38 +409,147 @@ def indexar_pdfs_en_chroma(carpeta_pdfs="normatividad_compilado", path_chroma=".
     path_chroma : str
         Ruta al almacenamiento persistente de ChromaDB.
     nombre_coleccion : str
-        Nombre de la colección ChromaDB que se va a crear.
+        Nombre de la colección ChromaDB que se va a crear o actualizar.
+    batch_size : int
+        Número de fragmentos por llamada a `collection.upsert` (por defecto: 512). Se limita
+        al tamaño máximo de lote que acepte el cliente de ChromaDB.
+    num_procesos : int, optional
+        Número de procesos para la extracción de texto (por defecto: número de CPUs).
+    reconstruir : bool
+        Si es True, elimina la colección y el manifiesto y vuelve a indexar todo.
+    max_tokens : int
+        Tamaño máximo de cada fragmento, en tokens (por defecto: 160).
+    min_tokens : int
+        Tamaño mínimo de cada fragmento, en tokens (por defecto: 40).
+    solapamiento : int
+        Tokens repetidos entre fragmentos consecutivos de un mismo artículo (por defecto: 24).
+    catalogo_path : str
+        Catálogo {archivo: título} de donde se toman la circular y el año de cada PDF.
+    embedding_model : str, optional
+        Modelo de embeddings (por defecto: `embedding_model` de la sección `app`, el mismo
+        que usa `RAGService` para consultar).
 
     Returns
     -------
-    None
+    dict
+        Estadísticas de la indexación: nuevos, modificados, eliminados, sin_cambios,
+        documentos (procesados), fragmentos, segundos, docs_por_segundo y fragmentos_por_segundo.
     """
 
     if not os.path.exists(carpeta_pdfs):
         raise FileNotFoundError(f"La carpeta '{carpeta_pdfs}' no existe.")
+    if batch_size < 1:
+        raise ValueError("batch_size debe ser mayor o igual a 1.")
 
-    embedding_fn = SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+    embedding_fn = obtener_servicio_embeddings(embedding_model)
     chroma_client = chromadb.PersistentClient(path=path_chroma)
+    batch_size = min(batch_size, chroma_client.get_max_batch_size())
 
-    if nombre_coleccion in [c.name for c in chroma_client.list_collections()]:
-        chroma_client.delete_collection(nombre_coleccion)
+    # Vectores de otro modelo no son comparables con los nuevos: se reconstruye la colección
+    if not reconstruir and nombre_coleccion in [c.name for c in chroma_client.list_collections()]:
+        metadatos = chroma_client.get_collection(nombre_coleccion).metadata or {}
+        modelo_anterior = metadatos.get("embedding_modelo", MODELO_HEREDADO)
+        if modelo_anterior != embedding_fn.modelo:
+            print(f"♻️ La colección se indexó con '{modelo_anterior}'; se reconstruye con '{embedding_fn.modelo}'.")
+            reconstruir = True
 
-    collection = chroma_client.create_collection(
+    fragmentacion = {"max_tokens": max_tokens, "min_tokens": min_tokens, "solapamiento": solapamiento}
+    path_manifiesto = ruta_manifiesto(path_chroma, nombre_coleccion)
+    manifiesto = None if reconstruir else cargar_manifiesto(path_manifiesto)
+
+    # Sin manifiesto no sabemos qué fragmentos pertenecen a cada PDF, así que reconstruimos
+    if manifiesto is None:
+        if nombre_coleccion in [c.name for c in chroma_client.list_collections()]:
+            chroma_client.delete_collection(nombre_coleccion)
+        manifiesto = {"archivos": {}}
+
+    # Con otros parámetros de fragmentación o de metadatos los fragmentos existentes ya no son válidos
+    parametros = {**fragmentacion, "esquema_metadatos": ESQUEMA_METADATOS}
+    if manifiesto.get("parametros") != parametros:
+        for entrada in manifiesto["archivos"].values():
+            entrada["hash"] = None
+        manifiesto["parametros"] = parametros
+
+    collection = chroma_client.get_or_create_collection(
         name=nombre_coleccion,
-        embedding_function=embedding_fn
+        embedding_function=embedding_fn,
+        metadata=embedding_fn.metadatos()
     )
 
-    for archivo in os.listdir(carpeta_pdfs):
-        if archivo.lower().endswith(".pdf"):
-            ruta = os.path.join(carpeta_pdfs, archivo)
-            print(f"📄 Procesando: {archivo}")
-            texto = extraer_con_tablas(ruta)
-            chunks = [p.strip() for p in texto.split("\n\n") if len(p.strip()) > 100]
-            for i, chunk in enumerate(chunks):
-                collection.add(
-                    documents=[chunk],
-                    ids=[f"{archivo}_{i}"],
-                    metadatas=[{"source": archivo}]
-                )
-
-    print(f"✅ Documentos indexados en colección '{nombre_coleccion}'.")
\ No newline at end of file
+    indexados = manifiesto["archivos"]
+    hashes = {
+        a: _hash_archivo(os.path.join(carpeta_pdfs, a))
+        for a in sorted(os.listdir(carpeta_pdfs)) if a.lower().endswith(".pdf")
+    }
+    nuevos = [a for a in hashes if a not in indexados]
+    modificados = [a for a in hashes if a in indexados and indexados[a]["hash"] != hashes[a]]
+    eliminados = [a for a in indexados if a not in hashes]
+
+    print(f"🔎 {len(nuevos)} nuevos, {len(modificados)} modificados, {len(eliminados)} eliminados, "
+          f"{len(hashes) - len(nuevos) - len(modificados)} sin cambios.")
+
+    for archivo in eliminados + modificados:
+        _eliminar_ids(collection, indexados[archivo]["ids"], batch_size)
+    for archivo in eliminados:
+        del indexados[archivo]
+    if eliminados or modificados:
+        guardar_manifiesto(manifiesto, path_manifiesto)
+
+    archivos = sorted(nuevos + modificados)
+    circulares = metadatos_de_catalogo(catalogo_path)
+    rutas = [os.path.join(carpeta_pdfs, a) for a in archivos]
+
+    inicio = time.perf_counter()
+    total_fragmentos = 0
+    lote = {"documents": [], "ids": [], "metadatas": []}
+    # Archivos cuyos fragmentos ya están todos en el lote en curso o en lotes anteriores;
+    # se registran en el manifiesto solo después de que su último lote llegó a Chroma
+    completos = {}
+
+    def _enviar_lote():
+        _agregar_lote(collection, lote)
+        if completos:
+            indexados.update(completos)
+            completos.clear()
+            guardar_manifiesto(manifiesto, path_manifiesto)
+
+    with ProcessPoolExecutor(max_workers=num_procesos) as pool:
+        # map conserva el orden y entrega los resultados conforme terminan los procesos,
+        # así los lotes se envían a Chroma mientras el resto de los PDFs se sigue extrayendo
+        procesar = partial(_procesar_pdf, fragmentacion=fragmentacion)
+        for archivo, chunks in zip(archivos, pool.map(procesar, rutas)):
+            print(f"📄 Procesado: {archivo} ({len(chunks)} fragmentos)")
+            ids = [f"{archivo}_{i}" for i in range(len(chunks))]
+            for chunk, id_chunk in zip(chunks, ids):
+                lote["documents"].append(chunk["texto"])
+                lote["ids"].append(id_chunk)
+                lote["metadatas"].append({"source": archivo, **circulares.get(archivo, {}), **chunk["metadata"]})
+                if len(lote["ids"]) >= batch_size:
+                    _enviar_lote()
+            completos[archivo] = {"hash": hashes[archivo], "ids": ids}
+            total_fragmentos += len(chunks)
+        _enviar_lote()
+
+    carpeta_bm25 = ruta_indice_bm25(path_chroma, nombre_coleccion)
+    if archivos or eliminados or not os.path.exists(carpeta_bm25):
+        construir_indice_bm25(collection, carpeta_bm25, batch_size)
+        print(f"🔤 Índice BM25 actualizado en '{carpeta_bm25}'.")
+
+    segundos = time.perf_counter() - inicio
+    estadisticas = {
+        "nuevos": len(nuevos),
+        "modificados": len(modificados),
+        "eliminados": len(eliminados),
+        "sin_cambios": len(hashes) - len(nuevos) - len(modificados),
+        "documentos": len(archivos),
+        "fragmentos": total_fragmentos,
+        "segundos": segundos,
+        "docs_por_segundo": len(archivos) / segundos if segundos > 0 else 0.0,
+        "fragmentos_por_segundo": total_fragmentos / segundos if segundos > 0 else 0.0,
+    }
+
+    print(f"✅ Documentos indexados en colección '{nombre_coleccion}'.")
+    print(f"⏱️ {estadisticas['documentos']} documentos y {estadisticas['fragmentos']} fragmentos en "
+          f"{segundos:.1f} s ({estadisticas['docs_por_segundo']:.2f} docs/s, "
+          f"{estadisticas['fragmentos_por_segundo']:.1f} fragmentos/s).")
+    return estadisticas
@@ -0,0 +1,398 @@
+"""
+Descripción
+===========
+
+Este módulo divide el texto extraído de la normatividad de Banco de México en fragmentos
+de tamaño uniforme para indexarlos en ChromaDB.
+
+A diferencia de partir el texto en saltos dobles de línea, el fragmentador reconoce la
+estructura de las circulares (Título, Capítulo, Sección, Artículo, Transitorios y Anexos),
+respeta tamaños mínimo y máximo medidos en tokens, agrega un solapamiento configurable entre
+fragmentos consecutivos de un mismo artículo y adjunta a cada fragmento los metadatos de la
+sección a la que pertenece y la página donde inicia.
+
+Funciones
+===========
+
+"""
+
+import re
+
+# Patrones de encabezados: (campo de metadatos, expresión regular sobre el inicio de línea)
+PATRONES_ENCABEZADO = [
+    ("titulo", re.compile(r"^\s*T[ÍI]TULO\s+([A-ZÁÉÍÓÚ]+|\d+)\b", re.IGNORECASE)),
+    ("capitulo", re.compile(r"^\s*CAP[ÍI]TULO\s+([IVXLCDM]+|[A-ZÁÉÍÓÚ]+|\d+)\b", re.IGNORECASE)),
+    ("seccion", re.compile(r"^\s*SECCI[ÓO]N\s+([IVXLCDM]+|[A-ZÁÉÍÓÚ]+|\d+)\b", re.IGNORECASE)),
+    ("transitorios", re.compile(r"^\s*(?:ART[ÍI]CULOS\s+)?(TRANSITORIOS?)\s*$", re.IGNORECASE)),
+    ("anexo", re.compile(r"^\s*ANEXO\s+(\d+|[A-Z])\b", re.IGNORECASE)),
+    ("articulo", re.compile(
+        r"^\s*ART[ÍI]CULO\s+(\d+\s*[oº°]?(?:\s*(?:BIS|TER|QU[ÁA]TER)\b)?|[ÚU]NICO|[A-ZÁÉÍÓÚ]+O)\b",
+        re.IGNORECASE)),
+]
+
+# Jerarquía de los encabezados: al abrir uno se reinician los de nivel inferior
+NIVELES = ["titulo", "capitulo", "seccion", "articulo"]
+
+FIN_DE_PARRAFO = re.compile(r"[.:;]\s*$")
+FIN_DE_ORACION = re.compile(r"(?<=[.;:])\s+")
+TOKEN = re.compile(r"\w+|[^\w\s]")
+
+# Separador de páginas en el texto extraído (ver `extraer_con_tablas_rapido()`)
+SALTO_DE_PAGINA = "\f"
+
+# Referencias a circulares como "Circular 34/2010" o "CIRCULAR 3/2012"
+PATRON_CIRCULAR = re.compile(r"\bCIRCULAR\s+(?:N[OÚU]M(?:ERO|\.)?\s*)?(\d{1,3})\s*/\s*(\d{4})\b", re.IGNORECASE)
+
+# Párrafos de hasta este tamaño se consideran encabezados (p. ej. "CAPÍTULO I", "Disposiciones generales")
+MAX_TOKENS_ENCABEZADO = 16
+
+
+def contar_tokens(texto):
+    """
+    Cuenta tokens de forma aproximada (palabras y signos de puntuación).
+
+    Es una aproximación barata y determinista del tokenizador del modelo de embeddings;
+    los modelos WordPiece suelen producir algo más de un token por palabra en español,
+    por lo que los tamaños por defecto dejan margen bajo el límite de 256 de MiniLM.
+
+    Parameters
+    ----------
+    texto : str
+        Texto a medir.
+
+    Returns
+    -------
+    int
+        Número aproximado de tokens.
+    """
+    return len(TOKEN.findall(texto))
+
+
+def detectar_encabezado(linea):
+    """
+    Identifica si una línea abre una nueva sección de la circular.
+
+    Parameters
+    ----------
+    linea : str
+        Línea de texto.
+
+    Returns
+    -------
+    tuple (campo:str, valor:str) or None
+        Campo de metadatos ("titulo", "capitulo", "seccion", "articulo", "transitorios"
+        o "anexo") y su identificador normalizado, o None si la línea no es un encabezado.
+    """
+    for campo, patron in PATRONES_ENCABEZADO:
+        match = patron.match(linea)
+        if match:
+            valor = re.sub(r"\s+", " ", match.group(1)).strip().upper()
+            # "Artículo 5o" y "Artículo 5" son el mismo artículo
+            valor = re.sub(r"^(\d+)\s*[Oº°]", r"\1", valor)
+            return campo, valor
+    return None
+
+
+def identificar_circulares(texto):
+    """
+    Encuentra las circulares citadas en un texto.
+
+    Parameters
+    ----------
+    texto : str
+        Texto donde buscar (título del catálogo, solicitud, etc.).
+
+    Returns
+    -------
+    list[dict]
+        Una entrada por circular distinta, en el orden en que aparecen, con las claves
+        "circular" ("34/2010"), "numero" (34) y "anio" (2010).
+    """
+    circulares = []
+    for numero, anio in PATRON_CIRCULAR.findall(texto):
+        circular = {"circular": f"{int(numero)}/{anio}", "numero": int(numero), "anio": int(anio)}
+        if circular not in circulares:
+            circulares.append(circular)
+    return circulares
+
+
+def _actualizar_estructura(estructura, campo, valor):
+    """
+    Actualiza el estado de la estructura al encontrar un encabezado.
+
+    Parameters
+    ----------
+    estructura : dict
+        Estado actual {campo: valor}. Se modifica en sitio.
+    campo : str
+        Campo detectado por `detectar_encabezado()`.
+    valor : str
+        Identificador del encabezado.
+
+    Returns
+    -------
+    None
+    """
+    if campo == "transitorios":
+        # Los transitorios viven fuera de la jerarquía del articulado
+        estructura.clear()
+        estructura["seccion"] = "TRANSITORIOS"
+    elif campo == "anexo":
+        estructura.clear()
+        estructura["anexo"] = valor
+    else:
+        for nivel in NIVELES[NIVELES.index(campo):]:
+            estructura.pop(nivel, None)
+        estructura[campo] = valor
+
+
+def _parrafos(texto):
+    """
+    Reconstruye párrafos a partir de las líneas del texto y les asigna su sección y página.
+
+    Un párrafo termina en una línea vacía, en una línea que acaba en punto, dos puntos o
+    punto y coma, o antes de un encabezado. Cada encabezado abre un párrafo nuevo. Un salto
+    de página (`SALTO_DE_PAGINA`) no cierra el párrafo, que se asigna a la página donde inicia.
+
+    Parameters
+    ----------
+    texto : str
+        Texto completo del documento, con las páginas separadas por `SALTO_DE_PAGINA`.
+
+    Returns
+    -------
+    list[tuple (texto:str, metadata:dict, inicio_de_seccion:bool, pagina:int)]
+        Párrafos en orden, con una copia de la estructura vigente, una bandera que indica
+        si el párrafo abre una nueva sección y el número de página (desde 1).
+    """
+    parrafos = []
+    estructura = {}
+    actual = []
+    inicio_seccion = False
+    pagina_parrafo = 1
+
+    def cerrar():
+        nonlocal actual, inicio_seccion
+        if actual:
+            parrafos.append((" ".join(actual), dict(estructura), inicio_seccion, pagina_parrafo))
+        actual = []
+        inicio_seccion = False
+
+    for pagina, texto_pagina in enumerate(texto.split(SALTO_DE_PAGINA), start=1):
+        for linea in texto_pagina.splitlines():
+            linea = linea.strip()
+            if not linea:
+                cerrar()
+                continue
+            encabezado = detectar_encabezado(linea)
+            if encabezado:
+                cerrar()
+                _actualizar_estructura(estructura, *encabezado)
+                inicio_seccion = True
+            if not actual:
+                pagina_parrafo = pagina
+            actual.append(linea)
+            if FIN_DE_PARRAFO.search(linea):
+                cerrar()
+    cerrar()
+    return parrafos
+
+
+def _partir_largo(texto, max_tokens, contar):
+    """
+    Parte un párrafo que excede `max_tokens` en piezas que sí caben.
+
+    Primero intenta cortar por oraciones; si una oración sigue siendo demasiado larga,
+    la corta por palabras.
+
+    Parameters
+    ----------
+    texto : str
+        Párrafo a partir.
+    max_tokens : int
+        Tamaño máximo de cada pieza.
+    contar : callable
+        Función que cuenta tokens.
+
+    Returns
+    -------
+    list[str]
+        Piezas de a lo más `max_tokens` tokens.
+    """
+    piezas = []
+    for oracion in FIN_DE_ORACION.split(texto):
+        if contar(oracion) <= max_tokens:
+            piezas.append(oracion)
+            continue
+        actual = []
+        for palabra in oracion.split():
+            if actual and contar(" ".join(actual + [palabra])) > max_tokens:
+                piezas.append(" ".join(actual))
+                actual = []
+            actual.append(palabra)
+        if actual:
+            piezas.append(" ".join(actual))
+    return piezas
+
+
+def _cola(texto, n_tokens, contar):
+    """
+    Devuelve las últimas palabras de `texto` que suman al menos `n_tokens` tokens.
+
+    Parameters
+    ----------
+    texto : str
+        Texto del fragmento anterior.
+    n_tokens : int
+        Tokens de solapamiento deseados.
+    contar : callable
+        Función que cuenta tokens.
+
+    Returns
+    -------
+    str
+        Cola del texto, o cadena vacía si `n_tokens` es 0.
+    """
+    if n_tokens <= 0:
+        return ""
+    palabras = texto.split()
+    cola = []
+    while palabras and contar(" ".join(cola)) < n_tokens:
+        cola.insert(0, palabras.pop())
+    return " ".join(cola)
+
+
+def _es_encabezado(pieza, tras_encabezado, contar):
+    """
+    Indica si una pieza es solo un encabezado, sin contenido propio.
+
+    Son encabezados las líneas de CIRCULAR, TÍTULO, CAPÍTULO, SECCIÓN, TRANSITORIOS y ANEXO
+    cortas, y el nombre que les sigue (p. ej. "Disposiciones generales"). El inicio de un
+    artículo nunca lo es, aunque sea corto ("Artículo 2.- Derogado.").
+
+    Parameters
+    ----------
+    pieza : str
+        Pieza de un párrafo.
+    tras_encabezado : bool
+        Si el fragmento en curso solo contiene encabezados.
+    contar : callable
+        Función que cuenta tokens.
+
+    Returns
+    -------
+    bool
+        True si la pieza es un encabezado.
+    """
+    if contar(pieza) > MAX_TOKENS_ENCABEZADO:
+        return False
+    encabezado = detectar_encabezado(pieza)
+    if encabezado:
+        return encabezado[0] != "articulo"
+    if PATRON_CIRCULAR.match(pieza):
+        return True
+    return tras_encabezado and not FIN_DE_PARRAFO.search(pieza)
+
+
+def fragmentar_texto(texto, max_tokens=160, min_tokens=40, solapamiento=24, contar=contar_tokens):
+    """
+    Divide el texto de una circular en fragmentos con metadatos de estructura.
+
+    Los párrafos se agrupan en fragmentos de hasta `max_tokens` tokens. Un nuevo artículo,
+    capítulo o sección inicia un nuevo fragmento siempre que el fragmento en curso ya tenga
+    al menos `min_tokens`; si no, el texto corto se une al contenido que le sigue en lugar
+    de perderse. Un fragmento con solo encabezados (ver `_es_encabezado()`) nunca se cierra
+    solo: toma los metadatos y la página de la sección que abren y se completa con su
+    contenido, igual que un fragmento menor a `min_tokens`, que se llena con el inicio del
+    párrafo siguiente hasta `max_tokens`. Cuando un artículo no cabe en un solo fragmento,
+    cada fragmento de continuación empieza con los últimos `solapamiento` tokens del
+    anterior. Un último fragmento menor a `min_tokens` se une al anterior si ambos caben en
+    `max_tokens`.
+
+    Parameters
+    ----------
+    texto : str
+        Texto completo del documento (por ejemplo, la salida de `extraer_con_tablas_rapido()`),
+        con las páginas separadas por `SALTO_DE_PAGINA` si se quiere conocer la página.
+    max_tokens : int
+        Tamaño máximo de un fragmento, en tokens (por defecto: 160).
+    min_tokens : int
+        Tamaño mínimo de un fragmento, en tokens (por defecto: 40).
+    solapamiento : int
+        Tokens del fragmento anterior que se repiten al inicio del siguiente dentro de
+        un mismo artículo (por defecto: 24).
+    contar : callable
+        Función que cuenta tokens (por defecto: `contar_tokens()`).
+
+    Returns
+    -------
+    list[dict]
+        Fragmentos en orden, cada uno con las claves:
+        - "texto": contenido del fragmento.
+        - "metadata": dict con "titulo", "capitulo", "seccion", "articulo" o "anexo"
+          según la sección donde inicia el fragmento (solo las claves presentes), y
+          "pagina" donde inicia el fragmento.
+        - "tokens": número de tokens del fragmento.
+    """
+    if not 0 < min_tokens <= max_tokens:
+        raise ValueError("Se requiere 0 < min_tokens <= max_tokens.")
+    if not 0 <= solapamiento < max_tokens:
+        raise ValueError("Se requiere 0 <= solapamiento < max_tokens.")
+
+    fragmentos = []
+    actual, tokens_actual, metadata_actual, pagina_actual = [], 0, {}, 1
+    solo_encabezados = False
+
+    def cerrar():
+        nonlocal actual, tokens_actual
+        if actual:
+            texto_fragmento = " ".join(actual)
+            fragmentos.append({
+                "texto": texto_fragmento,
+                "metadata": {**metadata_actual, "pagina": pagina_actual},
+                "tokens": tokens_actual,
+            })
+        actual, tokens_actual = [], 0
+
+    for parrafo, metadata, inicio_seccion, pagina in _parrafos(texto):
+        if inicio_seccion and solo_encabezados:
+            # El fragmento en curso solo tiene encabezados: pertenece a la sección que abre
+            metadata_actual, pagina_actual = metadata, pagina
+        elif inicio_seccion and tokens_actual >= min_tokens:
+            cerrar()
+        piezas = _partir_largo(parrafo, max_tokens, contar)
+        while piezas:
+            pieza = piezas.pop(0)
+            tokens_pieza = contar(pieza)
+            if actual and tokens_actual + tokens_pieza > max_tokens:
+                restante = max_tokens - tokens_actual
+                if (solo_encabezados or tokens_actual < min_tokens) and restante > 0:
+                    # El fragmento no se cierra incompleto: toma el inicio de la pieza y deja el resto
+                    partes = _partir_largo(pieza, restante, contar)
+                    if contar(partes[0]) <= restante:
+                        pieza, piezas[:0] = partes[0], partes[1:]
+                        tokens_pieza = contar(pieza)
+            if actual and tokens_actual + tokens_pieza > max_tokens:
+                anterior = " ".join(actual)
+                cerrar()
+                cola = _cola(anterior, solapamiento, contar) if metadata == metadata_actual else ""
+                if cola and contar(cola) + tokens_pieza <= max_tokens:
+                    actual, tokens_actual, pagina_actual = [cola], contar(cola), pagina
+                    solo_encabezados = False
+            if not actual:
+                metadata_actual, pagina_actual = metadata, pagina
+                solo_encabezados = True
+            solo_encabezados = solo_encabezados and _es_encabezado(pieza, bool(actual), contar)
+            actual.append(pieza)
+            tokens_actual += tokens_pieza
+    cerrar()
+
+    if len(fragmentos) > 1 and fragmentos[-1]["tokens"] < min_tokens:
+        ultimo = fragmentos[-1]
+        previo = fragmentos[-2]
+        if previo["tokens"] + ultimo["tokens"] <= max_tokens:
+            previo["texto"] += " " + ultimo["texto"]
+            previo["tokens"] += ultimo["tokens"]
+            fragmentos.pop()
+
+    return fragmentos
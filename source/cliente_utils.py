@@ -0,0 +1,212 @@
+"""
+Descripción
+===========
+
+Este módulo es el cliente HTTP del servicio de `api.py`, usado por la app de Streamlit.
+
+Las solicitudes de OCR, JSON y respuesta se envían al servicio, que las encola y devuelve el
+ID de un trabajo; el cliente espera el resultado consultando su estado (con espera en el
+servidor para no sondear de más). Si el servicio responde 429 (cola llena) o 503 (iniciando o
+deteniéndose), el cliente espera lo que indique `Retry-After` y reintenta, hasta `tiempo_max`.
+
+Funciones
+===========
+
+"""
+
+import time
+import httpx
+from source.config_loader import get_api_config
+
+# Segundos que el servidor retiene cada consulta de estado mientras el trabajo no termina
+ESPERA_SERVIDOR = 10
+
+
+class ErrorServicio(RuntimeError):
+    """El servicio no aceptó la solicitud a tiempo o el trabajo terminó con error."""
+
+
+class ClienteAPI:
+    """
+    Cliente del servicio HTTP de OCR, generación de JSON y respuestas.
+
+    Parameters
+    ----------
+    url : str
+        Dirección del servicio (por ejemplo, "http://127.0.0.1:8000").
+    intervalo_sondeo : float
+        Segundos entre consultas del estado de un trabajo.
+    tiempo_max : float
+        Segundos máximos de espera por solicitud, incluidos los reintentos por cola llena.
+    """
+
+    def __init__(self, url="http://127.0.0.1:8000", intervalo_sondeo=0.5, tiempo_max=300):
+        self.url = url.rstrip("/")
+        self.intervalo_sondeo = intervalo_sondeo
+        self.tiempo_max = tiempo_max
+        self._http = httpx.Client(base_url=self.url, timeout=httpx.Timeout(tiempo_max, connect=5))
+
+    @classmethod
+    def desde_config(cls):
+        """
+        Construye el cliente con la sección `api` de config.yaml.
+
+        Returns
+        -------
+        ClienteAPI
+            Cliente listo para usarse.
+        """
+        config = get_api_config()
+        return cls(url=config["url"], intervalo_sondeo=config["intervalo_sondeo"], tiempo_max=config["tiempo_max"])
+
+    def _con_reintentos(self, enviar):
+        """Ejecuta `enviar()` hasta que el servicio no responda 429 ni 503, o se agote `tiempo_max`."""
+        limite = time.monotonic() + self.tiempo_max
+        while True:
+            respuesta = enviar()
+            if respuesta.status_code not in (429, 503):
+                return respuesta
+            espera = float(respuesta.headers.get("Retry-After", 1))
+            respuesta.close()
+            if time.monotonic() + espera > limite:
+                raise ErrorServicio(f"El servicio sigue ocupado después de {self.tiempo_max} s.")
+            time.sleep(espera)
+
+    def enviar(self, ruta, **kwargs):
+        """
+        Envía una solicitud que el servicio encola y devuelve el trabajo creado.
+
+        Parameters
+        ----------
+        ruta : str
+            Ruta del servicio (por ejemplo, "/solicitudes").
+        **kwargs
+            Argumentos de `httpx.Client.post` (`files` o `json`).
+
+        Returns
+        -------
+        dict
+            Estado inicial del trabajo (ver `Trabajo.como_dict()`).
+        """
+        respuesta = self._con_reintentos(lambda: self._http.post(ruta, **kwargs))
+        respuesta.raise_for_status()
+        return respuesta.json()
+
+    def trabajo(self, id_trabajo, espera=0):
+        """
+        Consulta el estado de un trabajo.
+
+        Parameters
+        ----------
+        id_trabajo : str
+            ID del trabajo.
+        espera : float
+            Segundos que el servidor puede retener la consulta mientras el trabajo no termina.
+
+        Returns
+        -------
+        dict
+            Estado del trabajo (ver `Trabajo.como_dict()`).
+        """
+        respuesta = self._http.get(f"/trabajos/{id_trabajo}", params={"espera": espera})
+        respuesta.raise_for_status()
+        return respuesta.json()
+
+    def esperar(self, trabajo):
+        """
+        Espera a que un trabajo termine.
+
+        Parameters
+        ----------
+        trabajo : dict
+            Trabajo devuelto por `enviar()`.
+
+        Returns
+        -------
+        dict
+            Estado final del trabajo, con "resultado" y "traza".
+
+        Raises
+        ------
+        ErrorServicio
+            Si el trabajo termina con error, se cancela o no termina en `tiempo_max` segundos.
+        """
+        limite = time.monotonic() + self.tiempo_max
+        while trabajo["estado"] not in ("completado", "cancelado", "error"):
+            if time.monotonic() > limite:
+                raise ErrorServicio(f"El trabajo {trabajo['id']} no terminó en {self.tiempo_max} s.")
+            time.sleep(self.intervalo_sondeo)
+            trabajo = self.trabajo(trabajo["id"], espera=ESPERA_SERVIDOR)
+        if trabajo["estado"] == "error":
+            raise ErrorServicio(f"El trabajo {trabajo['id']} falló: {trabajo['error']}")
+        if trabajo["estado"] == "cancelado":
+            raise ErrorServicio(f"El trabajo {trabajo['id']} se canceló.")
+        return trabajo
+
+    def procesar_solicitud(self, contenido, nombre="solicitud"):
+        """
+        OCR y generación del JSON de una imagen o PDF.
+
+        Parameters
+        ----------
+        contenido : bytes
+            Contenido del archivo.
+        nombre : str
+            Nombre del archivo.
+
+        Returns
+        -------
+        dict
+            Trabajo terminado; "resultado" contiene "ocr" y "json_correo".
+        """
+        return self.esperar(self.enviar("/solicitudes", files={"archivo": (nombre, contenido)}))
+
+    def responder(self, json_correo, model="gpt-3.5-turbo", k=None):
+        """
+        Respuesta normativa de un JSON de solicitud.
+
+        Returns
+        -------
+        dict
+            Trabajo terminado; "resultado" contiene "respuesta" y "metricas".
+        """
+        return self.esperar(self.enviar("/respuestas", json={"json_correo": json_correo, "model": model, "k": k}))
+
+    def responder_stream(self, json_correo, model="gpt-3.5-turbo", k=None, metricas=None):
+        """
+        Respuesta normativa transmitida por partes conforme el servicio la genera.
+
+        Parameters
+        ----------
+        json_correo : dict
+            Diccionario con las claves: 'origen', 'titulo', 'mensaje'.
+        model : str
+            Modelo de lenguaje a utilizar (por defecto: gpt-3.5-turbo).
+        k : int, optional
+            Número de fragmentos a recuperar.
+        metricas : dict, optional
+            Si se proporciona, se llena con "trabajo" (ID para consultar la traza),
+            "primer_token_segundos" y "generacion_segundos", medidos desde el cliente.
+
+        Yields
+        ------
+        str
+            Fragmentos de la respuesta.
+        """
+        inicio = time.perf_counter()
+        cuerpo = {"json_correo": json_correo, "model": model, "k": k}
+        respuesta = self._con_reintentos(
+            lambda: self._http.send(self._http.build_request("POST", "/respuestas/stream", json=cuerpo), stream=True)
+        )
+        try:
+            respuesta.raise_for_status()
+            if metricas is not None:
+                metricas["trabajo"] = respuesta.headers.get("X-Trabajo-Id")
+            for fragmento in respuesta.iter_text():
+                if metricas is not None and "primer_token_segundos" not in metricas:
+                    metricas["primer_token_segundos"] = time.perf_counter() - inicio
+                yield fragmento
+        finally:
+            respuesta.close()
+        if metricas is not None:
+            metricas["generacion_segundos"] = time.perf_counter() - inicio
@@ -0,0 +1,341 @@
+"""
+Descripción
+===========
+
+Este módulo implementa la cola de trabajos del servicio HTTP (`api.py`).
+
+Cada solicitud se convierte en un `Trabajo` que espera en una cola acotada hasta que lo toma
+uno de los hilos de trabajo. Todos los hilos viven en el mismo proceso, así que comparten los
+clientes ya inicializados de Textract y OpenAI, el servicio de embeddings y la colección de
+ChromaDB. Cuando la cola está llena, `enviar()` lanza `ColaLlena` en lugar de bloquear, para
+que el servicio responda de inmediato con 429 y el cliente reintente más tarde.
+
+Los trabajos terminados se conservan (hasta `max_resultados`) para que el cliente consulte su
+estado. Si la función de un trabajo devuelve un generador, sus fragmentos se reenvían conforme
+se producen, lo que permite transmitir la respuesta del LLM mientras se genera.
+
+Funciones
+===========
+
+"""
+
+import time
+import uuid
+import queue
+import inspect
+import logging
+import threading
+from collections import OrderedDict
+from source.config_loader import get_api_config
+from source.trazas_utils import traza
+
+logger = logging.getLogger(__name__)
+
+# Marca el final de los fragmentos de un trabajo que transmite su resultado
+_FIN = object()
+
+# Segundos que un hilo de trabajo espera un trabajo antes de revisar si debe detenerse
+ESPERA_TRABAJO = 0.2
+
+
+class ColaLlena(RuntimeError):
+    """La cola tiene `max_pendientes` trabajos en espera."""
+
+
+class ColaDetenida(RuntimeError):
+    """La cola no está aceptando trabajos (no se ha iniciado o se está deteniendo)."""
+
+
+class Trabajo:
+    """
+    Unidad de trabajo de la cola y su estado.
+
+    Parameters
+    ----------
+    tipo : str
+        Nombre del trabajo (por ejemplo, "ocr" o "respuesta"); también nombra su traza.
+    funcion : callable
+        Función a ejecutar. Si devuelve un generador, sus fragmentos se transmiten con
+        `fragmentos()` y el resultado es el texto concatenado.
+    args, kwargs
+        Argumentos de `funcion`.
+    """
+
+    def __init__(self, tipo, funcion, args=(), kwargs=None):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.funcion = funcion
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.estado = "pendiente"
+        self.resultado = None
+        self.error = None
+        self.traza = None
+        self.creado = time.time()
+        self.inicio = None
+        self.fin = None
+        self.terminado = threading.Event()
+        self.cancelado = threading.Event()
+        self._fragmentos = queue.Queue()
+
+    def ejecutar(self):
+        """Ejecuta la función dentro de una traza y registra el resultado o el error."""
+        self.estado = "en_proceso"
+        self.inicio = time.time()
+        actual = None
+        try:
+            with traza(self.tipo, id=self.id) as actual:
+                resultado = self.funcion(*self.args, **self.kwargs)
+                if inspect.isgenerator(resultado):
+                    partes = []
+                    for fragmento in resultado:
+                        # Si nadie lee los fragmentos se deja de generar (y de acumularlos)
+                        if self.cancelado.is_set():
+                            resultado.close()
+                            break
+                        partes.append(fragmento)
+                        self._fragmentos.put(fragmento)
+                    resultado = "".join(partes)
+            self.resultado = resultado
+            self.estado = "cancelado" if self.cancelado.is_set() else "completado"
+        except Exception as e:
+            logger.exception("Error en el trabajo %s (%s)", self.id, self.tipo)
+            self.error = str(e)
+            self.estado = "error"
+        self.traza = actual.resumen() if actual else None
+        self.fin = time.time()
+        self._fragmentos.put(_FIN)
+        self.terminado.set()
+
+    def cancelar(self):
+        """Pide detener un trabajo que transmite su resultado; se atiende entre fragmentos."""
+        if not self.terminado.is_set():
+            self.cancelado.set()
+
+    def fragmentos(self):
+        """
+        Fragmentos que produce el trabajo, conforme se generan.
+
+        Si el lector deja de consumirlos antes del final (por ejemplo, porque el cliente cerró
+        la conexión), el trabajo se cancela.
+
+        Yields
+        ------
+        str
+            Fragmento del resultado.
+
+        Raises
+        ------
+        RuntimeError
+            Si el trabajo termina con error.
+        """
+        completo = False
+        try:
+            while True:
+                fragmento = self._fragmentos.get()
+                if fragmento is _FIN:
+                    completo = True
+                    break
+                yield fragmento
+        finally:
+            if not completo:
+                self.cancelar()
+        if self.estado == "error":
+            raise RuntimeError(self.error)
+
+    def como_dict(self):
+        """
+        Estado del trabajo en un formato serializable a JSON.
+
+        Returns
+        -------
+        dict
+            "id", "tipo", "estado" ("pendiente", "en_proceso", "completado", "cancelado" o
+            "error"),
+            "resultado", "error", "segundos_en_cola", "segundos" y "traza" (resumen por etapa).
+        """
+        return {
+            "id": self.id,
+            "tipo": self.tipo,
+            "estado": self.estado,
+            "resultado": self.resultado,
+            "error": self.error,
+            "segundos_en_cola": (self.inicio or time.time()) - self.creado,
+            "segundos": (self.fin or time.time()) - self.inicio if self.inicio else None,
+            "traza": self.traza,
+        }
+
+
+class ColaTrabajos:
+    """
+    Cola acotada de trabajos atendida por un grupo de hilos.
+
+    Parameters
+    ----------
+    trabajadores : int
+        Hilos que ejecutan trabajos al mismo tiempo.
+    max_pendientes : int
+        Trabajos en espera a partir de los cuales `enviar()` lanza `ColaLlena`.
+    max_resultados : int
+        Trabajos terminados que se conservan para consultar su estado (los más antiguos se
+        descartan primero).
+    """
+
+    def __init__(self, trabajadores=4, max_pendientes=32, max_resultados=1000):
+        self.trabajadores = trabajadores
+        self.max_pendientes = max_pendientes
+        self.max_resultados = max_resultados
+        self._cola = queue.Queue(maxsize=max_pendientes)
+        self._trabajos = OrderedDict()
+        self._lock = threading.Lock()
+        self._hilos = []
+        self._activa = False
+        self._detener = threading.Event()
+        self._contadores = {"completados": 0, "errores": 0, "rechazados": 0}
+
+    @classmethod
+    def desde_config(cls):
+        """
+        Construye la cola con la sección `api` de config.yaml.
+
+        Returns
+        -------
+        ColaTrabajos
+            Cola sin iniciar.
+        """
+        config = get_api_config()
+        return cls(
+            trabajadores=config["trabajadores"],
+            max_pendientes=config["max_pendientes"],
+            max_resultados=config["max_resultados"],
+        )
+
+    def iniciar(self):
+        """Arranca los hilos de trabajo."""
+        with self._lock:
+            if self._activa:
+                return
+            self._activa = True
+        self._detener.clear()
+        self._hilos = [
+            threading.Thread(target=self._trabajar, name=f"trabajador-{i}", daemon=True)
+            for i in range(self.trabajadores)
+        ]
+        for hilo in self._hilos:
+            hilo.start()
+
+    def detener(self, timeout=None):
+        """
+        Deja de aceptar trabajos y espera a que los hilos terminen los que ya están en la cola.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Segundos máximos de espera en total.
+        """
+        with self._lock:
+            self._activa = False
+            hilos, self._hilos = self._hilos, []
+        # Los hilos terminan al encontrar la cola vacía con la señal puesta; no se encolan
+        # marcas de fin, que bloquearían si la cola estuviera llena
+        self._detener.set()
+        limite = None if timeout is None else time.monotonic() + timeout
+        for hilo in hilos:
+            hilo.join(None if limite is None else max(0.0, limite - time.monotonic()))
+
+    def enviar(self, tipo, funcion, *args, **kwargs):
+        """
+        Agrega un trabajo a la cola sin bloquear.
+
+        Parameters
+        ----------
+        tipo : str
+            Nombre del trabajo.
+        funcion : callable
+            Función a ejecutar con `*args` y `**kwargs`.
+
+        Returns
+        -------
+        Trabajo
+            Trabajo en estado "pendiente".
+
+        Raises
+        ------
+        ColaDetenida
+            Si la cola no se ha iniciado o se está deteniendo.
+        ColaLlena
+            Si ya hay `max_pendientes` trabajos en espera.
+        """
+        trabajo = Trabajo(tipo, funcion, args, kwargs)
+        with self._lock:
+            # Se revisa junto con el encolado para que `detener()` no pierda trabajos nuevos
+            if not self._activa:
+                raise ColaDetenida("La cola de trabajos no está activa.")
+            try:
+                self._cola.put_nowait(trabajo)
+            except queue.Full:
+                self._contadores["rechazados"] += 1
+                raise ColaLlena(f"Hay {self.max_pendientes} trabajos en espera; intenta más tarde.") from None
+            self._trabajos[trabajo.id] = trabajo
+            self._descartar_terminados()
+        return trabajo
+
+    def obtener(self, id_trabajo):
+        """
+        Busca un trabajo por su ID.
+
+        Parameters
+        ----------
+        id_trabajo : str
+            ID devuelto por `enviar()`.
+
+        Returns
+        -------
+        Trabajo or None
+            El trabajo, o None si no existe o ya se descartó.
+        """
+        with self._lock:
+            return self._trabajos.get(id_trabajo)
+
+    def estadisticas(self):
+        """
+        Estado de la cola.
+
+        Returns
+        -------
+        dict
+            "activa", "trabajadores", "pendientes", "max_pendientes", "en_proceso",
+            "completados", "errores" y "rechazados" (trabajos que no cupieron en la cola).
+        """
+        with self._lock:
+            en_proceso = sum(t.estado == "en_proceso" for t in self._trabajos.values())
+            return {
+                "activa": self._activa,
+                "trabajadores": len(self._hilos),
+                "pendientes": self._cola.qsize(),
+                "max_pendientes": self.max_pendientes,
+                "en_proceso": en_proceso,
+                **self._contadores,
+            }
+
+    def _descartar_terminados(self):
+        """Descarta los trabajos terminados más antiguos por encima de `max_resultados`."""
+        exceso = len(self._trabajos) - self.max_resultados
+        if exceso <= 0:
+            return
+        for id_trabajo in [i for i, t in self._trabajos.items() if t.terminado.is_set()][:exceso]:
+            del self._trabajos[id_trabajo]
+
+    def _trabajar(self):
+        """Hilo de trabajo: ejecuta trabajos hasta que la cola se vacía después de `detener()`."""
+        while True:
+            try:
+                trabajo = self._cola.get(timeout=ESPERA_TRABAJO)
+            except queue.Empty:
+                if self._detener.is_set():
+                    break
+                continue
+            trabajo.ejecutar()
+            with self._lock:
+                if trabajo.estado != "cancelado":
+                    self._contadores["completados" if trabajo.estado == "completado" else "errores"] += 1
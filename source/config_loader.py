@@ -6,19 +6,156 @@ Este módulo carga la configuración de credenciales y parámetros desde un arch
 y valida que estén presentes los campos necesarios para conectarse a servicios externos
 como AWS y OpenAI.
 
+El archivo se interpreta una sola vez y se vuelve a leer solo cuando cambia su fecha de
+modificación. Los clientes de Textract y OpenAI se comparten en todo el proceso y mantienen
+sus conexiones HTTP abiertas (keep-alive) entre llamadas.
+
 Funciones
 
 """
 
 import yaml
 import os
+import copy
+import asyncio
+import threading
+import weakref
+import boto3
+import httpx
+from botocore.config import Config
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+
+# Ruta del archivo de configuración; la variable de entorno FINALAI_CONFIG permite usar otro
+# (por ejemplo, el que genera `benchmark_suite.py` para los servidores simulados)
+CONFIG_PATH = os.environ.get("FINALAI_CONFIG", "config/config.yaml")
+
+# Conexiones HTTP que cada cliente mantiene abiertas para reutilizarlas entre solicitudes
+MAX_CONEXIONES = 20
+
+_config_cache = {}
+_clientes = {}
+# Clientes asíncronos por event loop; se descartan cuando el loop deja de existir
+_clientes_async = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+# Valores por defecto de la sección `app` cuando no existe config.yaml o falta alguna clave
+APP_DEFAULTS = {
+    "chroma_path": "chroma_data",
+    "collection_name": "normatividad",
+    "catalogo_path": "metadata/catalogo_normatividad.json",
+    "embedding_model": "all-MiniLM-L6-v2",
+}
+
+# Valores por defecto de la sección `embeddings`: backend ("torch" u "onnx"), archivo ONNX
+# (cuantizado a int8 si se indica), textos por micro-lote, espera para completarlo y
+# embeddings memorizados
+EMBEDDINGS_DEFAULTS = {
+    "backend": "torch",
+    "archivo_onnx": None,
+    "max_lote": 32,
+    "espera_ms": 2,
+    "max_cache": 10000,
+}
+
+# Valores por defecto de la sección `rag` (recuperación de fragmentos)
+RAG_DEFAULTS = {
+    "k": 5,
+    "hibrido": True,
+    "candidatos": 20,
+    "rrf_k": 60,
+    "rerank": False,
+    "rerank_modelo": "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+    "rerank_candidatos": 20,
+    "rerank_top_n": 3,
+    "rerank_batch_size": 16,
+}
+
+# Valores por defecto de la sección `contexto` (empaquetado de fragmentos en el prompt):
+# tokens de contexto por modelo y similitud a partir de la cual dos fragmentos son duplicados
+CONTEXTO_DEFAULTS = {
+    "presupuesto_tokens": {"gpt-3.5-turbo": 3000, "gpt-4": 6000},
+    "presupuesto_por_defecto": 3000,
+    "umbral_duplicados": 0.8,
+}
+
+# Valores por defecto de la sección `ortografia` (revisión local antes de corregir con el LLM)
+ORTOGRAFIA_DEFAULTS = {
+    "max_sospechosas_sin_llm": 0,
+    "umbral_confianza": 90,
+    "umbral_similitud": 0.6,
+}
+
+# Valores por defecto de la sección `anonimizacion`: nombres de personas que se eliminan y
+# patrones de datos personales {etiqueta: regex} que se agregan a los predeterminados
+ANONIMIZACION_DEFAULTS = {
+    "nombres": ["Juan Pérez", "María Ramírez", "José González"],
+    "patrones_pii": {},
+}
+
+# Valores por defecto de la sección `textract`: páginas de un PDF que se envían al mismo tiempo
+# y, para la API asíncrona, segundos entre consultas del estado y espera máxima por trabajo
+TEXTRACT_DEFAULTS = {
+    "hilos_por_documento": 4,
+    "intervalo_sondeo": 2,
+    "tiempo_max_trabajo": 600,
+}
+
+# Valores por defecto de la sección `trazas`: registro de tiempos, tokens y costo por etapa,
+# con los precios en USD por millón de tokens y por página de Textract
+TRAZAS_DEFAULTS = {
+    "habilitadas": True,
+    "log_json": True,
+    "precio_pagina_textract": 0.0015,
+    "precios": {
+        "gpt-3.5-turbo": {"entrada": 0.5, "salida": 1.5},
+        "gpt-4": {"entrada": 30.0, "salida": 60.0},
+    },
+}
+
+# Valores por defecto de la sección `api`: dirección del servicio HTTP (la usa app.py como
+# cliente), hilos de trabajo, trabajos en espera antes de rechazar con 429, trabajos
+# terminados que se conservan para consultar su estado y sondeo del cliente
+API_DEFAULTS = {
+    "url": "http://127.0.0.1:8000",
+    "trabajadores": 4,
+    "max_pendientes": 32,
+    "max_resultados": 1000,
+    "intervalo_sondeo": 0.5,
+    "tiempo_max": 300,
+}
+
+# Valores por defecto de la sección `cache` (caché en disco de OCR y LLM)
+CACHE_DEFAULTS = {
+    "habilitada": True,
+    "path": "cache/resultados.sqlite",
+    "max_mb": 256,
+}
+
+# Valores por defecto de la sección `cache_semantica` (respuestas a preguntas casi idénticas)
+CACHE_SEMANTICA_DEFAULTS = {
+    "habilitada": True,
+    "umbral": 0.95,
+    "ttl_horas": 24,
+    "max_entradas": 1000,
+}
 
-CONFIG_PATH = "config/config.yaml"
+# Límites por etapa del flujo asíncrono: solicitudes simultáneas y solicitudes por segundo
+# (0 = sin límite de tasa)
+CONCURRENCIA_DEFAULTS = {
+    "textract": {"max_concurrencia": 8, "por_segundo": 5},
+    "ortografia": {"max_concurrencia": 4, "por_segundo": 3},
+    "chroma": {"max_concurrencia": 4, "por_segundo": 0},
+    "respuesta": {"max_concurrencia": 4, "por_segundo": 3},
+}
 
 
 def cargar_config(path=CONFIG_PATH):
     """
     Carga la configuración desde un archivo YAML.
+
+    El resultado se guarda en memoria y solo se vuelve a interpretar el archivo cuando cambia
+    su fecha de modificación, por lo que llamar a esta función en cada solicitud es barato.
+
     Parameters
     ----------
     path : str
@@ -31,8 +168,15 @@ def cargar_config(path=CONFIG_PATH):
     """
     if not os.path.exists(path):
         raise FileNotFoundError(f"Archivo de configuración no encontrado: {path}")
-    with open(path, "r") as f:
-        return yaml.safe_load(f)
+    mtime = os.path.getmtime(path)
+    with _lock:
+        cache = _config_cache.get(path)
+        if cache is None or cache[0] != mtime:
+            with open(path, "r") as f:
+                cache = (mtime, yaml.safe_load(f))
+            _config_cache[path] = cache
+    # Copia para que quien llame no modifique la configuración compartida
+    return copy.deepcopy(cache[1])
 
 
 def get_aws_credentials():
@@ -77,3 +221,405 @@ def get_openai_key():
         raise ValueError("Falta la clave de OpenAI en config.yaml")
 
     return openai_conf["api_key"]
+
+
+def get_openai_base_url():
+    """
+    Obtiene la URL base de la API de OpenAI (`openai.base_url`), si está configurada.
+
+    Returns
+    -------
+    str or None
+        URL base (por ejemplo, la de un servidor simulado) o None para usar la de OpenAI.
+    """
+    return (cargar_config().get("openai") or {}).get("base_url")
+
+
+def get_app_config(path=CONFIG_PATH):
+    """
+    Obtiene los parámetros de la aplicación (sección `app` del archivo de configuración).
+
+    A diferencia de las credenciales, estos parámetros tienen valores por defecto, por lo que
+    no es necesario que exista `config.yaml` para importar y probar los módulos.
+
+    Parameters
+    ----------
+    path : str
+        Ruta al archivo de configuración (por defecto: "config/config.yaml").
+
+    Returns
+    -------
+    dict
+        Diccionario con al menos las claves `chroma_path`, `collection_name`, `catalogo_path`
+        y `embedding_model`.
+    """
+    return _seccion_con_defaults("app", APP_DEFAULTS, path)
+
+
+def get_embeddings_config(path=CONFIG_PATH):
+    """
+    Obtiene los parámetros del servicio de embeddings (sección `embeddings`).
+
+    El modelo se toma de `embedding_model` de la sección `app`, para que la indexación y la
+    consulta usen siempre el mismo.
+
+    Parameters
+    ----------
+    path : str
+        Ruta al archivo de configuración (por defecto: "config/config.yaml").
+
+    Returns
+    -------
+    dict
+        Diccionario con las claves `backend`, `archivo_onnx`, `max_lote`, `espera_ms` y
+        `max_cache`.
+    """
+    return _seccion_con_defaults("embeddings", EMBEDDINGS_DEFAULTS, path)
+
+
+def get_rag_config(path=CONFIG_PATH):
+    """
+    Obtiene los parámetros de recuperación (sección `rag` del archivo de configuración).
+
+    Parameters
+    ----------
+    path : str
+        Ruta al archivo de configuración (por defecto: "config/config.yaml").
+
+    Returns
+    -------
+    dict
+        Diccionario con las claves `k` (fragmentos enviados al LLM), `hibrido` (combinar
+        búsqueda vectorial y BM25), `candidatos` (resultados de cada búsqueda antes de
+        fusionar), `rrf_k` (constante de la fusión por rango recíproco) y los parámetros del
+        re-ranking con cross-encoder: `rerank` (habilitarlo), `rerank_modelo`,
+        `rerank_candidatos` (fragmentos evaluados), `rerank_top_n` (fragmentos conservados)
+        y `rerank_batch_size`.
+    """
+    return _seccion_con_defaults("rag", RAG_DEFAULTS, path)
+
+
+def get_contexto_config(path=CONFIG_PATH):
+    """
+    Obtiene los parámetros del empaquetado de contexto (sección `contexto`).
+
+    Parameters
+    ----------
+    path : str
+        Ruta al archivo de configuración (por defecto: "config/config.yaml").
+
+    Returns
+    -------
+    dict
+        Diccionario con las claves `presupuesto_tokens` ({modelo: tokens}),
+        `presupuesto_por_defecto` (modelos sin presupuesto propio) y `umbral_duplicados`
+        (similitud de Jaccard entre fragmentos a partir de la cual se descarta uno).
+    """
+    contexto = _seccion_con_defaults("contexto", CONTEXTO_DEFAULTS, path)
+    contexto["presupuesto_tokens"] = {**CONTEXTO_DEFAULTS["presupuesto_tokens"], **contexto["presupuesto_tokens"]}
+    return contexto
+
+
+def get_ortografia_config(path=CONFIG_PATH):
+    """
+    Obtiene los parámetros de la revisión ortográfica local (sección `ortografia`).
+
+    Parameters
+    ----------
+    path : str
+        Ruta al archivo de configuración (por defecto: "config/config.yaml").
+
+    Returns
+    -------
+    dict
+        Diccionario con las claves `max_sospechosas_sin_llm` (palabras sospechosas toleradas
+        sin llamar al LLM), `umbral_confianza` (confianza de Textract, de 0 a 100, debajo de
+        la cual una palabra es sospechosa) y `umbral_similitud` (similitud mínima entre una
+        oración y su corrección para aceptarla).
+    """
+    return _seccion_con_defaults("ortografia", ORTOGRAFIA_DEFAULTS, path)
+
+
+def get_anonimizacion_config(path=CONFIG_PATH):
+    """
+    Obtiene el diccionario de datos personales a anonimizar (sección `anonimizacion`).
+
+    Parameters
+    ----------
+    path : str
+        Ruta al archivo de configuración (por defecto: "config/config.yaml").
+
+    Returns
+    -------
+    dict
+        Diccionario con las claves `nombres` (lista de nombres a eliminar) y `patrones_pii`
+        ({etiqueta: expresión regular} adicionales a los de `anonimizacion_utils`).
+    """
+    return _seccion_con_defaults("anonimizacion", ANONIMIZACION_DEFAULTS, path)
+
+
+def get_textract_config(path=CONFIG_PATH):
+    """
+    Obtiene los parámetros de la extracción de texto con Textract (sección `textract`).
+
+    Parameters
+    ----------
+    path : str
+        Ruta al archivo de configuración (por defecto: "config/config.yaml").
+
+    Returns
+    -------
+    dict
+        Diccionario con las claves `hilos_por_documento` (páginas de un PDF que se envían al
+        mismo tiempo), `intervalo_sondeo` y `tiempo_max_trabajo` (segundos entre consultas y
+        espera máxima de un trabajo asíncrono).
+    """
+    return _seccion_con_defaults("textract", TEXTRACT_DEFAULTS, path)
+
+
+def get_trazas_config(path=CONFIG_PATH):
+    """
+    Obtiene la configuración de las trazas por etapa (sección `trazas`).
+
+    Los precios del archivo se combinan con los de `TRAZAS_DEFAULTS`, de modo que basta con
+    indicar los modelos que cambian.
+
+    Parameters
+    ----------
+    path : str
+        Ruta al archivo de configuración (por defecto: "config/config.yaml").
+
+    Returns
+    -------
+    dict
+        Diccionario con las claves `habilitadas`, `log_json`, `precio_pagina_textract` y
+        `precios` ({modelo: {"entrada", "salida"}}).
+    """
+    trazas = _seccion_con_defaults("trazas", TRAZAS_DEFAULTS, path)
+    trazas["precios"] = {**TRAZAS_DEFAULTS["precios"], **trazas["precios"]}
+    return trazas
+
+
+def get_api_config(path=CONFIG_PATH):
+    """
+    Obtiene la configuración del servicio HTTP y su cola de trabajos (sección `api`).
+
+    Parameters
+    ----------
+    path : str
+        Ruta al archivo de configuración (por defecto: "config/config.yaml").
+
+    Returns
+    -------
+    dict
+        Diccionario con las claves `url`, `trabajadores`, `max_pendientes`, `max_resultados`,
+        `intervalo_sondeo` y `tiempo_max` (segundos que el cliente espera un trabajo).
+    """
+    return _seccion_con_defaults("api", API_DEFAULTS, path)
+
+
+def get_cache_config(path=CONFIG_PATH):
+    """
+    Obtiene los parámetros de la caché en disco (sección `cache` del archivo de configuración).
+
+    Parameters
+    ----------
+    path : str
+        Ruta al archivo de configuración (por defecto: "config/config.yaml").
+
+    Returns
+    -------
+    dict
+        Diccionario con las claves `habilitada`, `path` y `max_mb`.
+    """
+    return _seccion_con_defaults("cache", CACHE_DEFAULTS, path)
+
+
+def get_cache_semantica_config(path=CONFIG_PATH):
+    """
+    Obtiene los parámetros de la caché semántica de respuestas (sección `cache_semantica`).
+
+    Parameters
+    ----------
+    path : str
+        Ruta al archivo de configuración (por defecto: "config/config.yaml").
+
+    Returns
+    -------
+    dict
+        Diccionario con las claves `habilitada`, `umbral`, `ttl_horas` y `max_entradas`.
+    """
+    return _seccion_con_defaults("cache_semantica", CACHE_SEMANTICA_DEFAULTS, path)
+
+
+def get_concurrencia_config(path=CONFIG_PATH):
+    """
+    Obtiene los límites por etapa del flujo asíncrono (sección `concurrencia`).
+
+    Parameters
+    ----------
+    path : str
+        Ruta al archivo de configuración (por defecto: "config/config.yaml").
+
+    Returns
+    -------
+    dict
+        {etapa: {"max_concurrencia": int, "por_segundo": float}} para las etapas
+        `textract`, `ortografia`, `chroma` y `respuesta`.
+    """
+    limites = _seccion_con_defaults("concurrencia", CONCURRENCIA_DEFAULTS, path)
+    return {etapa: {**CONCURRENCIA_DEFAULTS.get(etapa, {}), **valores} for etapa, valores in limites.items()}
+
+
+def _seccion_con_defaults(seccion, defaults, path):
+    """
+    Combina una sección del archivo de configuración con sus valores por defecto.
+
+    Parameters
+    ----------
+    seccion : str
+        Nombre de la sección en config.yaml.
+    defaults : dict
+        Valores por defecto de la sección.
+    path : str
+        Ruta al archivo de configuración; si no existe se usan solo los valores por defecto.
+
+    Returns
+    -------
+    dict
+        Copia de `defaults` actualizada con los valores del archivo.
+    """
+    valores = copy.deepcopy(defaults)
+    if os.path.exists(path):
+        valores.update((cargar_config(path) or {}).get(seccion) or {})
+    return valores
+
+
+def get_textract_client():
+    """
+    Devuelve el cliente de Amazon Textract compartido por el proceso.
+
+    El cliente se crea una sola vez por juego de credenciales, con un pool de conexiones y
+    keep-alive de TCP. Si cambian las credenciales (o `aws.endpoint_url`, que permite apuntar
+    a un servidor simulado) en config.yaml se crea un cliente nuevo.
+    Los clientes de boto3 son seguros para usarse desde varios hilos; los reintentos en modo
+    adaptativo limitan la tasa de envío cuando Textract responde con throttling.
+
+    Returns
+    -------
+    botocore.client.Textract
+        Cliente de Textract listo para usarse.
+    """
+    credenciales = get_aws_credentials()
+    endpoint_url = (cargar_config().get("aws") or {}).get("endpoint_url")
+    clave = ("textract", endpoint_url) + credenciales
+    with _lock:
+        cliente = _clientes.get(clave)
+        if cliente is None:
+            access_key, secret_key, region = credenciales
+            session = boto3.Session(
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                region_name=region
+            )
+            cliente = session.client(
+                "textract",
+                endpoint_url=endpoint_url,
+                config=Config(
+                    max_pool_connections=MAX_CONEXIONES,
+                    tcp_keepalive=True,
+                    retries={"max_attempts": 5, "mode": "adaptive"}
+                )
+            )
+            _clientes[clave] = cliente
+    return cliente
+
+
+def get_openai_client():
+    """
+    Devuelve el cliente de OpenAI compartido por el proceso.
+
+    El cliente se crea una sola vez por clave de API y reutiliza sus conexiones HTTP
+    (keep-alive) entre solicitudes. Si cambia la clave en config.yaml se crea un cliente nuevo.
+
+    Returns
+    -------
+    openai.OpenAI
+        Cliente de OpenAI listo para usarse.
+    """
+    api_key = get_openai_key()
+    base_url = get_openai_base_url()
+    clave = ("openai", api_key, base_url)
+    with _lock:
+        cliente = _clientes.get(clave)
+        if cliente is None:
+            cliente = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=DefaultHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONEXIONES,
+                        max_keepalive_connections=MAX_CONEXIONES,
+                        keepalive_expiry=60
+                    )
+                )
+            )
+            _clientes[clave] = cliente
+    return cliente
+
+
+def get_async_openai_client():
+    """
+    Devuelve el cliente asíncrono de OpenAI compartido por el event loop actual.
+
+    Las conexiones de un cliente asíncrono pertenecen al event loop que las abrió, por lo
+    que se mantiene un cliente por clave de API y por loop. Los clientes se guardan con una
+    referencia débil al loop, así que los de loops terminados (cada `asyncio.run`) se liberan
+    junto con el loop y nunca se entregan a otro. Debe llamarse desde una corrutina.
+
+    Returns
+    -------
+    openai.AsyncOpenAI
+        Cliente asíncrono de OpenAI listo para usarse.
+    """
+    api_key = get_openai_key()
+    base_url = get_openai_base_url()
+    loop = asyncio.get_running_loop()
+    clave = (api_key, base_url)
+    with _lock:
+        clientes_loop = _clientes_async.setdefault(loop, {})
+        cliente = clientes_loop.get(clave)
+        if cliente is None:
+            cliente = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                # Los reintentos los hace `async_utils.con_reintentos()`, que respeta los límites
+                max_retries=0,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONEXIONES,
+                        max_keepalive_connections=MAX_CONEXIONES,
+                        keepalive_expiry=60
+                    )
+                )
+            )
+            clientes_loop[clave] = cliente
+    return cliente
+
+
+async def cerrar_clientes_async():
+    """
+    Cierra los clientes asíncronos de OpenAI del event loop actual y sus conexiones.
+
+    Debe llamarse antes de que termine el loop (por ejemplo, al final de la corrutina que se
+    pasa a `asyncio.run`): las conexiones abiertas guardan una referencia al loop y, sin
+    cerrarlas, el cliente lo mantendría vivo.
+
+    Returns
+    -------
+    None
+    """
+    with _lock:
+        clientes_loop = _clientes_async.pop(asyncio.get_running_loop(), {})
+    for cliente in clientes_loop.values():
+        await cliente.close()
@@ -0,0 +1,252 @@
+"""
+Descripción
+===========
+
+Este módulo arma el contexto que se envía al LLM a partir de los fragmentos recuperados,
+respetando un presupuesto de tokens por modelo.
+
+Los fragmentos se toman en orden de relevancia. Se descartan los que repiten casi el mismo
+contenido que uno ya incluido (similitud de Jaccard sobre shingles de palabras), y cuando se
+incluye el fragmento siguiente de uno ya elegido se elimina el solapamiento que agrega el
+fragmentador y ambos se unen en un solo bloque. Los tokens se cuentan con `tiktoken`, con el
+mismo tokenizador que el modelo que recibirá el prompt, y se reporta cuántos se ahorraron.
+
+Con los `k` fragmentos que se recuperan por consulta la comparación exacta entre todos los
+pares es más barata que una firma MinHash y no tiene falsos positivos.
+
+Funciones
+===========
+
+"""
+
+import re
+import logging
+from functools import lru_cache
+import tiktoken
+from source.config_loader import get_contexto_config
+
+logger = logging.getLogger(__name__)
+
+SEPARADOR = "\n\n"
+PALABRA = re.compile(r"\w+")
+
+# Palabras de los shingles y máximo de palabras de solapamiento que se buscan entre fragmentos
+TAM_SHINGLE = 5
+MAX_PALABRAS_SOLAPAMIENTO = 64
+
+
+@lru_cache(maxsize=None)
+def _codificador(model):
+    """Tokenizador de `tiktoken` para el modelo, o cl100k_base si no lo conoce."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def contar_tokens_modelo(texto, model="gpt-3.5-turbo"):
+    """
+    Cuenta los tokens de un texto con el tokenizador del modelo.
+
+    Parameters
+    ----------
+    texto : str
+        Texto a medir.
+    model : str
+        Modelo de OpenAI (por defecto: "gpt-3.5-turbo").
+
+    Returns
+    -------
+    int
+        Número de tokens.
+    """
+    return len(_codificador(model).encode(texto, disallowed_special=()))
+
+
+def _shingles(texto, n=TAM_SHINGLE):
+    """
+    Obtiene los n-gramas de palabras de un texto, sin distinguir mayúsculas.
+
+    Parameters
+    ----------
+    texto : str
+        Texto del fragmento.
+    n : int
+        Palabras por shingle.
+
+    Returns
+    -------
+    set[tuple]
+        Shingles del texto (un solo shingle con todas las palabras si hay menos de `n`).
+    """
+    palabras = PALABRA.findall(texto.lower())
+    if len(palabras) <= n:
+        return {tuple(palabras)}
+    return {tuple(palabras[i:i + n]) for i in range(len(palabras) - n + 1)}
+
+
+def es_duplicado(shingles, otros, umbral):
+    """
+    Indica si un fragmento repite el contenido de otro.
+
+    Se considera duplicado si su similitud de Jaccard con `otros` alcanza `umbral`, o si
+    al menos esa proporción de sus shingles está contenida en `otros` (fragmento incluido
+    dentro de uno más largo).
+
+    Parameters
+    ----------
+    shingles : set
+        Shingles del fragmento candidato.
+    otros : set
+        Shingles de un fragmento ya incluido.
+    umbral : float
+        Similitud mínima, entre 0 y 1.
+
+    Returns
+    -------
+    bool
+        True si el candidato debe descartarse.
+    """
+    if not shingles or not otros:
+        return False
+    comunes = len(shingles & otros)
+    return comunes / len(shingles | otros) >= umbral or comunes / len(shingles) >= umbral
+
+
+def _recortar_solapamiento(previo, texto, max_palabras=MAX_PALABRAS_SOLAPAMIENTO):
+    """
+    Quita del inicio de `texto` las palabras que repiten el final de `previo`.
+
+    Parameters
+    ----------
+    previo : str
+        Texto del fragmento anterior.
+    texto : str
+        Texto del fragmento siguiente.
+    max_palabras : int
+        Longitud máxima del solapamiento que se busca.
+
+    Returns
+    -------
+    str
+        `texto` sin el solapamiento, o sin cambios si no lo hay.
+    """
+    palabras_previo = previo.split()
+    palabras = texto.split()
+    for n in range(min(max_palabras, len(palabras_previo), len(palabras) - 1), 2, -1):
+        if palabras_previo[-n:] == palabras[:n]:
+            return " ".join(palabras[n:])
+    return texto
+
+
+def _id_anterior(id_fragmento):
+    """ID del fragmento previo del mismo PDF ("archivo.pdf_3" → "archivo.pdf_2"), o None."""
+    archivo, _, indice = id_fragmento.rpartition("_")
+    if not archivo or not indice.isdigit() or int(indice) == 0:
+        return None
+    return f"{archivo}_{int(indice) - 1}"
+
+
+def presupuesto_para(model, config=None):
+    """
+    Obtiene el presupuesto de tokens de contexto de un modelo.
+
+    Parameters
+    ----------
+    model : str
+        Modelo de OpenAI.
+    config : dict, optional
+        Sección `contexto` (por defecto: `get_contexto_config()`).
+
+    Returns
+    -------
+    int
+        Tokens disponibles para los fragmentos en el prompt.
+    """
+    config = config or get_contexto_config()
+    return config["presupuesto_tokens"].get(model, config["presupuesto_por_defecto"])
+
+
+def empaquetar_contexto(fragmentos, model="gpt-3.5-turbo", presupuesto=None, umbral_duplicados=None):
+    """
+    Arma el contexto del prompt con los fragmentos más relevantes que caben en el presupuesto.
+
+    Los fragmentos se recorren de mayor a menor "score" (o en el orden recibido si no lo
+    tienen). Se omite cada fragmento duplicado de uno ya incluido; si el fragmento anterior
+    del mismo PDF ya se incluyó, se le quita el solapamiento y se une a su bloque; y si un
+    fragmento no cabe en los tokens restantes se prueba con los siguientes, más cortos.
+
+    Parameters
+    ----------
+    fragmentos : list[dict]
+        Fragmentos devueltos por `recuperar_fragmentos()` (claves "id", "texto", "metadata"
+        y, opcionalmente, "score").
+    model : str
+        Modelo que recibirá el prompt; determina el tokenizador y el presupuesto.
+    presupuesto : int, optional
+        Tokens máximos de contexto (por defecto: `presupuesto_tokens` de la sección `contexto`).
+    umbral_duplicados : float, optional
+        Similitud a partir de la cual se descarta un fragmento (por defecto: la de config.yaml).
+
+    Returns
+    -------
+    tuple (contexto:str, fuentes:set, estadisticas:dict)
+        Texto del contexto, nombres de archivo de los fragmentos incluidos y estadísticas con
+        las claves "fragmentos", "incluidos", "duplicados", "fuera_de_presupuesto",
+        "tokens_recuperados", "tokens_contexto" y "tokens_ahorrados".
+    """
+    config = get_contexto_config()
+    presupuesto = presupuesto if presupuesto is not None else presupuesto_para(model, config)
+    umbral = umbral_duplicados if umbral_duplicados is not None else config["umbral_duplicados"]
+    tokens_separador = contar_tokens_modelo(SEPARADOR, model)
+
+    ordenados = sorted(fragmentos, key=lambda f: f.get("score") or 0.0, reverse=True)
+    bloques = []
+    # ID del último fragmento de cada bloque → bloque, para unir continuaciones
+    por_ultimo_id = {}
+    incluidos_shingles = []
+    estadisticas = {"fragmentos": len(fragmentos), "incluidos": 0, "duplicados": 0,
+                    "fuera_de_presupuesto": 0, "tokens_recuperados": 0, "tokens_contexto": 0}
+
+    for fragmento in ordenados:
+        tokens_fragmento = contar_tokens_modelo(fragmento["texto"], model)
+        estadisticas["tokens_recuperados"] += tokens_fragmento
+
+        shingles = _shingles(fragmento["texto"])
+        if any(es_duplicado(shingles, otros, umbral) for otros in incluidos_shingles):
+            estadisticas["duplicados"] += 1
+            continue
+
+        bloque = por_ultimo_id.get(_id_anterior(fragmento.get("id") or ""))
+        texto = fragmento["texto"]
+        if bloque is not None:
+            texto = _recortar_solapamiento(bloque["texto"], texto)
+            costo = contar_tokens_modelo(" " + texto, model)
+        else:
+            costo = contar_tokens_modelo(texto, model) + (tokens_separador if bloques else 0)
+        if estadisticas["tokens_contexto"] + costo > presupuesto:
+            estadisticas["fuera_de_presupuesto"] += 1
+            continue
+
+        if bloque is not None:
+            bloque["texto"] += " " + texto
+            del por_ultimo_id[bloque["ultimo_id"]]
+        else:
+            bloque = {"texto": texto, "fuente": fragmento["metadata"].get("source", "Desconocido")}
+            bloques.append(bloque)
+        bloque["ultimo_id"] = fragmento.get("id")
+        if bloque["ultimo_id"]:
+            por_ultimo_id[bloque["ultimo_id"]] = bloque
+        incluidos_shingles.append(shingles)
+        estadisticas["incluidos"] += 1
+        estadisticas["tokens_contexto"] += costo
+
+    estadisticas["tokens_ahorrados"] = estadisticas["tokens_recuperados"] - estadisticas["tokens_contexto"]
+    logger.info(
+        "Contexto para %s: %d de %d fragmentos, %d tokens (%d ahorrados; %d duplicados, %d fuera de presupuesto).",
+        model, estadisticas["incluidos"], estadisticas["fragmentos"], estadisticas["tokens_contexto"],
+        estadisticas["tokens_ahorrados"], estadisticas["duplicados"], estadisticas["fuera_de_presupuesto"]
+    )
+    contexto = SEPARADOR.join(b["texto"] for b in bloques)
+    fuentes = set(b["fuente"] for b in bloques)
+    return contexto, fuentes, estadisticas
@@ -0,0 +1,332 @@
+"""
+Descripción
+===========
+
+Este módulo ofrece un servicio local de embeddings compartido por la indexación y la
+consulta de ChromaDB.
+
+El modelo de sentence-transformers se carga una sola vez por proceso. Las solicitudes que
+llegan al mismo tiempo desde varios hilos (la app, el procesamiento por lotes, el flujo
+asíncrono) se agrupan en micro-lotes que un hilo de trabajo calcula con una sola llamada a
+`encode`, y los embeddings de textos repetidos se memorizan en una caché LRU. Opcionalmente
+el modelo se ejecuta con ONNX Runtime en CPU, con los pesos cuantizados a int8.
+
+El servicio implementa la interfaz `EmbeddingFunction` de ChromaDB. El modelo y el backend
+con los que se indexó se guardan en los metadatos de la colección, y al abrirla para
+consultar se verifica que coincidan con los del servicio.
+
+Funciones
+===========
+
+"""
+
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+from source.config_loader import get_app_config, get_embeddings_config
+
+logger = logging.getLogger(__name__)
+
+# Modelo con el que se indexaban las colecciones antes de guardar el modelo en sus metadatos
+MODELO_HEREDADO = "all-MiniLM-L6-v2"
+
+
+class ErrorModeloEmbeddings(ValueError):
+    """La colección se indexó con un modelo de embeddings distinto al del servicio."""
+
+
+class _Solicitud:
+    """Textos pendientes de un llamador y el `Future` donde recibirá sus embeddings."""
+
+    def __init__(self, textos):
+        self.textos = textos
+        self.resultado = Future()
+
+
+class ServicioEmbeddings(EmbeddingFunction):
+    """
+    Calcula embeddings con un modelo cargado una vez, por micro-lotes y con memoización.
+
+    Parameters
+    ----------
+    modelo : str
+        Modelo de sentence-transformers (por ejemplo, "all-MiniLM-L6-v2").
+    backend : str
+        "torch" o "onnx" (ONNX Runtime en CPU).
+    archivo_onnx : str, optional
+        Archivo ONNX dentro del repositorio del modelo, por ejemplo la variante cuantizada a
+        int8 "onnx/model_qint8_avx512_vnni.onnx" (por defecto: el modelo ONNX sin cuantizar).
+    max_lote : int
+        Textos máximos por llamada a `encode`.
+    espera_ms : float
+        Milisegundos que se espera a otras solicitudes para completar un micro-lote.
+    max_cache : int
+        Embeddings que se memorizan (0 = sin memoización).
+    """
+
+    def __init__(self, modelo=MODELO_HEREDADO, backend="torch", archivo_onnx=None,
+                 max_lote=32, espera_ms=2, max_cache=10000):
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"Backend de embeddings no soportado: '{backend}'.")
+        self.modelo = modelo
+        self.backend = backend
+        self.archivo_onnx = archivo_onnx
+        self.max_lote = max_lote
+        self.espera = espera_ms / 1000
+        self.max_cache = max_cache
+        self._modelo_st = None
+        self._cola = queue.Queue()
+        self._trabajador = None
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._estadisticas = {"aciertos": 0, "calculados": 0, "lotes": 0}
+
+    @classmethod
+    def desde_config(cls, modelo=None):
+        """
+        Construye el servicio con `embedding_model` de la sección `app` y la sección `embeddings`.
+
+        Parameters
+        ----------
+        modelo : str, optional
+            Modelo a usar en lugar del de config.yaml.
+
+        Returns
+        -------
+        ServicioEmbeddings
+            Servicio sin inicializar; el modelo se carga en el primer uso.
+        """
+        config = get_embeddings_config()
+        return cls(
+            modelo=modelo or get_app_config()["embedding_model"],
+            backend=config["backend"],
+            archivo_onnx=config["archivo_onnx"],
+            max_lote=config["max_lote"],
+            espera_ms=config["espera_ms"],
+            max_cache=config["max_cache"],
+        )
+
+    @property
+    def modelo_st(self):
+        """Modelo de sentence-transformers en CPU, cargado en el primer uso."""
+        if self._modelo_st is None:
+            with self._lock:
+                if self._modelo_st is None:
+                    # Se importa aquí para no cargar torch ni el modelo si el servicio no se usa
+                    from sentence_transformers import SentenceTransformer
+                    if self.backend == "onnx":
+                        try:
+                            import optimum.onnxruntime  # noqa: F401
+                        except ImportError as e:
+                            raise ImportError(
+                                "El backend 'onnx' de embeddings requiere optimum[onnxruntime] "
+                                "(pip install 'optimum[onnxruntime]'); usa backend 'torch' en la "
+                                "sección `embeddings` de config.yaml si no está instalado."
+                            ) from e
+                        model_kwargs = {"file_name": self.archivo_onnx} if self.archivo_onnx else None
+                        self._modelo_st = SentenceTransformer(
+                            self.modelo, device="cpu", backend="onnx", model_kwargs=model_kwargs
+                        )
+                    else:
+                        self._modelo_st = SentenceTransformer(self.modelo, device="cpu")
+        return self._modelo_st
+
+    def metadatos(self):
+        """
+        Metadatos que identifican el modelo con el que se indexa una colección.
+
+        Returns
+        -------
+        dict
+            {"embedding_modelo": ..., "embedding_backend": ...}.
+        """
+        return {"embedding_modelo": self.modelo, "embedding_backend": self.backend}
+
+    def estadisticas(self):
+        """
+        Contadores del servicio.
+
+        Returns
+        -------
+        dict
+            "aciertos" (textos servidos desde la memoización), "calculados" (textos enviados
+            al modelo) y "lotes" (llamadas a `encode`).
+        """
+        with self._cache_lock:
+            return dict(self._estadisticas)
+
+    def __call__(self, input):
+        """
+        Calcula los embeddings de una lista de textos (interfaz de ChromaDB).
+
+        Parameters
+        ----------
+        input : list[str]
+            Textos a convertir.
+
+        Returns
+        -------
+        list[numpy.ndarray]
+            Un vector float32 por texto, en el mismo orden.
+        """
+        return self.embeber(list(input))
+
+    def embeber(self, textos):
+        """
+        Calcula los embeddings de una lista de textos, reutilizando los memorizados.
+
+        Parameters
+        ----------
+        textos : list[str]
+            Textos a convertir.
+
+        Returns
+        -------
+        list[numpy.ndarray]
+            Un vector float32 por texto, en el mismo orden.
+        """
+        resultados = [None] * len(textos)
+        # Texto → posiciones donde aparece, para calcular una sola vez los textos repetidos
+        pendientes = {}
+        with self._cache_lock:
+            for i, texto in enumerate(textos):
+                vector = self._cache.get(texto)
+                if vector is not None:
+                    self._cache.move_to_end(texto)
+                    resultados[i] = vector
+                    self._estadisticas["aciertos"] += 1
+                else:
+                    pendientes.setdefault(texto, []).append(i)
+
+        if pendientes:
+            nuevos = list(pendientes)
+            vectores = self._calcular(nuevos)
+            with self._cache_lock:
+                for texto, vector in zip(nuevos, vectores):
+                    for i in pendientes[texto]:
+                        resultados[i] = vector
+                    if self.max_cache > 0:
+                        self._cache[texto] = vector
+                        self._cache.move_to_end(texto)
+                while len(self._cache) > self.max_cache:
+                    self._cache.popitem(last=False)
+        return resultados
+
+    def _calcular(self, textos):
+        """Envía los textos al hilo de trabajo y espera sus embeddings."""
+        if self._trabajador is None:
+            with self._lock:
+                if self._trabajador is None:
+                    self._trabajador = threading.Thread(
+                        target=self._trabajar, name="servicio-embeddings", daemon=True
+                    )
+                    self._trabajador.start()
+        solicitud = _Solicitud(textos)
+        self._cola.put(solicitud)
+        return solicitud.resultado.result()
+
+    def _trabajar(self):
+        """
+        Hilo de trabajo: junta las solicitudes que llegan dentro de `espera_ms`, hasta
+        `max_lote` textos, y las calcula con una sola llamada a `encode`.
+        """
+        while True:
+            lote = [self._cola.get()]
+            total = len(lote[0].textos)
+            limite = time.monotonic() + self.espera
+            while total < self.max_lote:
+                restante = limite - time.monotonic()
+                try:
+                    solicitud = self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                lote.append(solicitud)
+                total += len(solicitud.textos)
+
+            textos = [texto for solicitud in lote for texto in solicitud.textos]
+            try:
+                vectores = self.modelo_st.encode(
+                    textos, batch_size=self.max_lote, convert_to_numpy=True, show_progress_bar=False
+                ).astype(np.float32)
+            except Exception as e:
+                for solicitud in lote:
+                    solicitud.resultado.set_exception(e)
+                continue
+
+            with self._cache_lock:
+                self._estadisticas["calculados"] += len(textos)
+                self._estadisticas["lotes"] += 1
+            inicio = 0
+            for solicitud in lote:
+                fin = inicio + len(solicitud.textos)
+                solicitud.resultado.set_result(list(vectores[inicio:fin]))
+                inicio = fin
+
+
+_servicios = {}
+_servicios_lock = threading.Lock()
+
+
+def obtener_servicio_embeddings(modelo=None):
+    """
+    Devuelve el `ServicioEmbeddings` compartido del proceso para un modelo.
+
+    Parameters
+    ----------
+    modelo : str, optional
+        Modelo de sentence-transformers (por defecto: `embedding_model` de la sección `app`).
+
+    Returns
+    -------
+    ServicioEmbeddings
+        Instancia única por modelo y por proceso.
+    """
+    modelo = modelo or get_app_config()["embedding_model"]
+    with _servicios_lock:
+        servicio = _servicios.get(modelo)
+        if servicio is None:
+            servicio = _servicios[modelo] = ServicioEmbeddings.desde_config(modelo)
+    return servicio
+
+
+def verificar_modelo_coleccion(coleccion, servicio):
+    """
+    Verifica que una colección se haya indexado con el modelo del servicio de embeddings.
+
+    Las colecciones sin el modelo en sus metadatos se indexaron antes de que se guardara, con
+    `MODELO_HEREDADO`. Una diferencia solo de backend (torch u ONNX) se reporta en el log,
+    porque produce vectores casi idénticos.
+
+    Parameters
+    ----------
+    coleccion : chromadb.Collection
+        Colección a verificar.
+    servicio : ServicioEmbeddings
+        Servicio con el que se consultará.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    ErrorModeloEmbeddings
+        Si la colección se indexó con otro modelo.
+    """
+    metadatos = coleccion.metadata or {}
+    modelo = metadatos.get("embedding_modelo", MODELO_HEREDADO)
+    if modelo != servicio.modelo:
+        raise ErrorModeloEmbeddings(
+            f"La colección '{coleccion.name}' se indexó con '{modelo}' pero el servicio usa "
+            f"'{servicio.modelo}'. Reindexa con --reconstruir o ajusta `embedding_model`."
+        )
+    backend = metadatos.get("embedding_backend", "torch")
+    if backend != servicio.backend:
+        logger.warning("La colección '%s' se indexó con el backend '%s' y se consulta con '%s'.",
+                       coleccion.name, backend, servicio.backend)
@@ -0,0 +1,340 @@
+"""
+Descripción
+===========
+
+Este módulo procesa solicitudes por lotes, sin pasar por la interfaz de Streamlit.
+
+La entrada puede ser una carpeta con imágenes o PDFs (como `ejemplos_ocr/`) o un archivo JSONL
+con una solicitud por línea. Cada elemento pasa por OCR → `generar_json_desde_correo` →
+`responder_desde_json` con un número acotado de hilos, y el resultado se agrega a un archivo
+JSONL en `output/`. El procesamiento es reanudable: al volver a ejecutarlo sobre la misma
+entrada se omiten los elementos que ya tienen un resultado sin error. Al final se reporta el
+rendimiento de cada etapa.
+
+Funciones
+===========
+
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from source.ocr_utils import extraer_ocr_textract, generar_json_desde_correo
+from source.rag_utils import responder_desde_json
+from source.trazas_utils import traza
+
+EXTENSIONES_DOCUMENTO = (".png", ".jpg", ".jpeg", ".pdf")
+
+
+class MedidorEtapas:
+    """
+    Acumula, de forma segura entre hilos, cuántos elementos pasan por cada etapa y cuánto tardan.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._etapas = {}
+
+    @contextmanager
+    def medir(self, etapa):
+        """
+        Mide el tiempo de un bloque y lo registra en `etapa`.
+
+        Parameters
+        ----------
+        etapa : str
+            Nombre de la etapa (por ejemplo, "ocr", "json" o "respuesta").
+        """
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            fin = time.perf_counter()
+            with self._lock:
+                datos = self._etapas.setdefault(etapa, {"elementos": 0, "segundos": 0.0, "inicio": inicio, "fin": fin})
+                datos["elementos"] += 1
+                datos["segundos"] += fin - inicio
+                datos["inicio"] = min(datos["inicio"], inicio)
+                datos["fin"] = max(datos["fin"], fin)
+
+    def resumen(self):
+        """
+        Resume el rendimiento de cada etapa.
+
+        Returns
+        -------
+        dict
+            {etapa: {"elementos", "segundos_promedio", "elementos_por_segundo"}}, donde el
+            rendimiento se calcula sobre el tiempo transcurrido entre el primer inicio y el último
+            fin de la etapa, por lo que refleja la concurrencia.
+        """
+        with self._lock:
+            return {
+                etapa: {
+                    "elementos": d["elementos"],
+                    "segundos_promedio": d["segundos"] / d["elementos"],
+                    "elementos_por_segundo": d["elementos"] / max(d["fin"] - d["inicio"], 1e-9),
+                }
+                for etapa, d in self._etapas.items()
+            }
+
+
+def cargar_elementos(entrada):
+    """
+    Lee los elementos a procesar desde una carpeta de documentos o un archivo JSONL.
+
+    En una carpeta, cada imagen o PDF es un elemento cuyo ID es el nombre del archivo.
+    En un JSONL, cada línea es un objeto con un ID en "id" o "request_id" (si no, se usa el
+    número de línea) y uno de los siguientes contenidos, en orden de prioridad:
+    - "mensaje" (con "origen" y "titulo" opcionales): JSON de correo ya generado.
+    - "texto_ocr": texto crudo de OCR, que pasa por `generar_json_desde_correo`.
+    - "body" (con "title" opcional): cuerpo de la solicitud, que se responde directamente.
+    - "ruta": ruta a una imagen o PDF, que pasa por OCR.
+
+    Parameters
+    ----------
+    entrada : str
+        Ruta a la carpeta o al archivo JSONL.
+
+    Returns
+    -------
+    list[dict]
+        Elementos con la clave "id" y una de "documento", "texto_ocr" o "json_correo".
+
+    Raises
+    ------
+    FileNotFoundError
+        Si la entrada no existe.
+    ValueError
+        Si una línea del JSONL no tiene un contenido reconocible.
+    """
+    if not os.path.exists(entrada):
+        raise FileNotFoundError(f"La entrada '{entrada}' no existe.")
+
+    if os.path.isdir(entrada):
+        return [
+            {"id": archivo, "documento": os.path.join(entrada, archivo)}
+            for archivo in sorted(os.listdir(entrada)) if archivo.lower().endswith(EXTENSIONES_DOCUMENTO)
+        ]
+
+    elementos = []
+    with open(entrada, "r", encoding="utf-8") as f:
+        for n, linea in enumerate(f, start=1):
+            if not linea.strip():
+                continue
+            item = json.loads(linea)
+            elemento = {"id": str(item.get("id") or item.get("request_id") or f"linea_{n}")}
+            if "mensaje" in item:
+                elemento["json_correo"] = {
+                    "origen": item.get("origen", "Desconocido"),
+                    "titulo": item.get("titulo", "Sin título detectado"),
+                    "mensaje": item["mensaje"],
+                }
+            elif "texto_ocr" in item:
+                elemento["texto_ocr"] = item["texto_ocr"]
+            elif "body" in item:
+                elemento["json_correo"] = {
+                    "origen": "Desconocido",
+                    "titulo": item.get("title", "Sin título detectado"),
+                    "mensaje": item["body"],
+                }
+            elif "ruta" in item:
+                elemento["documento"] = item["ruta"]
+            else:
+                raise ValueError(f"Línea {n} de '{entrada}' sin 'mensaje', 'texto_ocr', 'body' ni 'ruta'.")
+            elementos.append(elemento)
+    return elementos
+
+
+def ids_completados(ruta_salida):
+    """
+    Obtiene los IDs que ya tienen un resultado sin error en el archivo de salida.
+
+    Parameters
+    ----------
+    ruta_salida : str
+        Ruta al JSONL de resultados.
+
+    Returns
+    -------
+    set[str]
+        IDs completados. Una línea incompleta al final (por una interrupción) se ignora.
+    """
+    completados = set()
+    if not os.path.exists(ruta_salida):
+        return completados
+    with open(ruta_salida, "r", encoding="utf-8") as f:
+        for linea in f:
+            try:
+                resultado = json.loads(linea)
+            except json.JSONDecodeError:
+                continue
+            if "error" not in resultado:
+                completados.add(resultado["id"])
+    return completados
+
+
+def _descartar_linea_incompleta(ruta_salida):
+    """
+    Trunca el JSONL de resultados después de su último salto de línea.
+
+    Si una interrupción dejó una línea a medio escribir, el siguiente resultado se agregaría
+    pegado a ella y ambos se perderían; al truncarla, ese elemento simplemente se reprocesa.
+
+    Parameters
+    ----------
+    ruta_salida : str
+        Ruta al JSONL de resultados.
+
+    Returns
+    -------
+    None
+    """
+    if not os.path.exists(ruta_salida):
+        return
+    with open(ruta_salida, "rb+") as f:
+        tamano = f.seek(0, os.SEEK_END)
+        fin, posicion = 0, tamano
+        # Se busca el último salto de línea leyendo por bloques desde el final
+        while posicion > 0:
+            leidos = min(1 << 16, posicion)
+            posicion -= leidos
+            f.seek(posicion)
+            salto = f.read(leidos).rfind(b"\n")
+            if salto >= 0:
+                fin = posicion + salto + 1
+                break
+        if fin < tamano:
+            f.truncate(fin)
+
+
+def procesar_elemento(elemento, medidor, responder=True):
+    """
+    Ejecuta el flujo completo sobre un elemento, midiendo cada etapa.
+
+    Parameters
+    ----------
+    elemento : dict
+        Elemento devuelto por `cargar_elementos()`.
+    medidor : MedidorEtapas
+        Medidor donde se registran los tiempos.
+    responder : bool
+        Si es False, se detiene después de generar el JSON del correo.
+
+    Returns
+    -------
+    dict
+        Resultado con "id", "json_correo", "traza" (ID de la traza en el log "trazas") y, si
+        `responder` es True, "respuesta" y "metricas" (tiempos de búsqueda y re-ranking de la
+        solicitud).
+    """
+    with traza("solicitud", id=elemento["id"]) as actual:
+        json_correo = elemento.get("json_correo")
+        texto_ocr = elemento.get("texto_ocr")
+        baja_confianza = None
+        if json_correo is None and texto_ocr is None:
+            with medidor.medir("ocr"):
+                ocr = extraer_ocr_textract(elemento["documento"])
+            texto_ocr, baja_confianza = ocr["texto"], ocr["baja_confianza"]
+        if json_correo is None:
+            with medidor.medir("json"):
+                json_correo = generar_json_desde_correo(texto_ocr, baja_confianza=baja_confianza)
+
+        resultado = {"id": elemento["id"], "json_correo": json_correo, "traza": actual.id if actual else None}
+        if responder:
+            metricas = {}
+            with medidor.medir("respuesta"):
+                resultado["respuesta"] = responder_desde_json(json_correo, metricas=metricas)
+            resultado["metricas"] = metricas
+    return resultado
+
+
+def procesar_lote(entrada, ruta_salida=None, max_concurrencia=4, responder=True):
+    """
+    Procesa todos los elementos pendientes de una entrada y agrega los resultados a un JSONL.
+
+    Cada resultado se escribe (y se sincroniza a disco) en cuanto termina, así que si el
+    proceso se interrumpe basta con volver a ejecutarlo: los elementos con resultado sin error
+    se omiten y los que fallaron o quedaron a medio escribir se reintentan.
+
+    Parameters
+    ----------
+    entrada : str
+        Carpeta con imágenes/PDFs o archivo JSONL (ver `cargar_elementos()`).
+    ruta_salida : str, optional
+        JSONL de resultados (por defecto: output/<nombre de la entrada>_resultados.jsonl).
+    max_concurrencia : int
+        Número máximo de elementos en proceso al mismo tiempo.
+    responder : bool
+        Si es False, solo se ejecutan OCR y generación del JSON.
+
+    Returns
+    -------
+    dict
+        Resumen con "procesados", "errores", "omitidos", "segundos" y "etapas"
+        (ver `MedidorEtapas.resumen()`).
+    """
+    if ruta_salida is None:
+        nombre = os.path.splitext(os.path.basename(os.path.normpath(entrada)))[0]
+        ruta_salida = os.path.join("output", f"{nombre}_resultados.jsonl")
+    os.makedirs(os.path.dirname(ruta_salida) or ".", exist_ok=True)
+
+    elementos = cargar_elementos(entrada)
+    _descartar_linea_incompleta(ruta_salida)
+    completados = ids_completados(ruta_salida)
+    pendientes = [e for e in elementos if e["id"] not in completados]
+    print(f"📥 {len(elementos)} elementos, {len(elementos) - len(pendientes)} ya completados, "
+          f"{len(pendientes)} pendientes.")
+
+    medidor = MedidorEtapas()
+    lock_salida = threading.Lock()
+    procesados, errores = 0, 0
+    inicio = time.perf_counter()
+
+    with open(ruta_salida, "a", encoding="utf-8") as salida, ThreadPoolExecutor(max_workers=max_concurrencia) as pool:
+        def escribir(resultado):
+            with lock_salida:
+                salida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+                salida.flush()
+                os.fsync(salida.fileno())
+
+        en_curso = {}
+        restantes = iter(pendientes)
+        while True:
+            # Se mantienen a lo más 2 * max_concurrencia elementos enviados al pool
+            while len(en_curso) < 2 * max_concurrencia:
+                elemento = next(restantes, None)
+                if elemento is None:
+                    break
+                en_curso[pool.submit(procesar_elemento, elemento, medidor, responder)] = elemento
+            if not en_curso:
+                break
+            terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                elemento = en_curso.pop(futuro)
+                try:
+                    escribir(futuro.result())
+                    procesados += 1
+                    print(f"✅ {elemento['id']}")
+                except Exception as e:
+                    escribir({"id": elemento["id"], "error": str(e)})
+                    errores += 1
+                    print(f"⚠️ Error procesando {elemento['id']}: {e}")
+
+    segundos = time.perf_counter() - inicio
+    resumen = {
+        "procesados": procesados,
+        "errores": errores,
+        "omitidos": len(elementos) - len(pendientes),
+        "segundos": segundos,
+        "etapas": medidor.resumen(),
+    }
+
+    print(f"\n⏱️ {procesados} procesados y {errores} con error en {segundos:.1f} s. Resultados en `{ruta_salida}`.")
+    for etapa, datos in resumen["etapas"].items():
+        print(f"   {etapa}: {datos['elementos']} elementos, {datos['segundos_promedio']:.2f} s promedio, "
+              f"{datos['elementos_por_segundo']:.2f} elementos/s")
+    return resumen
@@ -12,53 +12,116 @@ Funciones
 
 
 import re
-import boto3
-from openai import OpenAI
-import openai
-from source.config_loader import get_aws_credentials, get_openai_key
-
-def corregir_ortografia(texto, model="gpt-4"):
+import json
+import logging
+from source.config_loader import get_openai_client, get_ortografia_config, get_anonimizacion_config
+from source.cache_utils import obtener_cache
+from source.ortografia_utils import planear_correccion, aplicar_correcciones, formatear_fragmentos
+from source.anonimizacion_utils import obtener_motor_anonimizacion
+from source.textract_utils import detectar_texto_documento
+from source.trazas_utils import instrumentar, registrar_tokens, registrar_paginas_textract
+
+logger = logging.getLogger(__name__)
+
+@instrumentar("ortografia")
+def corregir_ortografia(texto, model="gpt-4", baja_confianza=None):
     """
     Corrige ortografía y redacción en español utilizando OpenAI GPT-4.
 
+    Antes de llamar al LLM se revisa el texto localmente (ver `planear_correccion()`): si no
+    tiene palabras sospechosas se devuelve sin cambios, y si las tiene solo se envían las
+    oraciones que las contienen. Cada oración corregida se valida contra la original y, si
+    el modelo la cambió demasiado o respondió con un comentario, se conserva la original.
+
+    La respuesta del modelo se guarda en la caché en disco con clave (modelo, oraciones
+    enviadas), por lo que corregir de nuevo el mismo texto no vuelve a llamar a OpenAI.
+
     Parameters
     ----------
     texto : str
         Texto limpio y anonimizado a corregir.
     model : str
         Modelo de OpenAI (por defecto: "gpt-4").
+    baja_confianza : iterable[str], optional
+        Palabras que Textract reconoció con baja confianza (ver `extraer_ocr_textract()`).
 
     Returns
     -------
     str
         Texto corregido en redacción y ortografía.
     """
-    client = OpenAI(api_key=get_openai_key())
-
-    prompt = (
-        "Corrige ortografía y redacción del siguiente mensaje en español. "
-        "No inventes información ni quites contenido relevante. "
-        "Solo corrige los errores:\n\n"
-        f"{texto}"
+    oraciones, indices = planear_correccion(texto, baja_confianza)
+    if not indices:
+        logger.info("Texto sin palabras sospechosas; se omite la corrección con %s.", model)
+        return texto
+    fragmentos = [oraciones[i] for i in indices]
+    respuesta = obtener_cache().obtener_o_calcular(
+        "ortografia", [model, *fragmentos], lambda: _corregir_ortografia_llm(fragmentos, model)
     )
+    corregido, aceptadas = aplicar_correcciones(oraciones, indices, respuesta)
+    logger.info("Corrección con %s: %d de %d oraciones enviadas, %d aceptadas.",
+                model, len(fragmentos), len(oraciones), aceptadas)
+    return corregido
+
+def _corregir_ortografia_llm(fragmentos, model):
+    """
+    Llama a OpenAI para corregir las oraciones, sin pasar por la caché.
+
+    Parameters
+    ----------
+    fragmentos : list[str]
+        Oraciones a corregir.
+    model : str
+        Modelo de OpenAI.
 
+    Returns
+    -------
+    str
+        Respuesta del modelo con las oraciones corregidas y numeradas.
+    """
+    client = get_openai_client()
     response = client.chat.completions.create(
         model=model,
-        messages=[
-            {"role": "system", "content": "Eres un corrector ortográfico profesional."},
-            {"role": "user", "content": prompt}
-        ],
+        messages=mensajes_correccion(fragmentos),
         temperature=0
     )
+    if response.usage is not None:
+        registrar_tokens(model, response.usage.prompt_tokens, response.usage.completion_tokens)
 
     return response.choices[0].message.content.strip()
 
+def mensajes_correccion(fragmentos):
+    """
+    Construye los mensajes de chat para pedir la corrección ortográfica de varias oraciones.
+
+    Parameters
+    ----------
+    fragmentos : list[str]
+        Oraciones del mensaje limpio y anonimizado a corregir.
+
+    Returns
+    -------
+    list[dict]
+        Mensajes con roles "system" y "user" para la API de chat de OpenAI.
+    """
+    prompt = (
+        "Corrige ortografía y redacción de los siguientes fragmentos de un mensaje en español. "
+        "No inventes información ni quites contenido relevante. "
+        "Solo corrige los errores. Devuelve cada fragmento en una línea con el mismo número "
+        "entre corchetes, sin comentarios adicionales:\n\n"
+        f"{formatear_fragmentos(fragmentos)}"
+    )
+    return [
+        {"role": "system", "content": "Eres un corrector ortográfico profesional."},
+        {"role": "user", "content": prompt}
+    ]
+
 def extraer_texto_textract(documento):
     """
     Extrae texto plano desde un archivo (imagen o PDF) usando Amazon Textract.
 
-    Esta función se conecta al servicio Textract de AWS utilizando credenciales
-    proporcionadas desde un archivo de configuración. Puede manejar archivos 
+    Esta función usa el cliente de Textract compartido del proceso, creado con las credenciales
+    del archivo de configuración. Puede manejar archivos 
     locales (ruta como string) o archivos en memoria (bytes).
 
     Parameters
@@ -77,14 +140,32 @@ def extraer_texto_textract(documento):
     TypeError
         Si el argumento 'documento' no es ni una ruta válida (str) ni un objeto binario (bytes).
     """
-    access_key, secret_key, region = get_aws_credentials()
-    session = boto3.Session(
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        region_name=region
-    )
-    textract = session.client("textract")
+    return extraer_ocr_textract(documento)["texto"]
+
+@instrumentar("textract")
+def extraer_ocr_textract(documento):
+    """
+    Extrae con Amazon Textract el texto y las palabras reconocidas con baja confianza.
+
+    El resultado se guarda en la caché en disco con clave en el contenido del documento.
+
+    Parameters
+    ----------
+    documento : str or bytes
+        Ruta al archivo en disco o contenido binario en memoria.
+
+    Returns
+    -------
+    dict
+        Diccionario con "texto" (líneas de todas las páginas en orden de lectura),
+        "baja_confianza" (palabras con confianza menor a `umbral_confianza` de la sección
+        `ortografia`) y "paginas".
 
+    Raises
+    ------
+    TypeError
+        Si el argumento 'documento' no es ni una ruta válida (str) ni un objeto binario (bytes).
+    """
     if isinstance(documento, str):
         with open(documento, "rb") as f:
             content = f.read()
@@ -93,10 +174,33 @@ def extraer_texto_textract(documento):
     else:
         raise TypeError("El argumento 'documento' debe ser una ruta (str) o contenido binario (bytes).")
 
-    response = textract.detect_document_text(Document={'Bytes': content})
-    bloques = response.get("Blocks", [])
-    lineas = [b["Text"] for b in bloques if b["BlockType"] == "LINE"]
-    return "\n".join(lineas)
+    umbral = get_ortografia_config()["umbral_confianza"]
+    return obtener_cache().obtener_o_calcular(
+        "textract", ["detect_document_text", "por_paginas", umbral, content], lambda: _detectar_texto(content, umbral)
+    )
+
+def _detectar_texto(content, umbral_confianza):
+    """
+    Envía el documento a Textract y concatena sus líneas, sin pasar por la caché.
+
+    Los PDFs de varias páginas se dividen y sus páginas se procesan de forma concurrente
+    (ver `textract_utils.detectar_texto_documento()`).
+
+    Parameters
+    ----------
+    content : bytes
+        Contenido binario del documento.
+    umbral_confianza : float
+        Confianza (de 0 a 100) debajo de la cual una palabra se reporta.
+
+    Returns
+    -------
+    dict
+        Diccionario con "texto", "baja_confianza" y "paginas" (ver `extraer_ocr_textract()`).
+    """
+    resultado = detectar_texto_documento(content, umbral_confianza)
+    registrar_paginas_textract(resultado["paginas"])
+    return resultado
 
 def extraer_origen_y_titulo(texto):
     """
@@ -129,15 +233,18 @@ def extraer_origen_y_titulo(texto):
             return origen, titulo
     return "Desconocido", "Sin título detectado"
 
+@instrumentar("limpieza")
 def limpiar_y_anonimizar(texto, origen=None, titulo=None):
     """
     Limpia el texto extraído por OCR eliminando ruido visual, datos personales, encabezados duplicados
     y metadatos de interfaces de correo.
 
     Esta función realiza una serie de transformaciones para mejorar la calidad del texto antes de pasarlo
-    al modelo de corrección ortográfica. Entre otras cosas, elimina:
-    - Nombres y saludos comunes
-    - Correos electrónicos, reemplazándolos por [correo]
+    al modelo de corrección ortográfica, con el motor compilado de `anonimizacion_utils` (una sola
+    pasada sobre el texto). Entre otras cosas, elimina:
+    - Nombres (configurables en la sección `anonimizacion`) y saludos comunes
+    - Datos personales, reemplazándolos por su etiqueta: [correo], [curp], [rfc], [cuenta],
+      [tarjeta] y [telefono]
     - Encabezados de correo repetidos (extraídos como origen y título)
     - Frases comunes de interfaz (e.g. "Responder", "Reenviar", "Bloquear remitente")
     - Fechas, horarios y palabras muy cortas (ruido típico del OCR)
@@ -156,52 +263,61 @@ def limpiar_y_anonimizar(texto, origen=None, titulo=None):
     str
         Texto limpio y anonimizado, sin metadatos visuales, nombres ni formatos de correo electrónico.
     """
-    texto = re.sub(r"(?i)(atte:|saludos cordiales|gracias|juan p[ée]rez|mar[íi]a ram[íi]rez|jose gonz[aá]lez)", "", texto)
-    texto = re.sub(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+", "[correo]", texto)
-
-    if origen and titulo:
-        encabezado = f"[{origen}] {titulo}"
-        texto = texto.replace(encabezado, "")
+    return obtener_motor_anonimizacion().limpiar(texto, origen, titulo)
 
-    texto = re.sub(r"(?i)^(responder|reenviar)$", "", texto, flags=re.MULTILINE)
+def partes_clave_json_correo(texto_ocr, model, baja_confianza=None):
+    """
+    Entradas que determinan el JSON de un correo, para su clave en la caché en disco.
 
-    patrones_ruido = [
-        r"<\[correo\]>",
-        r"(?i)para:",
-        r"(?i)este remitente.*no pertenece",
-        r"\bsáb\b|\blun\b|\bmar\b|\bmié\b|\bjue\b|\bvie\b|\bsab\b",
-        r"\d{2}/\d{2}/\d{4}",
-        r"\d{1,2}:\d{2} (AM|PM)",
-        r"(?i)bloquear remitente"
-    ]
+    Además del modelo y el texto OCR, incluye la configuración de `anonimizacion` (nombres y
+    patrones de datos personales) y de `ortografia`, y las palabras de baja confianza, de modo
+    que al cambiar las reglas no se sirvan mensajes anonimizados o corregidos con las anteriores.
 
-    lineas = texto.splitlines()
-    lineas_filtradas = []
-    for linea in lineas:
-        if len(linea.strip()) <= 2:
-            continue
-        if any(re.search(pat, linea) for pat in patrones_ruido):
-            continue
-        lineas_filtradas.append(linea)
+    Parameters
+    ----------
+    texto_ocr : str
+        Texto crudo extraído por OCR.
+    model : str
+        Modelo de OpenAI para la corrección ortográfica.
+    baja_confianza : iterable[str], optional
+        Palabras que Textract reconoció con baja confianza.
 
-    texto_limpio = " ".join(lineas_filtradas)
-    texto_limpio = re.sub(r"\s{2,}", " ", texto_limpio)
-    return texto_limpio.strip()
+    Returns
+    -------
+    list
+        Partes de la clave para `CacheDisco.clave()` en el espacio "json_correo".
+    """
+    reglas = json.dumps(
+        {"anonimizacion": get_anonimizacion_config(), "ortografia": get_ortografia_config()},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    # "por_oraciones" separa estas entradas de las que se corrigieron con el texto completo
+    return [model, "por_oraciones", reglas, "\n".join(sorted(set(baja_confianza or ()))), texto_ocr]
 
-def generar_json_desde_correo(texto_ocr):
+@instrumentar("json_correo")
+def generar_json_desde_correo(texto_ocr, model="gpt-4", baja_confianza=None):
     """
     Genera un diccionario JSON estructurado a partir del texto extraído por OCR de una imagen o PDF.
 
     Esta función:
     - Extrae el origen y el título del correo desde la primera línea con formato [ORIGEN] TÍTULO.
     - Limpia el texto eliminando ruido visual, encabezados redundantes, correos y metadatos innecesarios.
-    - Corrige ortografía y redacción del mensaje completo utilizando un modelo LLM (GPT-4).
+    - Corrige ortografía y redacción del mensaje utilizando un modelo LLM (GPT-4), solo en las
+      oraciones con palabras sospechosas (ver `corregir_ortografia()`).
     - Devuelve un diccionario estructurado con los tres campos principales del mensaje.
 
+    El diccionario se guarda en la caché en disco con clave en el modelo, el texto OCR y las
+    reglas de limpieza (ver `partes_clave_json_correo()`), de modo que las re-ejecuciones de
+    Streamlit no repiten la limpieza ni la corrección.
+
     Parameters
     ----------
     texto_ocr : str
         Texto crudo extraído por OCR (usualmente desde Amazon Textract).
+    model : str
+        Modelo de OpenAI para la corrección ortográfica (por defecto: "gpt-4").
+    baja_confianza : iterable[str], optional
+        Palabras que Textract reconoció con baja confianza (ver `extraer_ocr_textract()`).
 
     Returns
     -------
@@ -211,11 +327,16 @@ def generar_json_desde_correo(texto_ocr):
         - "titulo": texto que acompaña al origen, sirve como resumen o asunto de la solicitud.
         - "mensaje": cuerpo del mensaje corregido en ortografía y redacción.
     """
-    origen, titulo = extraer_origen_y_titulo(texto_ocr)
-    cuerpo_limpio = limpiar_y_anonimizar(texto_ocr, origen, titulo)
-    cuerpo_corregido = corregir_ortografia(cuerpo_limpio)
-    return {
-        "origen": origen,
-        "titulo": titulo,
-        "mensaje": cuerpo_corregido
-    }
+    def generar():
+        origen, titulo = extraer_origen_y_titulo(texto_ocr)
+        cuerpo_limpio = limpiar_y_anonimizar(texto_ocr, origen, titulo)
+        cuerpo_corregido = corregir_ortografia(cuerpo_limpio, model=model, baja_confianza=baja_confianza)
+        return {
+            "origen": origen,
+            "titulo": titulo,
+            "mensaje": cuerpo_corregido
+        }
+
+    return obtener_cache().obtener_o_calcular(
+        "json_correo", partes_clave_json_correo(texto_ocr, model, baja_confianza), generar
+    )
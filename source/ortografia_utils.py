@@ -0,0 +1,189 @@
+"""
+Descripción
+===========
+
+Este módulo revisa localmente la ortografía del texto de una solicitud antes de pedir su
+corrección a un LLM.
+
+Con un diccionario de español (pyspellchecker) y, si están disponibles, las palabras que
+Textract reconoció con baja confianza, se detectan las palabras sospechosas. Si no hay, el
+texto se conserva sin llamar al LLM; si las hay, solo se envían las oraciones que las
+contienen. Cada oración corregida se valida contra la original (similitud con `difflib` y
+ausencia de comentarios del modelo) y, si no pasa, se conserva la original.
+
+Funciones
+===========
+
+"""
+
+import re
+import difflib
+from functools import lru_cache
+from spellchecker import SpellChecker
+from source.config_loader import get_ortografia_config
+
+PALABRA = re.compile(r"[A-Za-zÁÉÍÓÚÜÑáéíóúüñ]+")
+FIN_DE_ORACION = re.compile(r"(?<=[.!?;:])\s+")
+FRAGMENTO_NUMERADO = re.compile(r"^\s*\[(\d+)\]\s*(.*?)\s*$", re.MULTILINE)
+
+# Frases con las que el modelo comenta el texto en lugar de devolverlo corregido
+COMENTARIO_DEL_MODELO = re.compile(
+    r"(?i)(el texto (proporcionado|original|est[áa])|correctamente escrito|no (se )?requiere(n)? "
+    r"(ninguna )?correcci|texto corregido\s*:|aqu[íi] (est[áa]|tienes)|sin errores)"
+)
+
+
+@lru_cache(maxsize=1)
+def _corrector():
+    """Corrector de pyspellchecker con el diccionario de español, cargado una sola vez."""
+    return SpellChecker(language="es")
+
+
+def dividir_oraciones(texto):
+    """
+    Divide un texto en oraciones, conservando su puntuación.
+
+    Parameters
+    ----------
+    texto : str
+        Texto limpio de la solicitud.
+
+    Returns
+    -------
+    list[str]
+        Oraciones no vacías, en orden.
+    """
+    return [o for o in FIN_DE_ORACION.split(texto.strip()) if o]
+
+
+def palabras_sospechosas(texto, baja_confianza=None):
+    """
+    Encuentra las palabras que probablemente tienen un error de ortografía o de OCR.
+
+    Una palabra es sospechosa si Textract la reconoció con baja confianza o si no está en el
+    diccionario. Del diccionario se omiten las palabras cortas, las siglas y las que inician
+    con mayúscula (nombres propios e instituciones), que generarían falsos positivos.
+
+    Parameters
+    ----------
+    texto : str
+        Texto a revisar.
+    baja_confianza : iterable[str], optional
+        Palabras con baja confianza según Textract (ver `extraer_ocr_textract()`).
+
+    Returns
+    -------
+    set[str]
+        Palabras sospechosas, en minúsculas.
+    """
+    baja_confianza = {p.lower() for p in (baja_confianza or ())}
+    palabras = PALABRA.findall(texto)
+    sospechosas = {p.lower() for p in palabras if p.lower() in baja_confianza}
+    candidatas = {p.lower() for p in palabras if len(p) > 2 and p[0].islower()}
+    return sospechosas | _corrector().unknown(candidatas)
+
+
+def planear_correccion(texto, baja_confianza=None, config=None):
+    """
+    Decide qué oraciones del texto se envían al LLM.
+
+    Parameters
+    ----------
+    texto : str
+        Texto limpio de la solicitud.
+    baja_confianza : iterable[str], optional
+        Palabras con baja confianza según Textract.
+    config : dict, optional
+        Sección `ortografia` (por defecto: `get_ortografia_config()`).
+
+    Returns
+    -------
+    tuple (oraciones:list[str], indices:list[int])
+        Oraciones del texto e índices de las que contienen palabras sospechosas; `indices`
+        está vacío si el texto tiene a lo más `max_sospechosas_sin_llm` palabras sospechosas.
+    """
+    config = config or get_ortografia_config()
+    oraciones = dividir_oraciones(texto)
+    sospechosas = palabras_sospechosas(texto, baja_confianza)
+    if len(sospechosas) <= config["max_sospechosas_sin_llm"]:
+        return oraciones, []
+    indices = [
+        i for i, oracion in enumerate(oraciones)
+        if any(p.lower() in sospechosas for p in PALABRA.findall(oracion))
+    ]
+    return oraciones, indices
+
+
+def formatear_fragmentos(fragmentos):
+    """
+    Numera los fragmentos a corregir, uno por línea ("[1] ...").
+
+    Parameters
+    ----------
+    fragmentos : list[str]
+        Oraciones a corregir.
+
+    Returns
+    -------
+    str
+        Fragmentos numerados desde 1.
+    """
+    return "\n".join(f"[{n}] {fragmento}" for n, fragmento in enumerate(fragmentos, start=1))
+
+
+def es_correccion_valida(original, corregido, umbral_similitud=None):
+    """
+    Verifica que una corrección conserve el contenido del texto original.
+
+    Parameters
+    ----------
+    original : str
+        Texto enviado al LLM.
+    corregido : str
+        Texto devuelto por el LLM.
+    umbral_similitud : float, optional
+        Similitud mínima de `difflib` entre ambos (por defecto: la de config.yaml).
+
+    Returns
+    -------
+    bool
+        False si el resultado está vacío, es un comentario del modelo o se aleja demasiado
+        del original.
+    """
+    if umbral_similitud is None:
+        umbral_similitud = get_ortografia_config()["umbral_similitud"]
+    if not corregido or (COMENTARIO_DEL_MODELO.search(corregido) and not COMENTARIO_DEL_MODELO.search(original)):
+        return False
+    return difflib.SequenceMatcher(None, original.lower(), corregido.lower()).ratio() >= umbral_similitud
+
+
+def aplicar_correcciones(oraciones, indices, respuesta, umbral_similitud=None):
+    """
+    Reemplaza las oraciones enviadas al LLM por sus correcciones válidas.
+
+    Parameters
+    ----------
+    oraciones : list[str]
+        Oraciones del texto original.
+    indices : list[int]
+        Índices de las oraciones enviadas, en el orden en que se numeraron.
+    respuesta : str
+        Respuesta del LLM con los fragmentos numerados.
+    umbral_similitud : float, optional
+        Similitud mínima para aceptar una corrección (ver `es_correccion_valida()`).
+
+    Returns
+    -------
+    tuple (texto:str, aceptadas:int)
+        Texto final y número de correcciones aceptadas. Las oraciones sin corrección válida
+        (o que el modelo omitió) se conservan como estaban.
+    """
+    corregidos = {int(n): texto for n, texto in FRAGMENTO_NUMERADO.findall(respuesta or "")}
+    resultado = list(oraciones)
+    aceptadas = 0
+    for n, i in enumerate(indices, start=1):
+        corregido = corregidos.get(n)
+        if corregido is not None and es_correccion_valida(oraciones[i], corregido, umbral_similitud):
+            resultado[i] = corregido
+            aceptadas += 1
+    return " ".join(resultado), aceptadas
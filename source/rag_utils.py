@@ -13,28 +13,250 @@ Funciones
 """
 
 import chromadb
-from openai import OpenAI
 import os
 import re
 import json
-from source.config_loader import get_openai_key
-import os
+import time
+import logging
+import threading
+from source.config_loader import (
+    RAG_DEFAULTS,
+    get_openai_client,
+    get_app_config,
+    get_cache_semantica_config,
+    get_rag_config,
+)
+from source.cache_utils import CacheSemantica, huella_fragmentos
+from source.bm25_utils import IndiceBM25, ruta_indice_bm25
+from source.chunking_utils import identificar_circulares
+from source.contexto_utils import empaquetar_contexto
+from source.embedding_utils import obtener_servicio_embeddings, verificar_modelo_coleccion
+from source.trazas_utils import instrumentar, tramo, anotar, registrar_tokens
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-# Inicializar cliente de OpenAI
-client = OpenAI(api_key=get_openai_key())
+logger = logging.getLogger(__name__)
+
+
+class RAGService:
+    """
+    Servicio de recuperación y generación con inicialización perezosa.
+
+    La colección de ChromaDB, el índice BM25, el cross-encoder de re-ranking y el catálogo
+    de nombres legibles se construyen la primera vez que se usan, y el cliente de OpenAI se
+    toma del pool del proceso; todos se reutilizan en las llamadas siguientes. Así, importar
+    el módulo no abre la base vectorial ni requiere credenciales, y un proceso (por ejemplo,
+    la app de Streamlit entre reruns) construye cada recurso una sola vez.
+
+    Parameters
+    ----------
+    chroma_path : str
+        Ruta al almacenamiento persistente de ChromaDB.
+    collection_name : str
+        Nombre de la colección con los fragmentos normativos.
+    catalogo_path : str
+        Ruta al JSON que mapea nombres de archivo a títulos legibles.
+    embedding_model : str
+        Modelo de sentence-transformers con el que se indexó la colección.
+    cache_semantica : CacheSemantica, optional
+        Caché de respuestas para preguntas casi idénticas (por defecto: deshabilitada).
+    parametros_rag : dict, optional
+        Parámetros de recuperación (ver `get_rag_config()`); por defecto los de `RAG_DEFAULTS`.
+    """
+
+    def __init__(self, chroma_path="chroma_data", collection_name="normatividad",
+                 catalogo_path="metadata/catalogo_normatividad.json", embedding_model="all-MiniLM-L6-v2",
+                 cache_semantica=None, parametros_rag=None):
+        self.chroma_path = chroma_path
+        self.collection_name = collection_name
+        self.catalogo_path = catalogo_path
+        self.embedding_model = embedding_model
+        self.cache_semantica = cache_semantica or CacheSemantica(habilitada=False)
+        self.parametros_rag = {**RAG_DEFAULTS, **(parametros_rag or {})}
+        self._lock = threading.Lock()
+        self._embedding_fn = None
+        self._coleccion = None
+        self._catalogo = None
+        self._indice_bm25 = None
+        self._mtime_bm25 = None
+        self._reranker = None
+
+    @classmethod
+    def desde_config(cls):
+        """
+        Construye el servicio con las secciones `app`, `rag` y `cache_semantica` de config.yaml.
+
+        Returns
+        -------
+        RAGService
+            Servicio sin inicializar; los recursos se crean al usarse.
+        """
+        app = get_app_config()
+        cache = get_cache_semantica_config()
+        return cls(
+            chroma_path=app["chroma_path"],
+            collection_name=app["collection_name"],
+            catalogo_path=app["catalogo_path"],
+            embedding_model=app["embedding_model"],
+            cache_semantica=CacheSemantica(
+                umbral=cache["umbral"],
+                ttl_segundos=cache["ttl_horas"] * 3600,
+                max_entradas=cache["max_entradas"],
+                habilitada=cache["habilitada"],
+            ),
+            parametros_rag=get_rag_config(),
+        )
+
+    @property
+    def cliente_openai(self):
+        """Cliente de OpenAI compartido del proceso (ver `get_openai_client()`)."""
+        return get_openai_client()
+
+    @property
+    def embedding_fn(self):
+        """Servicio de embeddings compartido del proceso (el mismo que usa la indexación)."""
+        if self._embedding_fn is None:
+            with self._lock:
+                if self._embedding_fn is None:
+                    self._embedding_fn = obtener_servicio_embeddings(self.embedding_model)
+        return self._embedding_fn
+
+    @property
+    def coleccion(self):
+        """
+        Colección de ChromaDB, abierta en el primer uso.
+
+        Lanza `ErrorModeloEmbeddings` si la colección se indexó con otro modelo.
+        """
+        if self._coleccion is None:
+            embedding_fn = self.embedding_fn
+            with self._lock:
+                if self._coleccion is None:
+                    chroma_client = chromadb.PersistentClient(path=self.chroma_path)
+                    coleccion = chroma_client.get_collection(self.collection_name, embedding_function=embedding_fn)
+                    verificar_modelo_coleccion(coleccion, embedding_fn)
+                    self._coleccion = coleccion
+        return self._coleccion
 
-# Inicializar cliente de ChromaDB y cargar colección
-chroma_client = chromadb.PersistentClient(path="chroma_data")
-coleccion = chroma_client.get_collection("normatividad")
+    @property
+    def reranker(self):
+        """Cross-encoder de re-ranking (`rerank_modelo`), cargado en CPU en el primer uso."""
+        if self._reranker is None:
+            with self._lock:
+                if self._reranker is None:
+                    # Se importa aquí para no cargar el modelo ni sus dependencias si no se usa
+                    from sentence_transformers import CrossEncoder
+                    self._reranker = CrossEncoder(self.parametros_rag["rerank_modelo"], device="cpu")
+        return self._reranker
 
-# Cargar catálogo de nombres legibles
-with open("metadata/catalogo_normatividad.json", "r", encoding="utf-8") as f:
-    CATALOGO_NORMAS = json.load(f)
+    @property
+    def indice_bm25(self):
+        """
+        Índice BM25 de la colección, o None si no se ha construido.
 
-def consultar_contexto_rag(mensaje_usuario, k=10):
+        Se vuelve a abrir cuando una indexación lo reemplaza en disco, para que un proceso
+        de larga duración vea los fragmentos nuevos.
+        """
+        meta = os.path.join(ruta_indice_bm25(self.chroma_path, self.collection_name), "meta.json")
+        mtime = os.path.getmtime(meta) if os.path.exists(meta) else None
+        if mtime != self._mtime_bm25:
+            with self._lock:
+                if mtime != self._mtime_bm25:
+                    self._indice_bm25 = IndiceBM25.cargar(os.path.dirname(meta)) if mtime else None
+                    self._mtime_bm25 = mtime
+        return self._indice_bm25
+
+    @property
+    def catalogo(self):
+        """Catálogo {archivo: nombre legible}, cargado en el primer uso."""
+        if self._catalogo is None:
+            with self._lock:
+                if self._catalogo is None:
+                    with open(self.catalogo_path, "r", encoding="utf-8") as f:
+                        self._catalogo = json.load(f)
+        return self._catalogo
+
+
+_servicio = None
+_servicio_lock = threading.Lock()
+
+
+def obtener_servicio_rag():
+    """
+    Devuelve el `RAGService` compartido del proceso, creándolo desde config.yaml si no existe.
+
+    Returns
+    -------
+    RAGService
+        Instancia única por proceso.
+    """
+    global _servicio
+    if _servicio is None:
+        with _servicio_lock:
+            if _servicio is None:
+                _servicio = RAGService.desde_config()
+    return _servicio
+
+def fusion_rrf(rankings, k=60):
     """
-    Recupera los fragmentos más relevantes desde ChromaDB y extrae fuentes normativas.
+    Combina varias listas ordenadas de IDs con fusión por rango recíproco (RRF).
+
+    Cada ID recibe la suma de 1 / (k + posición) sobre las listas donde aparece, de modo
+    que los fragmentos que quedan arriba en ambas búsquedas suben en el resultado final.
+
+    Parameters
+    ----------
+    rankings : list[list[str]]
+        Listas de IDs, cada una ordenada de más a menos relevante.
+    k : int
+        Constante de suavizado de RRF (por defecto: 60).
+
+    Returns
+    -------
+    list[tuple (id:str, puntuacion:float)]
+        IDs ordenados por puntuación combinada, de mayor a menor.
+    """
+    puntuaciones = {}
+    for ranking in rankings:
+        for posicion, id_fragmento in enumerate(ranking, start=1):
+            puntuaciones[id_fragmento] = puntuaciones.get(id_fragmento, 0.0) + 1.0 / (k + posicion)
+    return sorted(puntuaciones.items(), key=lambda par: par[1], reverse=True)
+
+def filtro_desde_solicitud(*textos):
+    """
+    Deriva una cláusula `where` de ChromaDB a partir de las circulares citadas en la solicitud.
+
+    Parameters
+    ----------
+    *textos : str
+        Textos de la solicitud (por ejemplo, título y mensaje del correo).
+
+    Returns
+    -------
+    dict or None
+        {"circular": "34/2010"} si se cita una circular, {"circular": {"$in": [...]}} si se
+        citan varias, o None si no se cita ninguna.
+    """
+    circulares = []
+    for texto in textos:
+        for circular in identificar_circulares(texto or ""):
+            if circular["circular"] not in circulares:
+                circulares.append(circular["circular"])
+    if not circulares:
+        return None
+    if len(circulares) == 1:
+        return {"circular": circulares[0]}
+    return {"circular": {"$in": circulares}}
+
+def _buscar_candidatos(mensaje_usuario, k, embedding=None, hibrido=None, where=None):
+    """
+    Busca los `k` fragmentos más relevantes con la búsqueda vectorial y, si procede, la léxica.
+
+    En modo híbrido se combinan los `candidatos` mejores resultados de la búsqueda vectorial
+    de ChromaDB y del índice léxico BM25 con fusión por rango recíproco, y se conservan los
+    `k` primeros. Si el índice BM25 no existe se usa solo la búsqueda vectorial.
+
+    Con `where`, ambas búsquedas se limitan a los fragmentos cuyos metadatos cumplen el
+    filtro; si ningún fragmento lo cumple, se busca en toda la colección.
 
     Parameters
     ----------
@@ -42,20 +264,348 @@ def consultar_contexto_rag(mensaje_usuario, k=10):
         Pregunta del usuario corregida y limpia.
     k : int
         Número de fragmentos a recuperar.
+    embedding : list[float], optional
+        Embedding ya calculado de `mensaje_usuario`, para no calcularlo dos veces.
+    hibrido : bool, optional
+        Si se combina con BM25 (por defecto: `hibrido` de la sección `rag`).
+    where : dict, optional
+        Filtro de metadatos de ChromaDB, por ejemplo {"circular": "34/2010"} o
+        {"anio": {"$gte": 2020}} (ver `filtro_desde_solicitud()`).
+
+    Returns
+    -------
+    list[dict]
+        Fragmentos ordenados por relevancia, con las claves "id", "texto", "metadata",
+        "distancia" (None si el fragmento solo vino de BM25) y "score".
+    """
+    embeddings = None if embedding is None else [embedding]
+    return _buscar_candidatos_lote([mensaje_usuario], k, embeddings=embeddings, hibrido=hibrido, wheres=[where])[0]
+
+@instrumentar("chroma")
+def _buscar_candidatos_lote(mensajes, k, embeddings=None, hibrido=None, wheres=None):
+    """
+    Versión por lotes de `_buscar_candidatos()`: una sola consulta multi-pregunta a ChromaDB.
+
+    Los mensajes se agrupan por filtro `where` y cada grupo se consulta con una sola llamada
+    a `coleccion.query` (sin filtros, una llamada para todo el lote). Los fragmentos que solo
+    aporta BM25 se leen de la colección también con una sola llamada.
+
+    Parameters
+    ----------
+    mensajes : list[str]
+        Preguntas corregidas y limpias.
+    k : int
+        Número de fragmentos a recuperar por pregunta.
+    embeddings : list[list[float]], optional
+        Embeddings ya calculados de `mensajes` (por defecto se calculan todos en un lote).
+    hibrido : bool, optional
+        Si se combina con BM25 (por defecto: `hibrido` de la sección `rag`).
+    wheres : list[dict or None], optional
+        Filtro de metadatos de cada pregunta (por defecto: ninguno).
+
+    Returns
+    -------
+    list[list[dict]]
+        Fragmentos de cada pregunta, en el mismo orden (ver `_buscar_candidatos()`).
+    """
+    servicio = obtener_servicio_rag()
+    parametros = servicio.parametros_rag
+    hibrido = parametros["hibrido"] if hibrido is None else hibrido
+    indice = servicio.indice_bm25 if hibrido else None
+    n_vectorial = max(k, parametros["candidatos"]) if indice is not None else k
+    wheres = list(wheres) if wheres else [None] * len(mensajes)
+    if embeddings is None:
+        embeddings = servicio.embedding_fn(mensajes)
+
+    coleccion = servicio.coleccion
+    vectoriales = [None] * len(mensajes)
+
+    def consultar(indices, where):
+        resultados = coleccion.query(query_embeddings=[embeddings[i] for i in indices],
+                                     n_results=n_vectorial, where=where or None)
+        vacios = []
+        for j, i in enumerate(indices):
+            if where and not resultados["ids"][j]:
+                vacios.append(i)
+                continue
+            vectoriales[i] = {
+                id_fragmento: {"id": id_fragmento, "texto": documento, "metadata": metadata,
+                               "distancia": distancia, "score": 1.0 - distancia}
+                for id_fragmento, documento, metadata, distancia in zip(
+                    resultados["ids"][j], resultados["documents"][j],
+                    resultados["metadatas"][j], resultados["distances"][j]
+                )
+            }
+        return vacios
+
+    grupos = {}
+    for i, where in enumerate(wheres):
+        grupos.setdefault(json.dumps(where or None, sort_keys=True), []).append(i)
+    vacios = []
+    for indices in grupos.values():
+        vacios.extend(consultar(indices, wheres[indices[0]]))
+    if vacios:
+        logger.info("Ningún fragmento cumple el filtro en %d consultas; se busca en toda la colección.", len(vacios))
+        for i in vacios:
+            wheres[i] = None
+        consultar(vacios, None)
+    if indice is None:
+        return [list(fragmentos.values())[:k] for fragmentos in vectoriales]
+
+    candidatos = parametros["candidatos"]
+    fusionados = []
+    for mensaje, fragmentos, where in zip(mensajes, vectoriales, wheres):
+        # Con filtro se piden más candidatos léxicos, porque muchos se descartan al aplicarlo
+        lexicos = [id_fragmento for id_fragmento, _ in indice.buscar(mensaje, candidatos * (5 if where else 1))]
+        if where and lexicos:
+            permitidos = set(coleccion.get(ids=lexicos, where=where, include=[])["ids"])
+            lexicos = [id_fragmento for id_fragmento in lexicos if id_fragmento in permitidos][:candidatos]
+        fusionados.append(fusion_rrf([list(fragmentos), lexicos], k=parametros["rrf_k"])[:k])
+
+    faltantes = sorted({
+        id_fragmento for fragmentos, ranking in zip(vectoriales, fusionados)
+        for id_fragmento, _ in ranking if id_fragmento not in fragmentos
+    })
+    lexicos = {}
+    if faltantes:
+        extra = coleccion.get(ids=faltantes, include=["documents", "metadatas"])
+        for id_fragmento, documento, metadata in zip(extra["ids"], extra["documents"], extra["metadatas"]):
+            lexicos[id_fragmento] = {"id": id_fragmento, "texto": documento, "metadata": metadata,
+                                     "distancia": None}
+    return [
+        [
+            {**(fragmentos.get(id_fragmento) or lexicos[id_fragmento]), "score": puntuacion}
+            for id_fragmento, puntuacion in ranking if id_fragmento in fragmentos or id_fragmento in lexicos
+        ]
+        for fragmentos, ranking in zip(vectoriales, fusionados)
+    ]
+
+def reordenar_fragmentos(mensaje_usuario, fragmentos, top_n):
+    """
+    Reordena fragmentos con el cross-encoder y conserva los `top_n` mejores.
+
+    El cross-encoder lee la pregunta y cada fragmento juntos, por lo que distingue mejor que
+    la búsqueda vectorial qué fragmentos la responden; los pares se evalúan por lotes.
+
+    Parameters
+    ----------
+    mensaje_usuario : str
+        Pregunta del usuario corregida y limpia.
+    fragmentos : list[dict]
+        Candidatos devueltos por la búsqueda.
+    top_n : int
+        Número de fragmentos a conservar.
+
+    Returns
+    -------
+    list[dict]
+        Los `top_n` fragmentos con mayor puntuación del cross-encoder, que reemplaza a "score".
+    """
+    return reordenar_fragmentos_lote([mensaje_usuario], [fragmentos], top_n)[0]
+
+@instrumentar("rerank")
+def reordenar_fragmentos_lote(mensajes, listas_fragmentos, top_n):
+    """
+    Versión por lotes de `reordenar_fragmentos()`: evalúa los pares de todas las preguntas
+    con una sola llamada al cross-encoder.
+
+    Parameters
+    ----------
+    mensajes : list[str]
+        Preguntas corregidas y limpias.
+    listas_fragmentos : list[list[dict]]
+        Candidatos de cada pregunta.
+    top_n : int
+        Número de fragmentos a conservar por pregunta.
+
+    Returns
+    -------
+    list[list[dict]]
+        Los `top_n` mejores fragmentos de cada pregunta, en el mismo orden.
+    """
+    pares = [(mensaje, f["texto"]) for mensaje, fragmentos in zip(mensajes, listas_fragmentos) for f in fragmentos]
+    if not pares:
+        return [[] for _ in listas_fragmentos]
+    servicio = obtener_servicio_rag()
+    puntuaciones = servicio.reranker.predict(
+        pares,
+        batch_size=servicio.parametros_rag["rerank_batch_size"],
+        show_progress_bar=False,
+    )
+    resultado, inicio = [], 0
+    for fragmentos in listas_fragmentos:
+        fin = inicio + len(fragmentos)
+        reordenados = [{**f, "score": float(p)} for f, p in zip(fragmentos, puntuaciones[inicio:fin])]
+        reordenados.sort(key=lambda f: f["score"], reverse=True)
+        resultado.append(reordenados[:top_n])
+        inicio = fin
+    return resultado
+
+def recuperar_fragmentos(mensaje_usuario, k=None, embedding=None, hibrido=None, where=None, metricas=None):
+    """
+    Recupera los fragmentos más relevantes con sus IDs y metadatos.
+
+    Los candidatos se buscan combinando la búsqueda vectorial y la léxica (BM25) con fusión
+    por rango recíproco. Si `rerank` está habilitado en la sección `rag`, se piden
+    `rerank_candidatos` candidatos y el cross-encoder elige los `k` mejores.
+
+    Parameters
+    ----------
+    mensaje_usuario : str
+        Pregunta del usuario corregida y limpia.
+    k : int, optional
+        Número de fragmentos a devolver (por defecto: `rerank_top_n` con re-ranking, o `k`
+        de la sección `rag` sin él).
+    embedding : list[float], optional
+        Embedding ya calculado de `mensaje_usuario`, para no calcularlo dos veces.
+    hibrido : bool, optional
+        Si se combina con BM25 (por defecto: `hibrido` de la sección `rag`).
+    where : dict, optional
+        Filtro de metadatos de ChromaDB, por ejemplo {"circular": "34/2010"} o
+        {"anio": {"$gte": 2020}} (ver `filtro_desde_solicitud()`).
+    metricas : dict, optional
+        Si se proporciona, se le agregan "busqueda_segundos" y, con re-ranking,
+        "rerank_segundos".
+
+    Returns
+    -------
+    list[dict]
+        Fragmentos ordenados por relevancia, con las claves "id", "texto", "metadata",
+        "distancia" (None si el fragmento solo vino de BM25) y "score".
+    """
+    embeddings = None if embedding is None else [embedding]
+    return recuperar_fragmentos_lote([mensaje_usuario], k, embeddings=embeddings, hibrido=hibrido,
+                                     wheres=[where], metricas=metricas)[0]
+
+@instrumentar("recuperacion")
+def recuperar_fragmentos_lote(mensajes, k=None, embeddings=None, hibrido=None, wheres=None, metricas=None):
+    """
+    Versión por lotes de `recuperar_fragmentos()`.
+
+    Los embeddings se calculan en un solo lote, la búsqueda vectorial se hace con una
+    consulta multi-pregunta a ChromaDB y el re-ranking con una sola llamada al cross-encoder.
+
+    Parameters
+    ----------
+    mensajes : list[str]
+        Preguntas corregidas y limpias.
+    k : int, optional
+        Número de fragmentos a devolver por pregunta (ver `recuperar_fragmentos()`).
+    embeddings : list[list[float]], optional
+        Embeddings ya calculados de `mensajes`.
+    hibrido : bool, optional
+        Si se combina con BM25 (por defecto: `hibrido` de la sección `rag`).
+    wheres : list[dict or None], optional
+        Filtro de metadatos de cada pregunta (por defecto: ninguno).
+    metricas : dict, optional
+        Si se proporciona, se le agregan "busqueda_segundos" y, con re-ranking,
+        "rerank_segundos" del lote completo.
+
+    Returns
+    -------
+    list[list[dict]]
+        Fragmentos de cada pregunta, en el mismo orden (ver `recuperar_fragmentos()`).
+    """
+    parametros = obtener_servicio_rag().parametros_rag
+    metricas = {} if metricas is None else metricas
+    if not mensajes:
+        return []
+    rerank = parametros["rerank"]
+    k = k or (parametros["rerank_top_n"] if rerank else parametros["k"])
+    n_candidatos = max(k, parametros["rerank_candidatos"]) if rerank else k
+
+    inicio = time.perf_counter()
+    listas_fragmentos = _buscar_candidatos_lote(mensajes, n_candidatos, embeddings=embeddings, hibrido=hibrido,
+                                                wheres=wheres)
+    metricas["busqueda_segundos"] = time.perf_counter() - inicio
+    if not rerank:
+        return listas_fragmentos
+
+    inicio = time.perf_counter()
+    listas_fragmentos = reordenar_fragmentos_lote(mensajes, listas_fragmentos, k)
+    metricas["rerank_segundos"] = time.perf_counter() - inicio
+    logger.info("Re-ranking de %d preguntas con %d candidatos en %.3f s.",
+                len(mensajes), n_candidatos, metricas["rerank_segundos"])
+    return listas_fragmentos
+
+def consultar_contexto_rag(mensaje_usuario, k=None, where=None, model="gpt-3.5-turbo", metricas=None):
+    """
+    Recupera los fragmentos más relevantes (búsqueda híbrida) y extrae fuentes normativas.
+
+    Los fragmentos duplicados se descartan y el contexto se ajusta al presupuesto de tokens
+    de `model` (ver `empaquetar_contexto()`).
+
+    Parameters
+    ----------
+    mensaje_usuario : str
+        Pregunta del usuario corregida y limpia.
+    k : int, optional
+        Número de fragmentos a recuperar (por defecto: `k` de la sección `rag` de config.yaml).
+    where : dict, optional
+        Filtro de metadatos de ChromaDB. Por defecto se deriva de las circulares citadas en
+        `mensaje_usuario` con `filtro_desde_solicitud()`; `{}` busca en toda la colección.
+    model : str
+        Modelo que recibirá el contexto (por defecto: gpt-3.5-turbo).
+    metricas : dict, optional
+        Tiempos de búsqueda y re-ranking (ver `recuperar_fragmentos()`).
 
     Returns
     -------
     tuple (contexto:str, fuentes:set)
         Texto combinado de fragmentos relevantes y conjunto de nombres de normativas (source).
     """
-    resultados = coleccion.query(
-        query_texts=[mensaje_usuario],
-        n_results=k
-    )
-    documentos = resultados["documents"][0]
-    metadatos = resultados["metadatas"][0]
-    fuentes = set(md.get("source", "Desconocido") for md in metadatos)
-    contexto = "\n\n".join(documentos)
+    return consultar_contexto_rag_lote([mensaje_usuario], k, where=where, model=model, metricas=metricas)[0]
+
+def consultar_contexto_rag_lote(mensajes, k=None, where=None, model="gpt-3.5-turbo", metricas=None):
+    """
+    Versión por lotes de `consultar_contexto_rag()` para evaluaciones y colas de preguntas.
+
+    En lugar de una consulta y un cálculo de embedding por pregunta, todas las preguntas se
+    convierten en un solo lote y se buscan con una consulta multi-pregunta a ChromaDB (una
+    por filtro distinto cuando las preguntas citan circulares).
+
+    Parameters
+    ----------
+    mensajes : list[str]
+        Preguntas corregidas y limpias.
+    k : int, optional
+        Número de fragmentos a recuperar por pregunta.
+    where : dict, optional
+        Filtro para todas las preguntas. Por defecto se deriva de cada pregunta con
+        `filtro_desde_solicitud()`; `{}` busca en toda la colección.
+    model : str
+        Modelo que recibirá los contextos (por defecto: gpt-3.5-turbo).
+    metricas : dict, optional
+        Tiempos de búsqueda y re-ranking del lote (ver `recuperar_fragmentos_lote()`).
+
+    Returns
+    -------
+    list[tuple (contexto:str, fuentes:set)]
+        Contexto y fuentes de cada pregunta, en el mismo orden.
+    """
+    wheres = [filtro_desde_solicitud(mensaje) if where is None else where for mensaje in mensajes]
+    listas_fragmentos = recuperar_fragmentos_lote(mensajes, k, wheres=wheres, metricas=metricas)
+    return [_armar_contexto(fragmentos, model) for fragmentos in listas_fragmentos]
+
+@instrumentar("contexto")
+def _armar_contexto(fragmentos, model="gpt-3.5-turbo"):
+    """
+    Arma el contexto con `empaquetar_contexto()` y reúne las fuentes de los fragmentos incluidos.
+
+    Parameters
+    ----------
+    fragmentos : list[dict]
+        Fragmentos devueltos por `recuperar_fragmentos()`.
+    model : str
+        Modelo que recibirá el prompt; determina el presupuesto de tokens.
+
+    Returns
+    -------
+    tuple (contexto:str, fuentes:set)
+        Texto combinado de fragmentos y conjunto de nombres de normativas (source).
+    """
+    contexto, fuentes, estadisticas = empaquetar_contexto(fragmentos, model=model)
+    anotar(tokens_contexto=estadisticas["tokens_contexto"], tokens_ahorrados=estadisticas["tokens_ahorrados"])
     return contexto, fuentes
 
 def normalizar_fuentes(fuentes):
@@ -72,9 +622,11 @@ def normalizar_fuentes(fuentes):
     list[str]
         Lista de nombres legibles de normatividad
     """
-    return [CATALOGO_NORMAS.get(f, f) for f in sorted(fuentes)]
+    catalogo = obtener_servicio_rag().catalogo
+    return [catalogo.get(f, f) for f in sorted(fuentes)]
 
-def generar_respuesta_con_contexto(mensaje_usuario, contexto, fuentes, model="gpt-3.5-turbo"):
+@instrumentar("generacion")
+def generar_respuesta_con_contexto(mensaje_usuario, contexto, fuentes, model="gpt-3.5-turbo", metricas=None):
     """
     Genera una respuesta normativa profesional basada en los fragmentos recuperados y fuentes legales.
 
@@ -88,12 +640,102 @@ def generar_respuesta_con_contexto(mensaje_usuario, contexto, fuentes, model="gp
         Conjunto de nombres de normativas (archivo fuente).
     model : str
         Modelo de lenguaje a utilizar (por defecto: gpt-3.5-turbo).
+    metricas : dict, optional
+        Si se proporciona, se le agrega "generacion_segundos".
 
     Returns
     -------
     str
         Respuesta generada por el modelo en estilo institucional.
     """
+    inicio = time.perf_counter()
+    response = obtener_servicio_rag().cliente_openai.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "user", "content": construir_prompt(mensaje_usuario, contexto, fuentes)}
+        ],
+        temperature=0.3,
+        max_tokens=1024
+    )
+    if metricas is not None:
+        metricas["generacion_segundos"] = time.perf_counter() - inicio
+    if response.usage is not None:
+        logger.info("Respuesta con %s: %d tokens de prompt y %d de respuesta.",
+                    model, response.usage.prompt_tokens, response.usage.completion_tokens)
+        registrar_tokens(model, response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response.choices[0].message.content.strip()
+
+@instrumentar("generacion")
+def generar_respuesta_con_contexto_stream(mensaje_usuario, contexto, fuentes, model="gpt-3.5-turbo", metricas=None):
+    """
+    Versión en streaming de `generar_respuesta_con_contexto()`: produce el texto conforme llega.
+
+    Parameters
+    ----------
+    mensaje_usuario : str
+        Solicitud del usuario (ya corregida).
+    contexto : str
+        Texto combinado de fragmentos normativos.
+    fuentes : set
+        Conjunto de nombres de normativas (archivo fuente).
+    model : str
+        Modelo de lenguaje a utilizar (por defecto: gpt-3.5-turbo).
+    metricas : dict, optional
+        Si se proporciona, se le agregan "primer_token_segundos" (tiempo hasta el primer
+        fragmento de texto) y "generacion_segundos" (tiempo total de la generación).
+
+    Yields
+    ------
+    str
+        Fragmentos de texto de la respuesta, en orden.
+    """
+    metricas = {} if metricas is None else metricas
+    inicio = time.perf_counter()
+    stream = obtener_servicio_rag().cliente_openai.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "user", "content": construir_prompt(mensaje_usuario, contexto, fuentes)}
+        ],
+        temperature=0.3,
+        max_tokens=1024,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    with stream:
+        for evento in stream:
+            if evento.usage is not None:
+                logger.info("Respuesta con %s: %d tokens de prompt y %d de respuesta.",
+                            model, evento.usage.prompt_tokens, evento.usage.completion_tokens)
+                registrar_tokens(model, evento.usage.prompt_tokens, evento.usage.completion_tokens)
+            if not evento.choices or not evento.choices[0].delta.content:
+                continue
+            if "primer_token_segundos" not in metricas:
+                metricas["primer_token_segundos"] = time.perf_counter() - inicio
+                anotar(primer_token_segundos=round(metricas["primer_token_segundos"], 4))
+            yield evento.choices[0].delta.content
+    metricas["generacion_segundos"] = time.perf_counter() - inicio
+    logger.info("Generación en streaming: primer token en %.2f s, total %.2f s.",
+                metricas.get("primer_token_segundos", metricas["generacion_segundos"]),
+                metricas["generacion_segundos"])
+
+def construir_prompt(mensaje_usuario, contexto, fuentes):
+    """
+    Construye el prompt de generación con las normativas, el contexto y la solicitud.
+
+    Parameters
+    ----------
+    mensaje_usuario : str
+        Solicitud del usuario (ya corregida).
+    contexto : str
+        Texto combinado de fragmentos normativos.
+    fuentes : set
+        Conjunto de nombres de normativas (archivo fuente).
+
+    Returns
+    -------
+    str
+        Prompt para el modelo de lenguaje.
+    """
     nombres_legibles = normalizar_fuentes(fuentes)
     lista_normas = "\n".join(f"- {n}" for n in nombres_legibles)
 
@@ -120,32 +762,175 @@ def generar_respuesta_con_contexto(mensaje_usuario, contexto, fuentes, model="gp
 
     Redacta una respuesta profesional y normativa, citando al menos una de las normativas mencionadas si su contenido es utilizado.
     """
+    return prompt
 
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.3,
-        max_tokens=1024
+def _respuesta_en_cache(embedding, model):
+    """
+    Busca una respuesta reutilizable en la caché semántica y verifica que siga vigente.
+
+    La entrada solo se sirve si los fragmentos que se usaron para generarla siguen en la
+    colección con el mismo contenido; si alguno se reindexó, la entrada se invalida.
+
+    Parameters
+    ----------
+    embedding : list[float]
+        Embedding de la pregunta.
+    model : str
+        Modelo con el que se generaría la respuesta.
+
+    Returns
+    -------
+    dict or None
+        Entrada de la caché (ver `CacheSemantica.buscar()`) o None.
+    """
+    servicio = obtener_servicio_rag()
+    entrada = servicio.cache_semantica.buscar(embedding, model)
+    if entrada is None:
+        return None
+    actuales = servicio.coleccion.get(ids=entrada["ids"], include=["documents"])
+    if huella_fragmentos(actuales["ids"], actuales["documents"]) != entrada["huella"]:
+        servicio.cache_semantica.invalidar(entrada)
+        return None
+    return entrada
+
+def preparar_respuesta(json_correo, model, k, metricas):
+    """
+    Ejecuta todo lo que precede a la generación: caché semántica, recuperación y contexto.
+
+    Parameters
+    ----------
+    json_correo : dict
+        Diccionario con las claves: 'origen', 'titulo', 'mensaje'
+    model : str
+        Modelo de lenguaje que generará la respuesta.
+    k : int or None
+        Número de fragmentos a recuperar.
+    metricas : dict or None
+        Tiempos de la solicitud (ver `recuperar_fragmentos()`).
+
+    Returns
+    -------
+    dict
+        Estado de la solicitud con "inicio", "mensaje", "embedding", "clave_cache" y, o bien
+        "respuesta" (servida desde la caché), o bien "fragmentos", "contexto" y "fuentes".
+    """
+    inicio = time.perf_counter()
+    servicio = obtener_servicio_rag()
+    mensaje = json_correo["mensaje"]
+    with tramo("embedding"):
+        embedding = servicio.embedding_fn([mensaje])[0]
+    where = filtro_desde_solicitud(json_correo.get("titulo"), mensaje)
+    # Preguntas parecidas sobre circulares distintas no comparten respuesta en la caché
+    clave_cache = model if where is None else f"{model}|{json.dumps(where, sort_keys=True)}"
+    solicitud = {"inicio": inicio, "mensaje": mensaje, "embedding": embedding, "clave_cache": clave_cache}
+
+    entrada = _respuesta_en_cache(embedding, clave_cache)
+    if entrada is not None:
+        servicio.cache_semantica.registrar_acierto(entrada, time.perf_counter() - inicio)
+        anotar(cache_semantica=True)
+        logger.info("Respuesta servida desde caché semántica (similitud %.3f): %s",
+                    entrada["similitud"], servicio.cache_semantica.estadisticas())
+        solicitud["respuesta"] = entrada["respuesta"]
+        return solicitud
+
+    fragmentos = recuperar_fragmentos(mensaje, k, embedding=embedding, where=where, metricas=metricas)
+    solicitud["fragmentos"] = fragmentos
+    solicitud["contexto"], solicitud["fuentes"] = _armar_contexto(fragmentos, model)
+    return solicitud
+
+def guardar_respuesta(solicitud, respuesta):
+    """
+    Guarda en la caché semántica la respuesta generada para una solicitud preparada.
+
+    Parameters
+    ----------
+    solicitud : dict
+        Estado devuelto por `preparar_respuesta()`.
+    respuesta : str
+        Respuesta completa del modelo.
+
+    Returns
+    -------
+    None
+    """
+    fragmentos = solicitud["fragmentos"]
+    ids = [f["id"] for f in fragmentos]
+    obtener_servicio_rag().cache_semantica.guardar(
+        solicitud["embedding"], solicitud["clave_cache"], ids,
+        huella_fragmentos(ids, [f["texto"] for f in fragmentos]),
+        respuesta, time.perf_counter() - solicitud["inicio"]
     )
-    return response.choices[0].message.content.strip()
 
-def responder_desde_json(json_correo):
+@instrumentar("respuesta")
+def responder_desde_json(json_correo, model="gpt-3.5-turbo", k=None, metricas=None):
     """
     Flujo completo: dado un JSON generado por el OCR, recupera contexto y genera la respuesta.
 
+    Antes de consultar ChromaDB y el LLM se busca en la caché semántica una pregunta
+    suficientemente parecida cuyos fragmentos no hayan sido reindexados; si existe, se
+    devuelve su respuesta. Si el título o el mensaje citan circulares, la búsqueda se limita
+    a sus fragmentos (ver `filtro_desde_solicitud()`).
+
     Parameters
     ----------
     json_correo : dict
         Diccionario con las claves: 'origen', 'titulo', 'mensaje'
+    model : str
+        Modelo de lenguaje a utilizar (por defecto: gpt-3.5-turbo).
+    k : int, optional
+        Número de fragmentos a recuperar (por defecto: `k` de la sección `rag` de config.yaml).
+    metricas : dict, optional
+        Si se proporciona, se le agregan los tiempos de búsqueda, re-ranking y generación
+        (ver `recuperar_fragmentos()` y `generar_respuesta_con_contexto()`).
 
     Returns
     -------
     str
         Respuesta normativa completa generada con ayuda de contexto.
     """
-    mensaje = json_correo["mensaje"]
-    contexto, fuentes = consultar_contexto_rag(mensaje)
-    respuesta = generar_respuesta_con_contexto(mensaje, contexto, fuentes)
-    return respuesta
\ No newline at end of file
+    solicitud = preparar_respuesta(json_correo, model, k, metricas)
+    if "respuesta" in solicitud:
+        return solicitud["respuesta"]
+    respuesta = generar_respuesta_con_contexto(
+        solicitud["mensaje"], solicitud["contexto"], solicitud["fuentes"], model=model, metricas=metricas
+    )
+    guardar_respuesta(solicitud, respuesta)
+    return respuesta
+
+@instrumentar("respuesta")
+def responder_desde_json_stream(json_correo, model="gpt-3.5-turbo", k=None, metricas=None):
+    """
+    Versión en streaming de `responder_desde_json()`: produce la respuesta por partes.
+
+    La recuperación y la caché funcionan igual; una respuesta servida desde la caché se
+    produce en una sola parte. Al terminar el streaming la respuesta completa se guarda en
+    la caché semántica.
+
+    Parameters
+    ----------
+    json_correo : dict
+        Diccionario con las claves: 'origen', 'titulo', 'mensaje'
+    model : str
+        Modelo de lenguaje a utilizar (por defecto: gpt-3.5-turbo).
+    k : int, optional
+        Número de fragmentos a recuperar (por defecto: `k` de la sección `rag` de config.yaml).
+    metricas : dict, optional
+        Si se proporciona, se le agregan los tiempos de búsqueda, re-ranking, primer token
+        y generación (ver `generar_respuesta_con_contexto_stream()`).
+
+    Yields
+    ------
+    str
+        Fragmentos de texto de la respuesta, en orden.
+    """
+    solicitud = preparar_respuesta(json_correo, model, k, metricas)
+    if "respuesta" in solicitud:
+        yield solicitud["respuesta"]
+        return
+    partes = []
+    for parte in generar_respuesta_con_contexto_stream(
+        solicitud["mensaje"], solicitud["contexto"], solicitud["fuentes"], model=model, metricas=metricas
+    ):
+        partes.append(parte)
+        yield parte
+    guardar_respuesta(solicitud, "".join(partes).strip())
@@ -0,0 +1,358 @@
+"""
+Descripción
+===========
+
+Este módulo levanta servidores HTTP locales que imitan a Amazon Textract y a la API de chat
+de OpenAI, para medir el rendimiento del flujo sin credenciales ni llamadas a servicios
+externos.
+
+Los servidores reproducen respuestas grabadas con una latencia configurable:
+- Textract (`DetectDocumentText`): devuelve el texto grabado para el documento (por el hash
+  de sus bytes) con bloques PAGE, LINE y WORD como los de la API real.
+- OpenAI (`/v1/chat/completions`): a las solicitudes de corrección ortográfica les devuelve
+  los mismos fragmentos numerados que recibió, y a las de generación una respuesta grabada,
+  con o sin streaming (SSE), incluyendo el uso de tokens.
+
+Para usarlos basta con apuntar `aws.endpoint_url` y `openai.base_url` de config.yaml a la URL
+de cada servidor. Este módulo no depende de la configuración ni de los demás módulos del
+proyecto.
+
+Funciones
+===========
+
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import base64
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FRAGMENTO_NUMERADO = re.compile(r"^\s*\[(\d+)\]\s*(.*?)\s*$", re.MULTILINE)
+
+RESPUESTA_GRABADA = (
+    "En atención a su solicitud, le informamos que las disposiciones aplicables se encuentran "
+    "en la normatividad emitida por el Banco de México. Conforme a dichas disposiciones, las "
+    "instituciones deben informar a sus clientes las condiciones de los productos contratados, "
+    "los cargos y comisiones aplicables, así como los plazos y medios para presentar "
+    "aclaraciones. Le sugerimos revisar los artículos citados y, en su caso, acudir a su "
+    "institución para dar seguimiento a su caso particular."
+)
+
+
+def hash_documento(content):
+    """SHA-256 de los bytes de un documento, con el que se buscan sus respuestas grabadas."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def texto_ocr_desde_json(json_correo):
+    """
+    Reconstruye un texto OCR plausible (con el ruido de una interfaz de correo) a partir de
+    un JSON de correo como los de `output/`.
+
+    Parameters
+    ----------
+    json_correo : dict
+        Diccionario con "origen", "titulo" y "mensaje".
+
+    Returns
+    -------
+    str
+        Texto con el encabezado "[ORIGEN] titulo", líneas de ruido y el mensaje.
+    """
+    lineas = [
+        f"[{json_correo['origen']}] {json_correo['titulo']}",
+        "Para: transparencia@banxico.org.mx",
+        "Responder",
+        "lun 12/05/2025 10:31 AM",
+    ]
+    lineas += [linea for linea in json_correo["mensaje"].splitlines() if linea.strip()]
+    lineas.append("Saludos cordiales")
+    return "\n".join(lineas)
+
+
+def grabaciones_desde_ejemplos(carpeta_documentos="ejemplos_ocr", carpeta_json="output"):
+    """
+    Asocia cada documento de ejemplo con el texto OCR reconstruido desde su JSON de salida.
+
+    Parameters
+    ----------
+    carpeta_documentos : str
+        Carpeta con las imágenes de ejemplo (por ejemplo, "ejemplos_ocr/ej1.png").
+    carpeta_json : str
+        Carpeta con los JSON generados para cada imagen ("output/ej1.json").
+
+    Returns
+    -------
+    dict
+        {hash del documento: texto OCR}.
+    """
+    grabaciones = {}
+    for archivo in sorted(os.listdir(carpeta_documentos)):
+        ruta_json = os.path.join(carpeta_json, os.path.splitext(archivo)[0] + ".json")
+        if not os.path.exists(ruta_json):
+            continue
+        with open(os.path.join(carpeta_documentos, archivo), "rb") as f:
+            clave = hash_documento(f.read())
+        with open(ruta_json, "r", encoding="utf-8") as f:
+            grabaciones[clave] = texto_ocr_desde_json(json.load(f))
+    return grabaciones
+
+
+def bloques_textract(texto, confianza=99.0):
+    """
+    Convierte un texto en los bloques PAGE, LINE y WORD de una respuesta de Textract.
+
+    Parameters
+    ----------
+    texto : str
+        Texto de la página, una línea por renglón.
+    confianza : float
+        Confianza de cada palabra.
+
+    Returns
+    -------
+    list[dict]
+        Bloques con IDs únicos y las relaciones CHILD de la página a sus líneas.
+    """
+    pagina = {"BlockType": "PAGE", "Id": uuid.uuid4().hex, "Relationships": [{"Type": "CHILD", "Ids": []}]}
+    bloques = [pagina]
+    for linea in (l for l in texto.splitlines() if l.strip()):
+        id_linea = uuid.uuid4().hex
+        pagina["Relationships"][0]["Ids"].append(id_linea)
+        palabras = [{"BlockType": "WORD", "Id": uuid.uuid4().hex, "Text": p, "Confidence": confianza}
+                    for p in linea.split()]
+        bloques.append({
+            "BlockType": "LINE", "Id": id_linea, "Text": linea, "Confidence": confianza,
+            "Relationships": [{"Type": "CHILD", "Ids": [p["Id"] for p in palabras]}],
+        })
+        bloques.extend(palabras)
+    return bloques
+
+
+def contar_tokens_aproximado(texto):
+    """Aproximación de tokens de OpenAI (~4 caracteres por token), suficiente para simular `usage`."""
+    return max(1, len(texto) // 4)
+
+
+class ServidorSimulado:
+    """
+    Servidor HTTP local en un hilo en segundo plano, con latencia configurable.
+
+    Parameters
+    ----------
+    manejador : type
+        Subclase de `BaseHTTPRequestHandler` que atiende las solicitudes.
+    latencia : float
+        Segundos de espera promedio antes de cada respuesta.
+    jitter : float
+        Variación relativa de la latencia (0.2 = ±20 %).
+    puerto : int
+        Puerto en 127.0.0.1 (por defecto: uno libre).
+    **estado
+        Atributos que el manejador lee desde `self.server`.
+    """
+
+    def __init__(self, manejador, latencia=0.0, jitter=0.2, puerto=0, **estado):
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", puerto), manejador)
+        self._servidor.daemon_threads = True
+        self._servidor.latencia = latencia
+        self._servidor.jitter = jitter
+        self._servidor.solicitudes = 0
+        self._servidor.lock = threading.Lock()
+        for clave, valor in estado.items():
+            setattr(self._servidor, clave, valor)
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        """URL base del servidor."""
+        host, puerto = self._servidor.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    @property
+    def solicitudes(self):
+        """Solicitudes atendidas hasta el momento."""
+        return self._servidor.solicitudes
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+        return False
+
+
+class _ManejadorBase(BaseHTTPRequestHandler):
+    """Lectura del cuerpo JSON, latencia simulada y respuestas JSON con keep-alive."""
+
+    protocol_version = "HTTP/1.1"
+
+    def _leer_json(self):
+        longitud = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(longitud) or b"{}")
+
+    def _esperar(self, segundos=None):
+        servidor = self.server
+        with servidor.lock:
+            servidor.solicitudes += 1
+        segundos = servidor.latencia if segundos is None else segundos
+        if segundos > 0:
+            time.sleep(segundos * random.uniform(1 - servidor.jitter, 1 + servidor.jitter))
+
+    def _responder_json(self, cuerpo, estado=200, tipo="application/json"):
+        datos = json.dumps(cuerpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, *args):
+        pass
+
+
+class ManejadorTextract(_ManejadorBase):
+    """
+    Imita `DetectDocumentText` de Textract (protocolo JSON de AWS).
+
+    Usa `self.server.grabaciones` ({hash: texto}) y `self.server.texto_por_defecto` para los
+    documentos sin grabación.
+    """
+
+    def do_POST(self):
+        cuerpo = self._leer_json()
+        operacion = self.headers.get("X-Amz-Target", "").rsplit(".", 1)[-1]
+        if operacion != "DetectDocumentText":
+            self._responder_json(
+                {"__type": "InvalidParameterException", "message": f"Operación no simulada: {operacion}"},
+                estado=400, tipo="application/x-amz-json-1.1"
+            )
+            return
+        content = base64.b64decode(cuerpo["Document"]["Bytes"])
+        texto = self.server.grabaciones.get(hash_documento(content), self.server.texto_por_defecto)
+        self._esperar()
+        self._responder_json(
+            {"DocumentMetadata": {"Pages": 1}, "Blocks": bloques_textract(texto),
+             "DetectDocumentTextModelVersion": "1.0"},
+            tipo="application/x-amz-json-1.1"
+        )
+
+
+class ManejadorOpenAI(_ManejadorBase):
+    """
+    Imita `/v1/chat/completions` de OpenAI, con y sin streaming.
+
+    Usa `self.server.respuesta` (texto de las generaciones) y `self.server.latencia_token`
+    (segundos entre fragmentos del streaming).
+    """
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._responder_json({"error": {"message": f"Ruta no simulada: {self.path}"}}, estado=404)
+            return
+        cuerpo = self._leer_json()
+        prompt = "\n".join(m.get("content", "") for m in cuerpo.get("messages", []))
+        fragmentos = FRAGMENTO_NUMERADO.findall(prompt)
+        # Las correcciones se devuelven sin cambios, con la misma numeración que recibieron
+        if fragmentos:
+            texto = "\n".join(f"[{n}] {fragmento}" for n, fragmento in fragmentos)
+        else:
+            texto = self.server.respuesta
+        uso = {"prompt_tokens": contar_tokens_aproximado(prompt), "completion_tokens": contar_tokens_aproximado(texto)}
+        uso["total_tokens"] = uso["prompt_tokens"] + uso["completion_tokens"]
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": cuerpo.get("model")}
+
+        self._esperar()
+        if not cuerpo.get("stream"):
+            self._responder_json({
+                **base, "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": texto}, "finish_reason": "stop"}],
+                "usage": uso,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        palabras = texto.split(" ")
+        for i, palabra in enumerate(palabras):
+            contenido = palabra if i == 0 else " " + palabra
+            self._enviar_evento({**base, "object": "chat.completion.chunk",
+                                 "choices": [{"index": 0, "delta": {"content": contenido}, "finish_reason": None}]})
+            if self.server.latencia_token > 0:
+                time.sleep(self.server.latencia_token)
+        self._enviar_evento({**base, "object": "chat.completion.chunk",
+                             "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (cuerpo.get("stream_options") or {}).get("include_usage"):
+            self._enviar_evento({**base, "object": "chat.completion.chunk", "choices": [], "usage": uso})
+        self._escribir_trozo(b"data: [DONE]\n\n")
+        self._escribir_trozo(b"")
+
+    def _enviar_evento(self, evento):
+        self._escribir_trozo(f"data: {json.dumps(evento, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    def _escribir_trozo(self, datos):
+        # Codificación "chunked" de HTTP/1.1; un trozo vacío cierra la respuesta
+        self.wfile.write(f"{len(datos):X}\r\n".encode("ascii") + datos + b"\r\n")
+        self.wfile.flush()
+
+
+def servidor_textract(grabaciones=None, texto_por_defecto=None, latencia=0.3, jitter=0.2):
+    """
+    Crea un servidor que imita a Textract.
+
+    Parameters
+    ----------
+    grabaciones : dict, optional
+        {hash del documento: texto OCR} (ver `grabaciones_desde_ejemplos()`).
+    texto_por_defecto : str, optional
+        Texto para documentos sin grabación (por defecto: la primera grabación).
+    latencia : float
+        Segundos promedio por solicitud.
+    jitter : float
+        Variación relativa de la latencia.
+
+    Returns
+    -------
+    ServidorSimulado
+        Servidor sin iniciar; se inicia con `with`.
+    """
+    grabaciones = grabaciones or {}
+    if texto_por_defecto is None:
+        texto_por_defecto = next(iter(grabaciones.values()), "[PRUEBA] solicitud\nTexto de prueba.")
+    return ServidorSimulado(ManejadorTextract, latencia=latencia, jitter=jitter,
+                            grabaciones=grabaciones, texto_por_defecto=texto_por_defecto)
+
+
+def servidor_openai(respuesta=RESPUESTA_GRABADA, latencia=0.5, latencia_token=0.01, jitter=0.2):
+    """
+    Crea un servidor que imita la API de chat de OpenAI.
+
+    Parameters
+    ----------
+    respuesta : str
+        Texto que se devuelve en las generaciones.
+    latencia : float
+        Segundos promedio hasta el inicio de la respuesta.
+    latencia_token : float
+        Segundos entre fragmentos del streaming.
+    jitter : float
+        Variación relativa de la latencia.
+
+    Returns
+    -------
+    ServidorSimulado
+        Servidor sin iniciar; se inicia con `with`. Su URL base para el cliente de OpenAI
+        es `url + "/v1"`.
+    """
+    return ServidorSimulado(ManejadorOpenAI, latencia=latencia, jitter=jitter,
+                            respuesta=respuesta, latencia_token=latencia_token)
@@ -0,0 +1,249 @@
+"""
+Descripción
+===========
+
+Este módulo extrae con Amazon Textract el texto de documentos de una o varias páginas.
+
+La API síncrona `detect_document_text` solo acepta documentos de una página, por lo que los
+PDFs de varias páginas se dividen localmente con PyMuPDF y cada página se envía por separado
+con un número acotado de hilos. Para documentos que ya están en S3 se usa la API asíncrona
+(`start_document_text_detection` / `get_document_text_detection`), recorriendo todas las
+páginas de resultados con `NextToken`.
+
+En ambos casos las líneas se reensamblan en orden de lectura: por número de página y, dentro
+de cada página, en el orden de las relaciones CHILD del bloque PAGE. Todas las funciones
+reciben el cliente de Textract como parámetro opcional para poder sustituirlo en pruebas.
+
+Funciones
+===========
+
+"""
+
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import pymupdf
+from source.config_loader import get_textract_client, get_textract_config
+from source.trazas_utils import registrar_reintentos
+
+ENCABEZADO_PDF = b"%PDF-"
+
+
+class ErrorTrabajoTextract(RuntimeError):
+    """El trabajo asíncrono de Textract terminó con error o excedió el tiempo máximo."""
+
+
+def dividir_pdf(content):
+    """
+    Divide un PDF en documentos de una página.
+
+    Parameters
+    ----------
+    content : bytes
+        Contenido binario del documento.
+
+    Returns
+    -------
+    list[bytes]
+        Un PDF por página, en orden. Si el contenido no es un PDF (imagen) o tiene una sola
+        página, se devuelve sin cambios como único elemento.
+    """
+    if not content.startswith(ENCABEZADO_PDF):
+        return [content]
+    with pymupdf.open(stream=content, filetype="pdf") as doc:
+        if doc.page_count <= 1:
+            return [content]
+        paginas = []
+        for numero in range(doc.page_count):
+            with pymupdf.open() as pagina:
+                pagina.insert_pdf(doc, from_page=numero, to_page=numero)
+                paginas.append(pagina.tobytes(garbage=3, deflate=True))
+        return paginas
+
+
+def lineas_en_orden(bloques):
+    """
+    Ordena las líneas de una respuesta de Textract en orden de lectura.
+
+    Parameters
+    ----------
+    bloques : list[dict]
+        Bloques de Textract, posiblemente de varias páginas y de varias respuestas paginadas.
+
+    Returns
+    -------
+    list[str]
+        Texto de las líneas, por página y en el orden de lectura de cada página. Si no hay
+        bloques PAGE se conserva el orden de los bloques LINE.
+    """
+    # Los IDs se indexan junto con la página porque cada respuesta síncrona los genera por separado
+    por_id = {(b.get("Page", 1), b["Id"]): b for b in bloques if "Id" in b}
+    paginas = sorted(
+        (b for b in bloques if b["BlockType"] == "PAGE"),
+        key=lambda b: b.get("Page", 1)
+    )
+    if not paginas:
+        return [b["Text"] for b in bloques if b["BlockType"] == "LINE"]
+
+    lineas = []
+    for pagina in paginas:
+        for relacion in pagina.get("Relationships", []):
+            if relacion["Type"] != "CHILD":
+                continue
+            for id_hijo in relacion["Ids"]:
+                hijo = por_id.get((pagina.get("Page", 1), id_hijo))
+                if hijo is not None and hijo["BlockType"] == "LINE":
+                    lineas.append(hijo["Text"])
+    return lineas
+
+
+def resultado_ocr(bloques, umbral_confianza):
+    """
+    Arma el resultado del OCR a partir de los bloques de Textract.
+
+    Parameters
+    ----------
+    bloques : list[dict]
+        Bloques de todas las páginas del documento.
+    umbral_confianza : float
+        Confianza (de 0 a 100) debajo de la cual una palabra se reporta.
+
+    Returns
+    -------
+    dict
+        Diccionario con "texto" (líneas en orden de lectura), "baja_confianza" (palabras con
+        confianza menor al umbral) y "paginas".
+    """
+    baja_confianza = sorted({
+        b["Text"] for b in bloques
+        if b["BlockType"] == "WORD" and b.get("Confidence", 100) < umbral_confianza
+    })
+    paginas = sum(1 for b in bloques if b["BlockType"] == "PAGE")
+    return {"texto": "\n".join(lineas_en_orden(bloques)), "baja_confianza": baja_confianza, "paginas": paginas}
+
+
+def detectar_texto_documento(content, umbral_confianza, cliente=None, max_hilos=None):
+    """
+    Extrae el texto de una imagen o de un PDF de una o varias páginas con la API síncrona.
+
+    Las páginas se envían a Textract de forma concurrente y sus bloques se renumeran con la
+    página a la que pertenecen antes de reensamblarlos.
+
+    Parameters
+    ----------
+    content : bytes
+        Contenido binario del documento.
+    umbral_confianza : float
+        Confianza (de 0 a 100) debajo de la cual una palabra se reporta.
+    cliente : botocore.client.Textract, optional
+        Cliente de Textract (por defecto: `get_textract_client()`).
+    max_hilos : int, optional
+        Páginas que se envían al mismo tiempo (por defecto: `hilos_por_documento` de la
+        sección `textract`).
+
+    Returns
+    -------
+    dict
+        Diccionario con "texto", "baja_confianza" y "paginas" (ver `resultado_ocr()`).
+    """
+    cliente = cliente or get_textract_client()
+    max_hilos = max_hilos or get_textract_config()["hilos_por_documento"]
+    paginas = dividir_pdf(content)
+
+    def detectar(numero, pagina):
+        respuesta = cliente.detect_document_text(Document={"Bytes": pagina})
+        registrar_reintentos(respuesta.get("ResponseMetadata", {}).get("RetryAttempts", 0))
+        bloques = respuesta.get("Blocks", [])
+        for bloque in bloques:
+            bloque["Page"] = numero
+        return bloques
+
+    if len(paginas) == 1:
+        bloques = detectar(1, paginas[0])
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_hilos, len(paginas))) as executor:
+            # Cada página se ejecuta en una copia del contexto para que registre en la traza en curso
+            futuros = [
+                executor.submit(contextvars.copy_context().run, detectar, numero, pagina)
+                for numero, pagina in enumerate(paginas, start=1)
+            ]
+            bloques = [b for futuro in futuros for b in futuro.result()]
+    return resultado_ocr(bloques, umbral_confianza)
+
+
+def resultados_trabajo(job_id, cliente=None, intervalo_sondeo=None, tiempo_max=None):
+    """
+    Espera a que termine un trabajo asíncrono de Textract y reúne todos sus bloques.
+
+    Parameters
+    ----------
+    job_id : str
+        ID devuelto por `start_document_text_detection`.
+    cliente : botocore.client.Textract, optional
+        Cliente de Textract (por defecto: `get_textract_client()`).
+    intervalo_sondeo : float, optional
+        Segundos entre consultas del estado (por defecto: el de la sección `textract`).
+    tiempo_max : float, optional
+        Segundos máximos de espera (por defecto: `tiempo_max_trabajo` de la sección `textract`).
+
+    Returns
+    -------
+    list[dict]
+        Bloques de todas las páginas de resultados.
+
+    Raises
+    ------
+    ErrorTrabajoTextract
+        Si el trabajo falla o no termina dentro de `tiempo_max`.
+    """
+    cliente = cliente or get_textract_client()
+    config = get_textract_config()
+    intervalo_sondeo = config["intervalo_sondeo"] if intervalo_sondeo is None else intervalo_sondeo
+    tiempo_max = config["tiempo_max_trabajo"] if tiempo_max is None else tiempo_max
+
+    limite = time.monotonic() + tiempo_max
+    while True:
+        respuesta = cliente.get_document_text_detection(JobId=job_id)
+        estado = respuesta["JobStatus"]
+        if estado != "IN_PROGRESS":
+            break
+        if time.monotonic() > limite:
+            raise ErrorTrabajoTextract(f"El trabajo {job_id} no terminó en {tiempo_max} s.")
+        time.sleep(intervalo_sondeo)
+
+    if estado == "FAILED":
+        raise ErrorTrabajoTextract(f"El trabajo {job_id} falló: {respuesta.get('StatusMessage', '')}")
+
+    bloques = list(respuesta.get("Blocks", []))
+    while respuesta.get("NextToken"):
+        respuesta = cliente.get_document_text_detection(JobId=job_id, NextToken=respuesta["NextToken"])
+        bloques.extend(respuesta.get("Blocks", []))
+    return bloques
+
+
+def detectar_texto_s3(bucket, clave, umbral_confianza, cliente=None):
+    """
+    Extrae el texto de un documento en S3 con la API asíncrona de Textract.
+
+    Parameters
+    ----------
+    bucket : str
+        Bucket de S3 donde está el documento.
+    clave : str
+        Clave (ruta) del documento dentro del bucket.
+    umbral_confianza : float
+        Confianza (de 0 a 100) debajo de la cual una palabra se reporta.
+    cliente : botocore.client.Textract, optional
+        Cliente de Textract (por defecto: `get_textract_client()`).
+
+    Returns
+    -------
+    dict
+        Diccionario con "texto", "baja_confianza" y "paginas" (ver `resultado_ocr()`).
+    """
+    cliente = cliente or get_textract_client()
+    respuesta = cliente.start_document_text_detection(
+        DocumentLocation={"S3Object": {"Bucket": bucket, "Name": clave}}
+    )
+    bloques = resultados_trabajo(respuesta["JobId"], cliente=cliente)
+    return resultado_ocr(bloques, umbral_confianza)
@@ -0,0 +1,471 @@
+"""
+Descripción
+===========
+
+Este módulo registra el tiempo, los reintentos, los tokens y el costo estimado de cada
+solicitud y de cada etapa del flujo (Textract, corrección ortográfica, búsqueda en Chroma,
+re-ranking, generación, etc.).
+
+Una traza agrupa las etapas de una solicitud. Las etapas se abren con el administrador de
+contexto `tramo()` o con el decorador `instrumentar()`, y la traza y la etapa en curso se
+guardan en variables de contexto (`contextvars`), por lo que no hay que pasarlas entre
+funciones y cada hilo o tarea de asyncio lleva la suya. Al cerrar una traza se escribe una
+línea JSON en el logger "trazas" y se acumulan sus etapas en las métricas del proceso, que
+el servicio de `api.py` expone en `/metrics` (formato de Prometheus) y `/metrics.json`.
+
+Los precios por millón de tokens y por página de Textract y la activación se configuran en
+la sección `trazas` de config.yaml.
+
+Funciones
+===========
+
+"""
+
+import json
+import time
+import uuid
+import inspect
+import logging
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import numpy as np
+from source.config_loader import get_trazas_config
+
+logger = logging.getLogger("trazas")
+
+_traza_actual = ContextVar("traza_actual", default=None)
+_tramo_actual = ContextVar("tramo_actual", default=None)
+
+# Latencias que se conservan por etapa para calcular percentiles
+MAX_LATENCIAS = 1000
+
+
+class Tramo:
+    """
+    Etapa de una traza: tiempo de pared, reintentos, tokens y costo.
+
+    Parameters
+    ----------
+    nombre : str
+        Nombre de la etapa (por ejemplo, "textract" o "generacion").
+    padre : str, optional
+        Nombre de la etapa que la contiene.
+    atributos : dict, optional
+        Datos adicionales que se incluyen en el registro (modelo, número de fragmentos, etc.).
+    """
+
+    def __init__(self, nombre, padre=None, atributos=None):
+        self.nombre = nombre
+        self.padre = padre
+        self.atributos = dict(atributos or {})
+        self.inicio = time.perf_counter()
+        self.segundos = None
+        self.reintentos = 0
+        self.tokens_entrada = 0
+        self.tokens_salida = 0
+        self.costo_usd = 0.0
+        self.error = None
+
+    def a_dict(self):
+        """Registro serializable de la etapa."""
+        registro = {
+            "etapa": self.nombre,
+            "padre": self.padre,
+            "segundos": round(self.segundos if self.segundos is not None else time.perf_counter() - self.inicio, 4),
+            "reintentos": self.reintentos,
+            "tokens_entrada": self.tokens_entrada,
+            "tokens_salida": self.tokens_salida,
+            "costo_usd": round(self.costo_usd, 6),
+        }
+        if self.error:
+            registro["error"] = self.error
+        registro.update(self.atributos)
+        return registro
+
+
+class Traza:
+    """
+    Etapas de una solicitud, seguras para registrarse desde varios hilos.
+
+    Parameters
+    ----------
+    nombre : str
+        Nombre de la solicitud (por ejemplo, "solicitud" o "respuesta").
+    config : dict
+        Sección `trazas` de config.yaml.
+    atributos : dict, optional
+        Datos que identifican la solicitud (archivo, modelo, etc.).
+    """
+
+    def __init__(self, nombre, config, atributos=None):
+        self.id = uuid.uuid4().hex[:16]
+        self.nombre = nombre
+        self.config = config
+        self.atributos = dict(atributos or {})
+        self.inicio_epoch = time.time()
+        self.inicio = time.perf_counter()
+        self.segundos = None
+        self.tramos = []
+        # Uso que se registra fuera de cualquier etapa
+        self.uso = Tramo(nombre)
+        self._lock = threading.Lock()
+
+    def agregar(self, tramo):
+        """Agrega una etapa terminada."""
+        with self._lock:
+            self.tramos.append(tramo)
+
+    def registrar(self, tramo, reintentos=0, tokens_entrada=0, tokens_salida=0, costo_usd=0.0):
+        """Suma uso a una etapa de esta traza (o a la traza si `tramo` es None)."""
+        with self._lock:
+            destino = tramo or self.uso
+            destino.reintentos += reintentos
+            destino.tokens_entrada += tokens_entrada
+            destino.tokens_salida += tokens_salida
+            destino.costo_usd += costo_usd
+
+    def precio_modelo(self, modelo):
+        """Precios {"entrada", "salida"} por millón de tokens del modelo, o None si no se conoce."""
+        precios = self.config["precios"]
+        # "gpt-4-0613" usa el precio de "gpt-4"; se prefiere la clave más larga que coincida
+        claves = [clave for clave in precios if modelo.startswith(clave)]
+        return precios[max(claves, key=len)] if claves else None
+
+    def resumen(self):
+        """
+        Resumen serializable de la traza.
+
+        Returns
+        -------
+        dict
+            "traza", "nombre", "inicio", "segundos", totales de "reintentos", "tokens_entrada",
+            "tokens_salida" y "costo_usd", los atributos de la solicitud y la lista "etapas"
+            en orden de inicio.
+        """
+        with self._lock:
+            tramos = sorted(self.tramos, key=lambda t: t.inicio)
+        todos = tramos + [self.uso]
+        return {
+            "traza": self.id,
+            "nombre": self.nombre,
+            "inicio": self.inicio_epoch,
+            "segundos": round(self.segundos if self.segundos is not None else time.perf_counter() - self.inicio, 4),
+            "reintentos": sum(t.reintentos for t in todos),
+            "tokens_entrada": sum(t.tokens_entrada for t in todos),
+            "tokens_salida": sum(t.tokens_salida for t in todos),
+            "costo_usd": round(sum(t.costo_usd for t in todos), 6),
+            **self.atributos,
+            "etapas": [t.a_dict() for t in tramos],
+        }
+
+
+class RegistroMetricas:
+    """
+    Acumula por etapa las solicitudes, errores, reintentos, tokens, costo y latencias del proceso.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._etapas = {}
+
+    def _acumular(self, nombre, registro):
+        datos = self._etapas.setdefault(nombre, {
+            "solicitudes": 0, "errores": 0, "reintentos": 0, "segundos": 0.0,
+            "tokens_entrada": 0, "tokens_salida": 0, "costo_usd": 0.0,
+            "latencias": deque(maxlen=MAX_LATENCIAS),
+        })
+        datos["solicitudes"] += 1
+        datos["errores"] += 1 if registro.get("error") else 0
+        for clave in ("reintentos", "segundos", "tokens_entrada", "tokens_salida", "costo_usd"):
+            datos[clave] += registro[clave]
+        datos["latencias"].append(registro["segundos"])
+
+    def registrar(self, resumen):
+        """
+        Acumula una traza terminada y cada una de sus etapas.
+
+        Parameters
+        ----------
+        resumen : dict
+            Resultado de `Traza.resumen()`.
+        """
+        with self._lock:
+            self._acumular(resumen["nombre"], resumen)
+            for etapa in resumen["etapas"]:
+                self._acumular(etapa["etapa"], etapa)
+
+    def instantanea(self):
+        """
+        Métricas acumuladas hasta el momento.
+
+        Returns
+        -------
+        dict
+            {etapa: {"solicitudes", "errores", "reintentos", "segundos", "tokens_entrada",
+            "tokens_salida", "costo_usd", "p50_segundos", "p95_segundos", "p99_segundos"}}.
+        """
+        with self._lock:
+            resultado = {}
+            for nombre, datos in self._etapas.items():
+                latencias = np.array(datos["latencias"])
+                resultado[nombre] = {k: v for k, v in datos.items() if k != "latencias"}
+                for p in (50, 95, 99):
+                    resultado[nombre][f"p{p}_segundos"] = float(np.percentile(latencias, p))
+            return resultado
+
+    def formato_prometheus(self):
+        """
+        Métricas en el formato de texto de Prometheus.
+
+        Returns
+        -------
+        str
+            Una línea por métrica y etapa, por ejemplo `finalai_segundos_total{etapa="textract"} 3.2`.
+        """
+        lineas = []
+        for etapa, datos in self.instantanea().items():
+            for clave, valor in datos.items():
+                nombre = clave if clave.endswith("_segundos") else f"{clave}_total"
+                lineas.append(f'finalai_{nombre}{{etapa="{etapa}"}} {valor}')
+        return "\n".join(lineas) + "\n"
+
+
+METRICAS = RegistroMetricas()
+
+
+@contextmanager
+def traza(nombre, **atributos):
+    """
+    Abre una traza para una solicitud; al cerrarla la escribe en el log y en las métricas.
+
+    Parameters
+    ----------
+    nombre : str
+        Nombre de la solicitud.
+    **atributos
+        Datos que identifican la solicitud.
+
+    Yields
+    ------
+    Traza or None
+        Traza en curso, o None si las trazas están deshabilitadas.
+    """
+    config = get_trazas_config()
+    if not config["habilitadas"]:
+        yield None
+        return
+    actual = Traza(nombre, config, atributos)
+    token_traza = _traza_actual.set(actual)
+    token_tramo = _tramo_actual.set(None)
+    try:
+        yield actual
+    finally:
+        _tramo_actual.reset(token_tramo)
+        _traza_actual.reset(token_traza)
+        _cerrar_traza(actual)
+
+
+def _cerrar_traza(actual):
+    """Registra una traza terminada en las métricas y, si está activado, en el log."""
+    actual.segundos = time.perf_counter() - actual.inicio
+    resumen = actual.resumen()
+    METRICAS.registrar(resumen)
+    if actual.config["log_json"]:
+        logger.info(json.dumps(resumen, ensure_ascii=False, default=str))
+
+
+@contextmanager
+def tramo(nombre, **atributos):
+    """
+    Mide una etapa dentro de la traza en curso.
+
+    Si no hay una traza abierta se abre una con el mismo nombre, de modo que las funciones
+    instrumentadas que se llaman sueltas también quedan registradas.
+
+    Parameters
+    ----------
+    nombre : str
+        Nombre de la etapa.
+    **atributos
+        Datos adicionales de la etapa.
+
+    Yields
+    ------
+    Tramo or None
+        Etapa en curso, o None si las trazas están deshabilitadas.
+    """
+    actual = _traza_actual.get()
+    if actual is None:
+        with traza(nombre) as nueva:
+            if nueva is None:
+                yield None
+                return
+            with tramo(nombre, **atributos) as etapa:
+                yield etapa
+        return
+
+    padre = _tramo_actual.get()
+    etapa = Tramo(nombre, padre.nombre if padre else None, atributos)
+    token = _tramo_actual.set(etapa)
+    try:
+        yield etapa
+    except BaseException as e:
+        etapa.error = type(e).__name__
+        raise
+    finally:
+        etapa.segundos = time.perf_counter() - etapa.inicio
+        _tramo_actual.reset(token)
+        actual.agregar(etapa)
+
+
+def instrumentar(nombre):
+    """
+    Decorador que mide cada llamada a una función como una etapa de la traza en curso.
+
+    Funciona con funciones normales, generadores (la etapa dura hasta que se agotan) y
+    corrutinas.
+
+    Parameters
+    ----------
+    nombre : str
+        Nombre de la etapa.
+
+    Returns
+    -------
+    callable
+        Decorador.
+    """
+    def decorador(funcion):
+        if inspect.isgeneratorfunction(funcion):
+            @functools.wraps(funcion)
+            def envoltura(*args, **kwargs):
+                return _generador_instrumentado(nombre, funcion(*args, **kwargs))
+        elif inspect.iscoroutinefunction(funcion):
+            @functools.wraps(funcion)
+            async def envoltura(*args, **kwargs):
+                with tramo(nombre):
+                    return await funcion(*args, **kwargs)
+        else:
+            @functools.wraps(funcion)
+            def envoltura(*args, **kwargs):
+                with tramo(nombre):
+                    return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def _generador_instrumentado(nombre, generador):
+    """
+    Recorre `generador` como una etapa que dura hasta que se agota o se cierra.
+
+    A diferencia de `tramo()`, la traza y la etapa solo se fijan en las variables de contexto
+    mientras el generador avanza: entre fragmentos quedan las del código que lo consume, que
+    puede cerrarlo desde otro hilo o contexto (como hace el servicio al transmitir).
+    """
+    actual = _traza_actual.get()
+    propia = None
+    if actual is None:
+        config = get_trazas_config()
+        if not config["habilitadas"]:
+            return (yield from generador)
+        actual = propia = Traza(nombre, config)
+    padre = _tramo_actual.get() if propia is None else None
+    etapa = Tramo(nombre, padre.nombre if padre else None)
+
+    def avanzar(paso, *valor):
+        token_traza = _traza_actual.set(actual)
+        token_tramo = _tramo_actual.set(etapa)
+        try:
+            return paso(*valor)
+        finally:
+            _tramo_actual.reset(token_tramo)
+            _traza_actual.reset(token_traza)
+
+    try:
+        fragmento = avanzar(next, generador)
+        while True:
+            try:
+                enviado = yield fragmento
+            except GeneratorExit:
+                avanzar(generador.close)
+                raise
+            except BaseException as e:
+                fragmento = avanzar(generador.throw, e)
+            else:
+                fragmento = avanzar(generador.send, enviado)
+    except StopIteration as fin:
+        return fin.value
+    except BaseException as e:
+        etapa.error = type(e).__name__
+        raise
+    finally:
+        etapa.segundos = time.perf_counter() - etapa.inicio
+        actual.agregar(etapa)
+        if propia is not None:
+            _cerrar_traza(propia)
+
+
+def anotar(**atributos):
+    """
+    Agrega atributos a la etapa en curso (por ejemplo, el número de fragmentos recuperados).
+
+    Parameters
+    ----------
+    **atributos
+        Datos que se incluyen en el registro de la etapa.
+    """
+    etapa = _tramo_actual.get()
+    if etapa is not None:
+        etapa.atributos.update(atributos)
+
+
+def registrar_tokens(modelo, tokens_entrada, tokens_salida):
+    """
+    Registra los tokens de una llamada al LLM y su costo estimado en la etapa en curso.
+
+    Parameters
+    ----------
+    modelo : str
+        Modelo de OpenAI de la llamada.
+    tokens_entrada : int
+        Tokens del prompt.
+    tokens_salida : int
+        Tokens de la respuesta.
+    """
+    actual = _traza_actual.get()
+    if actual is None:
+        return
+    precio = actual.precio_modelo(modelo)
+    costo = 0.0 if precio is None else (tokens_entrada * precio["entrada"] + tokens_salida * precio["salida"]) / 1e6
+    actual.registrar(_tramo_actual.get(), tokens_entrada=tokens_entrada, tokens_salida=tokens_salida, costo_usd=costo)
+
+
+def registrar_paginas_textract(paginas):
+    """
+    Registra el costo estimado de las páginas enviadas a Textract en la etapa en curso.
+
+    Parameters
+    ----------
+    paginas : int
+        Páginas procesadas.
+    """
+    actual = _traza_actual.get()
+    if actual is not None:
+        actual.registrar(_tramo_actual.get(), costo_usd=paginas * actual.config["precio_pagina_textract"])
+
+
+def registrar_reintentos(reintentos=1):
+    """
+    Registra reintentos de una llamada a un servicio externo en la etapa en curso.
+
+    Parameters
+    ----------
+    reintentos : int
+        Número de reintentos (por defecto: 1).
+    """
+    actual = _traza_actual.get()
+    if actual is not None and reintentos:
+        actual.registrar(_tramo_actual.get(), reintentos=reintentos)
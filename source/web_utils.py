@@ -5,29 +5,270 @@ Este módulo automatiza la descarga de documentos regulatorios agrupados por suj
 y filtra únicamente aquellos que contienen la expresión 'texto compilado' en su contenido,
 preservando únicamente los documentos relevantes para análisis normativo.
 
+Las descargas usan una sesión HTTP con pool de conexiones, tiempos límite y reintentos, y se
+reparten en un pool de hilos. Cada PDF se descarga una sola vez aunque aparezca en varias
+páginas de sujetos, y un manifiesto local guarda su ETag/Last-Modified para que las corridas
+siguientes hagan solicitudes condicionales y solo descarguen lo que cambió.
+
+El filtro de 'texto compilado' se aplica sobre el PDF en memoria (solo se interpretan sus dos
+primeras páginas) y únicamente los documentos aceptados se escriben en disco. El veredicto se
+guarda en el manifiesto junto con el hash del contenido, así que si un PDF se vuelve a descargar
+sin cambios no se vuelve a interpretar.
+
 Funciones
 ===========
 
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
 import os
 import re
+import json
+import hashlib
+import tempfile
+import threading
 from PyPDF2 import PdfReader
 
-def descargar_normatividad_compilada(destino='normatividad_compilado', carpeta_temp='normatividad_completo'):
+URL_INDICE = 'https://www.banxico.org.mx/marco-normativo/normativa-agrupada-por-sujeto.html'
+
+# Los PDFs de hasta este tamaño se mantienen completamente en memoria durante el filtro
+MAX_BYTES_EN_MEMORIA = 64 * 1024 * 1024
+
+
+def crear_sesion(max_conexiones=16, reintentos=3):
+    """
+    Crea una sesión HTTP que reutiliza conexiones y reintenta errores transitorios.
+
+    Parameters
+    ----------
+    max_conexiones : int
+        Conexiones que el pool mantiene abiertas por host (debe cubrir el número de hilos).
+    reintentos : int
+        Reintentos ante errores de conexión y respuestas 429/5xx, con espera exponencial.
+
+    Returns
+    -------
+    requests.Session
+        Sesión lista para usarse desde varios hilos.
+    """
+    sesion = requests.Session()
+    retry = Retry(
+        total=reintentos,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "HEAD"]
+    )
+    adapter = HTTPAdapter(pool_connections=max_conexiones, pool_maxsize=max_conexiones, max_retries=retry)
+    sesion.mount('http://', adapter)
+    sesion.mount('https://', adapter)
+    return sesion
+
+
+def _cargar_manifiesto(ruta):
+    """
+    Carga el manifiesto de descargas {url: {"etag", "last_modified", "sha256", "archivo", "conservado"}}.
+
+    Parameters
+    ----------
+    ruta : str
+        Ruta al archivo JSON del manifiesto.
+
+    Returns
+    -------
+    dict
+        Manifiesto, vacío si el archivo no existe.
+    """
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _guardar_manifiesto(manifiesto, ruta):
+    """
+    Guarda el manifiesto de descargas de forma atómica.
+
+    Parameters
+    ----------
+    manifiesto : dict
+        Manifiesto de descargas.
+    ruta : str
+        Ruta al archivo JSON del manifiesto.
+
+    Returns
+    -------
+    None
+    """
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=1)
+    os.replace(temporal, ruta)
+
+
+def _enlaces(sesion, url, terminacion, timeout):
+    """
+    Descarga una página HTML y devuelve los enlaces absolutos que terminan en `terminacion`.
+
+    Parameters
+    ----------
+    sesion : requests.Session
+        Sesión HTTP.
+    url : str
+        URL de la página.
+    terminacion : str
+        Terminación de los enlaces a conservar (por ejemplo, 'html' o '.pdf').
+    timeout : float
+        Tiempo límite de la solicitud, en segundos.
+
+    Returns
+    -------
+    list[str]
+        Enlaces absolutos sin duplicados, en el orden en que aparecen.
+    """
+    response = sesion.get(url, timeout=timeout)
+    response.raise_for_status()
+    soup = BeautifulSoup(response.text, 'html.parser')
+    enlaces = []
+    for link in soup.find_all('a', href=True):
+        href = urljoin(url, link['href'])
+        if href.lower().endswith(terminacion) and href not in enlaces:
+            enlaces.append(href)
+    return enlaces
+
+
+def _es_texto_compilado(pdf):
+    """
+    Revisa si las dos primeras páginas de un PDF contienen la expresión 'texto compilado'.
+
+    PyPDF2 carga los objetos de forma perezosa, así que solo se leen la tabla de referencias
+    y los objetos de las dos primeras páginas, no el documento completo.
+
+    Parameters
+    ----------
+    pdf : str or file-like
+        Ruta al archivo PDF o flujo binario con su contenido.
+
+    Returns
+    -------
+    bool
+        True si el documento es un texto compilado.
+    """
+    reader = PdfReader(pdf)
+    text = ""
+    for page in reader.pages[:2]:
+        text += page.extract_text() or ""
+    return 'texto compilado' in text.lower()
+
+
+def _descargar_pdf(sesion, pdf_url, previo, destino, timeout):
+    """
+    Descarga un PDF si cambió desde la última corrida y lo conserva si es texto compilado.
+
+    Si el manifiesto tiene un ETag o Last-Modified del PDF (y el archivo conservado sigue en
+    `destino`), la solicitud es condicional y una respuesta 304 evita la descarga. El cuerpo se
+    recibe por bloques en un archivo temporal en memoria (que solo pasa a disco si excede
+    `MAX_BYTES_EN_MEMORIA`) mientras se calcula su hash. Si el hash coincide con el del
+    manifiesto se reutiliza el veredicto anterior sin interpretar el PDF; si no, se aplica el
+    filtro sobre el flujo en memoria. Solo los PDFs aceptados se escriben en `destino`; si un
+    PDF conservado en una corrida anterior ahora se descarta, se borra su archivo para que no se
+    indexe.
+
+    Parameters
+    ----------
+    sesion : requests.Session
+        Sesión HTTP.
+    pdf_url : str
+        URL del PDF.
+    previo : dict or None
+        Entrada del manifiesto para `pdf_url` de una corrida anterior.
+    destino : str
+        Carpeta donde se guardan los PDFs con texto compilado.
+    timeout : float
+        Tiempo límite de conexión y de lectura, en segundos.
+
+    Returns
+    -------
+    tuple (estado:str, entrada:dict)
+        Estado ("sin_cambios", "conservado" o "descartado") y nueva entrada del manifiesto.
+    """
+    pdf_name = pdf_url.split('/')[-1]
+    dest_path = os.path.join(destino, pdf_name)
+
+    headers = {}
+    vigente = previo is not None and (not previo.get('conservado') or os.path.exists(dest_path))
+    if vigente:
+        if previo.get('etag'):
+            headers['If-None-Match'] = previo['etag']
+        if previo.get('last_modified'):
+            headers['If-Modified-Since'] = previo['last_modified']
+
+    with sesion.get(pdf_url, headers=headers, stream=True, timeout=timeout) as pdf_response, \
+            tempfile.SpooledTemporaryFile(max_size=MAX_BYTES_EN_MEMORIA) as contenido:
+        if pdf_response.status_code == 304 and vigente:
+            return 'sin_cambios', previo
+        pdf_response.raise_for_status()
+        h = hashlib.sha256()
+        for bloque in pdf_response.iter_content(chunk_size=1 << 16):
+            h.update(bloque)
+            contenido.write(bloque)
+        print(f'Descargado: {pdf_name}')
+
+        entrada = {
+            'etag': pdf_response.headers.get('ETag'),
+            'last_modified': pdf_response.headers.get('Last-Modified'),
+            'sha256': h.hexdigest(),
+            'archivo': pdf_name,
+        }
+        # Veredicto en caché por URL + hash: el mismo contenido no se vuelve a interpretar
+        if vigente and previo.get('sha256') == entrada['sha256'] and 'conservado' in previo:
+            entrada['conservado'] = previo['conservado']
+            return 'sin_cambios', entrada
+
+        contenido.seek(0)
+        entrada['conservado'] = _es_texto_compilado(contenido)
+        if entrada['conservado']:
+            contenido.seek(0)
+            temporal = dest_path + '.part'
+            with open(temporal, 'wb') as f:
+                for bloque in iter(lambda: contenido.read(1 << 20), b''):
+                    f.write(bloque)
+            os.replace(temporal, dest_path)
+            print(f"✅ Conservado: {pdf_name}")
+        else:
+            if previo is not None and previo.get('conservado') and os.path.exists(dest_path):
+                os.remove(dest_path)
+            print(f"🗑️ Descartado: {pdf_name}")
+    return ('conservado' if entrada['conservado'] else 'descartado'), entrada
+
+
+def descargar_normatividad_compilada(destino='normatividad_compilado', url_indice=URL_INDICE, max_workers=8, timeout=30):
     """
     Descarga los documentos de normatividad desde la página de Banxico y conserva solo aquellos que contienen 'texto compilado'.
     El texto compilado contiene la versión más reciente de la normatividad, por lo que es importante conservarlo.
     Los demás documentos no nos interesan porque contienen texto repetido o que ya no es relevante debido a que puede haber que ya no son vigentes.
 
+    Las páginas de sujetos y los PDFs se descargan en paralelo con una sesión compartida, cada
+    URL se descarga una sola vez y el manifiesto `manifiesto_descargas.json` en `destino`
+    permite omitir los PDFs que no cambiaron desde la corrida anterior. El manifiesto se escribe
+    una sola vez al terminar (también si la corrida se interrumpe).
+
     Params
     ----------
     destino : str
-        Carpeta donde se guardarán los PDFs con texto compilado.
-    carpeta_temp : str
-        Carpeta temporal donde se descargan todos los PDFs antes de filtrar.
+        Carpeta donde se guardarán los PDFs con texto compilado. Los PDFs descartados
+        nunca se escriben en disco.
+    url_indice : str
+        URL de la página con la normativa agrupada por sujeto (configurable para pruebas
+        contra un servidor local).
+    max_workers : int
+        Número de hilos de descarga.
+    timeout : float
+        Tiempo límite de cada solicitud, en segundos.
 
     Returns
     -------
@@ -35,53 +276,51 @@ def descargar_normatividad_compilada(destino='normatividad_compilado', carpeta_t
         Lista de archivos que fueron conservados como 'texto compilado'.
     """
 
-    # Verificamos que las carpetas de destino y temporal existen y si no, las creamos
+    # Verificamos que la carpeta de destino existe y si no, la creamos
     if not os.path.exists(destino):
         os.makedirs(destino, exist_ok=True)
-    if not os.path.exists(carpeta_temp):
-        os.makedirs(carpeta_temp, exist_ok=True)
 
-    url = 'https://www.banxico.org.mx/marco-normativo/normativa-agrupada-por-sujeto.html'
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
+    ruta_manifiesto = os.path.join(destino, 'manifiesto_descargas.json')
+    manifiesto = _cargar_manifiesto(ruta_manifiesto)
+    lock = threading.Lock()
+    sesion = crear_sesion(max_conexiones=max_workers)
 
-    conservados = []
+    paginas = _enlaces(sesion, url_indice, 'html', timeout)
 
-    for link in soup.find_all('a', href=True):
-        href = 'https://www.banxico.org.mx' + link['href']
-        
-        if href.lower().endswith('html'):
-            response_norm = requests.get(href)
-            soup_norm = BeautifulSoup(response_norm.text, 'html.parser')
-
-            for link_norm in soup_norm.find_all('a', href=True):
-                href_norm = link_norm['href']
-                if href_norm.lower().endswith('.pdf'):
-                    pdf_url = href_norm if href_norm.startswith('https') else f'https://www.banxico.org.mx{href_norm}'
-                    pdf_name = pdf_url.split('/')[-1]
-                    pdf_path = os.path.join(carpeta_temp, pdf_name)
-
-                    try:
-                        pdf_response = requests.get(pdf_url)
-                        with open(pdf_path, 'wb') as f:
-                            f.write(pdf_response.content)
-                        print(f'Descargado: {pdf_name}')
-
-                        reader = PdfReader(pdf_path)
-                        text = ""
-                        for page in reader.pages[:2]:
-                            text += page.extract_text() or ""
-
-                        if 'texto compilado' in text.lower():
-                            dest_path = os.path.join(destino, pdf_name)
-                            os.rename(pdf_path, dest_path)
-                            print(f"✅ Conservado: {pdf_name}")
-                            conservados.append(dest_path)
-                        else:
-                            os.remove(pdf_path)
-                            print(f"🗑️ Eliminado: {pdf_name}")
-
-                    except Exception as e:
-                        print(f"⚠️ Error procesando {pdf_name}: {e}")
-
-    return conservados
\ No newline at end of file
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pdf_urls = []
+        for futuro in [pool.submit(_enlaces, sesion, pagina, '.pdf', timeout) for pagina in paginas]:
+            try:
+                enlaces = futuro.result()
+            except Exception as e:
+                print(f"⚠️ Error leyendo página de sujeto: {e}")
+                continue
+            # Un mismo PDF aparece en varias páginas de sujetos; se descarga una vez
+            pdf_urls.extend(u for u in enlaces if u not in pdf_urls)
+
+        def procesar(pdf_url):
+            try:
+                estado, entrada = _descargar_pdf(
+                    sesion, pdf_url, manifiesto.get(pdf_url), destino, timeout
+                )
+            except Exception as e:
+                print(f"⚠️ Error procesando {pdf_url.split('/')[-1]}: {e}")
+                return 'error'
+            with lock:
+                manifiesto[pdf_url] = entrada
+            return estado
+
+        try:
+            estados = list(pool.map(procesar, pdf_urls))
+        finally:
+            with lock:
+                _guardar_manifiesto(manifiesto, ruta_manifiesto)
+
+    conservados = [
+        os.path.join(destino, manifiesto[u]['archivo'])
+        for u in pdf_urls if u in manifiesto and manifiesto[u].get('conservado')
+    ]
+    print(f"\n{len(pdf_urls)} PDFs únicos: {estados.count('sin_cambios')} sin cambios, "
+          f"{estados.count('conservado')} conservados, {estados.count('descartado')} descartados, "
+          f"{estados.count('error')} con error.")
+    return conservados
@@ -0,0 +1,37 @@
+"""
+Pruebas de `source.anonimizacion_utils.MotorAnonimizacion`.
+"""
+
+import pytest
+from source.anonimizacion_utils import MotorAnonimizacion
+
+
+@pytest.fixture
+def motor():
+    return MotorAnonimizacion()
+
+
+@pytest.mark.parametrize("telefono", [
+    "55 1234 5678",
+    "55-1234-5678",
+    "(55) 1234 5678",
+    "+52 55 1234 5678",
+    "+525512345678",
+])
+def test_reemplaza_telefonos_con_separador_o_prefijo(motor, telefono):
+    assert motor.anonimizar(f"Comunicarse al {telefono} por la tarde.") == "Comunicarse al [telefono] por la tarde."
+
+
+@pytest.mark.parametrize("texto", ["Tel. 5512345678", "celular: 5512345678", "Teléfono 5512345678"])
+def test_reemplaza_diez_digitos_junto_a_tel_o_cel(motor, texto):
+    assert motor.anonimizar(texto) == "[telefono]"
+
+
+def test_no_reemplaza_montos_ni_folios_de_diez_digitos(motor):
+    texto = "Se solicita la devolución del monto 1234567890 del folio 9876543210."
+    assert motor.anonimizar(texto) == texto
+
+
+def test_reemplaza_cuentas_y_correos(motor):
+    texto = "Cuenta 012180001234567891, correo juan.perez@ejemplo.com"
+    assert motor.anonimizar(texto) == "Cuenta [cuenta], correo [correo]"
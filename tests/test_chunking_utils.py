@@ -0,0 +1,47 @@
+"""
+Pruebas de `source.chunking_utils.fragmentar_texto`.
+"""
+
+from source.chunking_utils import fragmentar_texto
+
+LARGO = " ".join(f"La entidad deberá presentar el informe número {i} al Banco de México." for i in range(30))
+
+
+def test_articulo_corto_conserva_sus_metadatos_al_abrir_transitorios():
+    texto = ("Artículo 2.- Derogado.\nArtículo 3.- Derogado.\n"
+             "\fTRANSITORIOS\nPRIMERO.- La presente circular entra en vigor al día siguiente.")
+
+    (fragmento,) = fragmentar_texto(texto)
+
+    assert fragmento["texto"].startswith("Artículo 2.- Derogado.")
+    assert fragmento["metadata"] == {"articulo": "2", "pagina": 1}
+
+
+def test_encabezados_se_unen_al_contenido_de_la_seccion():
+    texto = "CIRCULAR 34/2010\n\fCAPÍTULO I\nDisposiciones generales\nArtículo 1.- " + LARGO
+
+    fragmentos = fragmentar_texto(texto, max_tokens=160, min_tokens=40)
+
+    assert fragmentos[0]["texto"].startswith("CIRCULAR 34/2010 CAPÍTULO I Disposiciones generales Artículo 1.-")
+    assert fragmentos[0]["metadata"] == {"capitulo": "I", "articulo": "1", "pagina": 2}
+    assert all(40 <= f["tokens"] <= 160 for f in fragmentos)
+
+
+def test_ningun_fragmento_queda_debajo_de_min_tokens():
+    texto = "Artículo 2.- Derogado.\nArtículo 3.- " + LARGO + "\nArtículo 4.- " + LARGO
+
+    fragmentos = fragmentar_texto(texto, max_tokens=160, min_tokens=40)
+
+    assert all(40 <= f["tokens"] <= 160 for f in fragmentos)
+    assert fragmentos[0]["metadata"]["articulo"] == "2"
+    assert any(f["texto"].startswith("Artículo 4.-") for f in fragmentos)
+
+
+def test_fragmentos_de_un_mismo_articulo_se_solapan():
+    fragmentos = fragmentar_texto("Artículo 5.- " + LARGO, max_tokens=100, min_tokens=20, solapamiento=10)
+
+    assert len(fragmentos) > 1
+    assert all(f["metadata"]["articulo"] == "5" and f["tokens"] <= 100 for f in fragmentos)
+    for anterior, siguiente in zip(fragmentos, fragmentos[1:]):
+        # El siguiente fragmento empieza con las últimas palabras del anterior
+        assert " ".join(siguiente["texto"].split()[:3]) in " ".join(anterior["texto"].split()[-10:])
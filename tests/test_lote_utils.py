@@ -0,0 +1,35 @@
+"""
+Pruebas de la reanudación de `source.lote_utils.procesar_lote`.
+"""
+
+import json
+import source.lote_utils as lote_utils
+from source.lote_utils import procesar_lote
+
+
+def test_reanuda_despues_de_una_linea_incompleta(tmp_path, monkeypatch):
+    entrada = tmp_path / "solicitudes.jsonl"
+    entrada.write_text("".join(json.dumps({"id": i, "mensaje": f"Pregunta {i}"}) + "\n" for i in "abc"),
+                       encoding="utf-8")
+    salida = tmp_path / "resultados.jsonl"
+    # "a" terminó; la interrupción dejó "b" a medio escribir
+    salida.write_text(json.dumps({"id": "a", "respuesta": "A"}) + "\n" + '{"id": "b", "respu',
+                      encoding="utf-8")
+    procesados = []
+
+    def procesar(elemento, medidor, responder=True):
+        procesados.append(elemento["id"])
+        return {"id": elemento["id"], "respuesta": elemento["json_correo"]["mensaje"]}
+
+    monkeypatch.setattr(lote_utils, "procesar_elemento", procesar)
+    resumen = procesar_lote(str(entrada), str(salida), max_concurrencia=1)
+
+    assert sorted(procesados) == ["b", "c"]
+    assert resumen["procesados"] == 2
+    lineas = [json.loads(linea) for linea in salida.read_text(encoding="utf-8").splitlines()]
+    assert sorted(r["id"] for r in lineas) == ["a", "b", "c"]
+
+    # Una segunda corrida ya no reprocesa nada
+    procesados.clear()
+    procesar_lote(str(entrada), str(salida), max_concurrencia=1)
+    assert procesados == []
@@ -0,0 +1,107 @@
+"""
+Pruebas de `source.textract_utils` con un cliente de Textract simulado.
+"""
+
+import time
+import pytest
+
+pymupdf = pytest.importorskip("pymupdf")
+
+from source.textract_utils import dividir_pdf, detectar_texto_documento, resultados_trabajo, resultado_ocr
+
+
+def pdf_de_paginas(textos):
+    """PDF con una página por texto."""
+    with pymupdf.open() as doc:
+        for texto in textos:
+            doc.new_page().insert_text((72, 72), texto)
+        return doc.tobytes()
+
+
+def bloques_pagina(lineas, confianza=99.0):
+    """Bloques PAGE y LINE/WORD de una página, con IDs que se repiten entre páginas."""
+    ids = [f"linea-{i}" for i in range(len(lineas))]
+    bloques = [{"BlockType": "PAGE", "Id": "pagina", "Relationships": [{"Type": "CHILD", "Ids": ids}]}]
+    for id_linea, texto in zip(ids, lineas):
+        bloques.append({"BlockType": "LINE", "Id": id_linea, "Text": texto})
+        bloques.append({"BlockType": "WORD", "Id": f"{id_linea}-palabra", "Text": texto.split()[-1],
+                        "Confidence": confianza})
+    return bloques
+
+
+class TextractSimulado:
+    """
+    Cliente de Textract simulado: `detect_document_text` devuelve las líneas del texto de la
+    página recibida y tarda menos en las últimas páginas, para que terminen en desorden.
+    """
+
+    def __init__(self, trabajos=None):
+        self.llamadas = []
+        self.trabajos = trabajos or {}
+
+    def detect_document_text(self, Document):
+        with pymupdf.open(stream=Document["Bytes"], filetype="pdf") as doc:
+            assert doc.page_count == 1
+            texto = doc[0].get_text().strip()
+        self.llamadas.append(texto)
+        numero = int(texto.split()[-1])
+        time.sleep(0.05 / numero)
+        return {
+            "Blocks": bloques_pagina([texto, f"fin de la página {numero}"], confianza=50.0 if numero == 2 else 99.0),
+            "ResponseMetadata": {"RetryAttempts": 0},
+        }
+
+    def get_document_text_detection(self, JobId, NextToken=None):
+        self.llamadas.append(NextToken)
+        return self.trabajos[JobId].pop(0)
+
+
+def test_dividir_pdf_conserva_el_orden_de_las_paginas():
+    paginas = dividir_pdf(pdf_de_paginas(["pagina 1", "pagina 2", "pagina 3"]))
+    assert len(paginas) == 3
+    for numero, pagina in enumerate(paginas, start=1):
+        with pymupdf.open(stream=pagina, filetype="pdf") as doc:
+            assert doc.page_count == 1
+            assert doc[0].get_text().strip() == f"pagina {numero}"
+
+
+def test_dividir_pdf_deja_igual_imagenes_y_pdfs_de_una_pagina():
+    imagen = b"\x89PNG\r\n\x1a\n..."
+    assert dividir_pdf(imagen) == [imagen]
+    una_pagina = pdf_de_paginas(["pagina 1"])
+    assert dividir_pdf(una_pagina) == [una_pagina]
+
+
+def test_detectar_texto_documento_reensambla_las_paginas_en_orden():
+    cliente = TextractSimulado()
+    resultado = detectar_texto_documento(
+        pdf_de_paginas(["pagina 1", "pagina 2", "pagina 3"]), umbral_confianza=90, cliente=cliente, max_hilos=3
+    )
+    # Los IDs se repiten en cada página; con claves (Page, Id) cada línea queda en su página
+    assert resultado["texto"].splitlines() == [
+        "pagina 1", "fin de la página 1",
+        "pagina 2", "fin de la página 2",
+        "pagina 3", "fin de la página 3",
+    ]
+    assert resultado["paginas"] == 3
+    assert resultado["baja_confianza"] == ["2"]
+    assert sorted(cliente.llamadas) == ["pagina 1", "pagina 2", "pagina 3"]
+
+
+def test_resultados_trabajo_recorre_todas_las_paginas_con_next_token():
+    pagina_1, pagina_2 = bloques_pagina(["uno"]), bloques_pagina(["dos"])
+    for bloque in pagina_1:
+        bloque["Page"] = 1
+    for bloque in pagina_2:
+        bloque["Page"] = 2
+    cliente = TextractSimulado(trabajos={"trabajo": [
+        {"JobStatus": "IN_PROGRESS"},
+        {"JobStatus": "SUCCEEDED", "Blocks": pagina_2[:2], "NextToken": "t1"},
+        {"JobStatus": "SUCCEEDED", "Blocks": pagina_1, "NextToken": "t2"},
+        {"JobStatus": "SUCCEEDED", "Blocks": pagina_2[2:]},
+    ]})
+    bloques = resultados_trabajo("trabajo", cliente=cliente, intervalo_sondeo=0, tiempo_max=5)
+    assert cliente.llamadas == [None, None, "t1", "t2"]
+    assert len(bloques) == len(pagina_1) + len(pagina_2)
+
+    assert resultado_ocr(bloques, umbral_confianza=90)["texto"] == "uno\ndos"
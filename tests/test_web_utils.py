@@ -0,0 +1,180 @@
+"""
+Pruebas de `source.web_utils.descargar_normatividad_compilada` contra un servidor HTTP local.
+"""
+
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import source.web_utils as web_utils
+from source.web_utils import descargar_normatividad_compilada
+
+
+def pdf_con_texto(texto):
+    """PDF mínimo de una página con `texto` en Helvetica."""
+    flujo = f"BT /F1 12 Tf 72 720 Td ({texto}) Tj ET".encode("latin-1")
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(flujo) + flujo + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = b"%PDF-1.4\n"
+    posiciones = []
+    for numero, objeto in enumerate(objetos, start=1):
+        posiciones.append(len(pdf))
+        pdf += b"%d 0 obj\n" % numero + objeto + b"\nendobj\n"
+    inicio_xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % posicion for posicion in posiciones)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref)
+    return pdf
+
+
+class ManejadorBanxico(BaseHTTPRequestHandler):
+    """Sirve el índice, las páginas de sujetos y los PDFs de `self.server.documentos`."""
+
+    def do_GET(self):
+        servidor = self.server
+        with servidor.lock:
+            servidor.solicitudes.append((self.path, dict(self.headers)))
+            falla = servidor.fallas.get(self.path, 0)
+            if falla:
+                servidor.fallas[self.path] = falla - 1
+        if falla:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path not in servidor.documentos:
+            self.send_error(404)
+            return
+        cuerpo, etag = servidor.documentos[self.path]
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def html_con_enlaces(enlaces):
+    return "<html><body>" + "".join(f'<a href="{e}">{e}</a>' for e in enlaces) + "</body></html>"
+
+
+@pytest.fixture
+def servidor():
+    """Servidor local con un índice, dos páginas de sujetos que comparten PDFs y tres PDFs."""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ManejadorBanxico)
+    httpd.lock = threading.Lock()
+    httpd.solicitudes = []
+    httpd.fallas = {}
+    httpd.documentos = {
+        "/indice.html": (html_con_enlaces(["/sujeto1.html", "/sujeto2.html"]).encode(), None),
+        "/sujeto1.html": (html_con_enlaces(["/pdf/compilado.pdf", "/pdf/reforma.pdf"]).encode(), None),
+        "/sujeto2.html": (html_con_enlaces(["/pdf/compilado.pdf", "pdf/inestable.pdf"]).encode(), None),
+        "/pdf/compilado.pdf": (pdf_con_texto("Circular 3/2012 Texto compilado"), '"v1"'),
+        "/pdf/reforma.pdf": (pdf_con_texto("Reforma a la Circular 3/2012"), '"r1"'),
+        "/pdf/inestable.pdf": (pdf_con_texto("Circular 14/2017 texto compilado"), '"i1"'),
+    }
+    hilo = threading.Thread(target=httpd.serve_forever, daemon=True)
+    hilo.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def solicitudes_a(servidor, ruta):
+    return [headers for path, headers in servidor.solicitudes if path == ruta]
+
+
+def test_descarga_una_vez_cada_pdf_y_conserva_solo_los_compilados(servidor, tmp_path, monkeypatch):
+    reemplazos = []
+    reemplazar = os.replace
+
+    def registrar_reemplazo(origen, destino):
+        reemplazos.append((origen, destino, os.path.exists(origen)))
+        reemplazar(origen, destino)
+
+    monkeypatch.setattr(web_utils.os, "replace", registrar_reemplazo)
+    destino = tmp_path / "normatividad"
+    conservados = descargar_normatividad_compilada(str(destino), url_indice=servidor.url + "/indice.html",
+                                                   max_workers=4, timeout=5)
+
+    assert sorted(os.path.basename(c) for c in conservados) == ["compilado.pdf", "inestable.pdf"]
+    # compilado.pdf aparece en las dos páginas de sujetos pero se descarga una vez
+    assert len(solicitudes_a(servidor, "/pdf/compilado.pdf")) == 1
+    assert len(solicitudes_a(servidor, "/pdf/reforma.pdf")) == 1
+    assert not (destino / "reforma.pdf").exists()
+
+    # Los PDFs se escriben en un .part que se renombra al terminar
+    pdfs = [(o, d) for o, d, existia in reemplazos if d.endswith(".pdf") and existia]
+    assert sorted(os.path.basename(d) for _, d in pdfs) == ["compilado.pdf", "inestable.pdf"]
+    assert all(o == d + ".part" for o, d in pdfs)
+    assert not list(destino.glob("*.part"))
+    # El manifiesto se escribe una sola vez, al final de la corrida
+    assert [d for _, d, _ in reemplazos if d.endswith("manifiesto_descargas.json")] == \
+        [str(destino / "manifiesto_descargas.json")]
+    assert (destino / "compilado.pdf").read_bytes() == servidor.documentos["/pdf/compilado.pdf"][0]
+
+    manifiesto = json.loads((destino / "manifiesto_descargas.json").read_text(encoding="utf-8"))
+    assert manifiesto[servidor.url + "/pdf/compilado.pdf"]["etag"] == '"v1"'
+    assert manifiesto[servidor.url + "/pdf/reforma.pdf"]["conservado"] is False
+
+
+def test_segunda_corrida_usa_solicitudes_condicionales(servidor, tmp_path):
+    destino = str(tmp_path / "normatividad")
+    url_indice = servidor.url + "/indice.html"
+    descargar_normatividad_compilada(destino, url_indice=url_indice, max_workers=4, timeout=5)
+    ruta_pdf = os.path.join(destino, "compilado.pdf")
+    modificado = os.path.getmtime(ruta_pdf)
+    servidor.solicitudes.clear()
+
+    conservados = descargar_normatividad_compilada(destino, url_indice=url_indice, max_workers=4, timeout=5)
+
+    assert sorted(os.path.basename(c) for c in conservados) == ["compilado.pdf", "inestable.pdf"]
+    for ruta, etag in (("/pdf/compilado.pdf", '"v1"'), ("/pdf/reforma.pdf", '"r1"')):
+        (headers,) = solicitudes_a(servidor, ruta)
+        assert headers.get("If-None-Match") == etag
+    # Con 304 el archivo conservado no se vuelve a escribir
+    assert os.path.getmtime(ruta_pdf) == modificado
+
+
+def test_borra_el_pdf_que_deja_de_ser_compilado(servidor, tmp_path):
+    destino = tmp_path / "normatividad"
+    url_indice = servidor.url + "/indice.html"
+    descargar_normatividad_compilada(str(destino), url_indice=url_indice, max_workers=4, timeout=5)
+    assert (destino / "compilado.pdf").exists()
+    servidor.documentos["/pdf/compilado.pdf"] = (pdf_con_texto("Circular 3/2012 abrogada"), '"v2"')
+
+    conservados = descargar_normatividad_compilada(str(destino), url_indice=url_indice, max_workers=4, timeout=5)
+
+    assert [os.path.basename(c) for c in conservados] == ["inestable.pdf"]
+    assert not (destino / "compilado.pdf").exists()
+    manifiesto = json.loads((destino / "manifiesto_descargas.json").read_text(encoding="utf-8"))
+    entrada = manifiesto[servidor.url + "/pdf/compilado.pdf"]
+    assert entrada["etag"] == '"v2"'
+    assert entrada["conservado"] is False
+
+
+def test_reintenta_errores_transitorios(servidor, tmp_path):
+    servidor.fallas["/pdf/inestable.pdf"] = 2
+    destino = tmp_path / "normatividad"
+    conservados = descargar_normatividad_compilada(str(destino), url_indice=servidor.url + "/indice.html",
+                                                   max_workers=4, timeout=5)
+
+    assert len(solicitudes_a(servidor, "/pdf/inestable.pdf")) == 3
+    assert "inestable.pdf" in [os.path.basename(c) for c in conservados]
+    assert (destino / "inestable.pdf").exists()